@@ -119,6 +119,11 @@ const AuthProvider = ({ children }) => {
 
   // 登出函数
   const logout = () => {
+    // 通知服务器使当前令牌失效，失败不影响本地退出
+    const token = localStorage.getItem('token');
+    if (token) {
+      authService.logout(token).catch(() => {});
+    }
     localStorage.removeItem('token');
     localStorage.removeItem('userId');
     localStorage.removeItem('username');
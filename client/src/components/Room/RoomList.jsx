@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { 
     Box, 
@@ -21,6 +21,7 @@ import {
 } from '@mui/material';
 import { Person, Casino, AccessTime, Refresh } from '@mui/icons-material';
 import { roomService } from '../../services/api';
+import { WS_BASE_URL } from '../../config';
 
 // 添加安全渲染函数
 const safeRender = (content) => {
@@ -92,15 +93,76 @@ const RoomList = () => {
     const [sortOption, setSortOption] = useState('creation_time'); // Default sort: creation_time (newest first)
     const [refreshing, setRefreshing] = useState(false);
 
+    const lobbySocketRef = useRef(null);
+
     // 获取房间列表
     useEffect(() => {
         fetchRooms();
+        connectLobby();
 
-        // 每10秒刷新一次房间列表
-        const interval = setInterval(fetchRooms, 10000);
-        return () => clearInterval(interval);
+        // 大厅连接断开时才退回到每10秒刷新一次房间列表
+        const interval = setInterval(() => {
+            const socket = lobbySocketRef.current;
+            if (!socket || socket.readyState !== WebSocket.OPEN) {
+                fetchRooms();
+            }
+        }, 10000);
+        return () => {
+            clearInterval(interval);
+            if (lobbySocketRef.current) {
+                lobbySocketRef.current.onclose = null;
+                lobbySocketRef.current.close();
+                lobbySocketRef.current = null;
+            }
+        };
     }, []);
 
+    // 订阅大厅推送：先收到完整列表，之后只接收房间增量事件
+    const connectLobby = () => {
+        const token = localStorage.getItem('token');
+        if (!token) {
+            return;
+        }
+
+        const socket = new WebSocket(`${WS_BASE_URL}/ws/lobby?token=${encodeURIComponent(token)}`);
+        lobbySocketRef.current = socket;
+
+        socket.onmessage = (event) => {
+            let message;
+            try {
+                message = JSON.parse(event.data);
+            } catch (e) {
+                console.error('Failed to parse lobby message:', e);
+                return;
+            }
+
+            if (message.type === 'lobby_snapshot') {
+                setRooms(sortRooms(message.data?.rooms || [], 'creation_time'));
+                setLoading(false);
+                setError(null);
+            } else if (message.type === 'lobby_update') {
+                const events = message.data?.events || [];
+                setRooms((currentRooms) => {
+                    const roomsById = new Map(currentRooms.map((room) => [room.id, room]));
+                    events.forEach((lobbyEvent) => {
+                        if (lobbyEvent.type === 'room_removed') {
+                            roomsById.delete(lobbyEvent.room_id);
+                        } else if (lobbyEvent.room) {
+                            roomsById.set(lobbyEvent.room_id, lobbyEvent.room);
+                        }
+                    });
+                    return sortRooms(Array.from(roomsById.values()), 'creation_time');
+                });
+            }
+        };
+
+        socket.onclose = () => {
+            if (lobbySocketRef.current === socket) {
+                lobbySocketRef.current = null;
+            }
+        };
+    };
+
     const fetchRooms = async (isManualRefresh = false) => {
         try {
             if (isManualRefresh) {
@@ -99,7 +99,10 @@ api.interceptors.response.use(
 export const authService = {
     login: (username, password, config = {}) => api.post('/api/auth/login', { username, password }, config),
     register: (username, password, avatar = 'gg_plankton.webp') => api.post('/api/auth/register', { username, password, avatar }),
-    logout: () => api.post('/api/auth/logout'),
+    // 显式带上令牌：调用方随后会清除本地存储，拦截器执行时可能已经读不到
+    logout: (token = localStorage.getItem('token')) => api.post('/api/auth/logout', null, {
+        headers: { Authorization: `Bearer ${token}` }
+    }),
     getProfile: () => {
         const username = localStorage.getItem('username');
         if (!username) {
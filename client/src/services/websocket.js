@@ -5,6 +5,11 @@ class WebSocketService {
     constructor() {
         this.socket = null;
         this.isConnected = false;
+        this.spectating = false;  // 是否以观众身份连接
+        // 房间广播的位置，重连时服务器据此只补发错过的消息
+        this.streamRoomId = null;
+        this.streamId = null;
+        this.lastSeq = null;
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectTimeout = 3000; // 3 seconds between reconnect attempts
@@ -165,7 +170,10 @@ class WebSocketService {
         delete this.updateQueue[roomId];
     }
 
-    connect(roomId) {
+    // spectate 为 true 时以观众身份连接，只接收公开的房间广播
+    connect(roomId, { spectate = false } = {}) {
+        this.spectating = spectate;
+        
         // 检查是否在连接过程中
         if (this.connectionAttempts[roomId]) {
             console.log(`已经在尝试连接到房间 ${roomId}，忽略重复请求`);
@@ -218,7 +226,10 @@ class WebSocketService {
         // 确保token正确编码且不为undefined
         const encodedToken = token ? encodeURIComponent(token) : '';
         const targetRoomId = roomId;
-        const wsUrl = `${wsBaseUrl}/ws/game/${targetRoomId}?token=${encodedToken}`;
+        const spectateParam = this.spectating ? '&spectate=true' : '';
+        const resumeParam = (!this.spectating && this.streamRoomId === targetRoomId && this.streamId)
+            ? `&stream_id=${this.streamId}&last_seq=${this.lastSeq}` : '';
+        const wsUrl = `${wsBaseUrl}/ws/game/${targetRoomId}?token=${encodedToken}${spectateParam}${resumeParam}`;
         
         // 更新当前房间ID
         this.currentRoomId = targetRoomId;
@@ -312,6 +323,21 @@ class WebSocketService {
 
             this.socket.onmessage = (event) => {
                 const data = JSON.parse(event.data);
+                
+                // 记录广播序号；完整状态和补发完成消息会带上新的起点
+                if (data.stream_id !== undefined) {
+                    this.streamRoomId = targetRoomId;
+                    this.streamId = data.stream_id;
+                    this.lastSeq = data.seq;
+                } else if (data.type === 'resumed') {
+                    this.lastSeq = data.data.seq;
+                } else if (data.seq !== undefined) {
+                    if (this.lastSeq !== null && data.seq <= this.lastSeq) {
+                        // 已经处理过的消息
+                        return;
+                    }
+                    this.lastSeq = data.seq;
+                }
                 console.group('WebSocket Message Received');
                 console.log('Message Type:', data.type);
                 console.log('Room ID:', data.room_id);
@@ -355,6 +381,17 @@ class WebSocketService {
                             this._notifyListeners('playerLeft', data.data);
                             break;
                             
+                        case 'players_disconnected':
+                            // 服务器清理无响应连接后批量通知
+                            console.log('Players disconnected:', data.data.player_ids);
+                            data.data.player_ids.forEach(playerId => {
+                                this._notifyListeners('playerLeft', {
+                                    player_id: playerId,
+                                    timestamp: data.data.timestamp
+                                });
+                            });
+                            break;
+                            
                         case 'room_update':
                             console.log('Received room_update:', data.data);
                             // Check if we have any listeners for roomUpdate
@@ -368,6 +405,13 @@ class WebSocketService {
                             this._notifyListeners('chat', data.data);
                             break;
                             
+                        case 'chat_batch':
+                            // 服务器把一段时间内的聊天消息合并为一条发送
+                            data.data.messages.forEach(message => {
+                                this._notifyListeners('chat', message);
+                            });
+                            break;
+                            
                         case 'error':
                             this._notifyListeners('error', data.data);
                             toast.error(data.data.message || 'Server error');
@@ -382,6 +426,11 @@ class WebSocketService {
                             this._notifyListeners('game_history', data.data);
                             break;
                             
+                        case 'resumed':
+                            // 重连后服务器已补发错过的消息，不需要完整状态
+                            console.log('Session resumed at seq', data.data.seq);
+                            break;
+                            
                         default:
                             console.log(`Unhandled message type: ${data.type}`);
                     }
@@ -499,7 +548,7 @@ class WebSocketService {
         this.reconnectTimer = setTimeout(() => {
             if (!this.isConnected && !this.intentionalDisconnect) {
                 console.log(`重新连接到房间 ${roomId}...`);
-                this.connect(roomId);
+                this.connect(roomId, { spectate: this.spectating });
             }
         }, this.reconnectTimeout * Math.min(this.reconnectAttempts, 3));
     }
@@ -754,11 +803,13 @@ class WebSocketService {
         });
     }
 
-    // 获取游戏历史记录
-    getGameHistory(roomId) {
+    // 获取游戏历史记录（before 为上一页返回的 next_before，不传时从最近一手牌开始）
+    getGameHistory(roomId, limit = 20, before = null) {
         return this.sendAction('room_action', { 
             action: 'get_game_history', 
-            room_id: roomId 
+            room_id: roomId,
+            limit,
+            before
         });
     }
     
@@ -2,50 +2,46 @@ import sqlite3
 import os
 from pathlib import Path
 
+from src.database.migrations import MIGRATIONS, run_migrations, get_schema_version
+
 def upgrade_database():
-    """升级数据库结构，添加新字段"""
+    """升级数据库结构到最新版本（执行 src/database/migrations.py 中尚未执行的迁移）"""
     # 使用环境变量或默认为当前目录中的poker.db
     db_path_env = os.getenv("DB_PATH", "poker.db")
     db_path = Path(db_path_env)
-    
+
     # 检查数据库是否存在
     if not db_path.exists():
         print(f"数据库文件 {db_path} 不存在，请先运行主程序创建数据库。")
         return False
-    
+
+    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # 获取users表的字段信息
-        c.execute("PRAGMA table_info(users)")
-        columns = c.fetchall()
-        column_names = [column[1] for column in columns]
-        
-        # 检查并添加email字段
-        if "email" not in column_names:
-            print("添加 email 字段到 users 表...")
-            c.execute("ALTER TABLE users ADD COLUMN email TEXT")
-        else:
-            print("email 字段已存在。")
-            
-        # 检查并添加avatar字段
-        if "avatar" not in column_names:
-            print("添加 avatar 字段到 users 表...")
-            c.execute("ALTER TABLE users ADD COLUMN avatar TEXT")
-        else:
-            print("avatar 字段已存在。")
-            
-        # 提交更改
-        conn.commit()
+        conn = sqlite3.connect(db_path, timeout=15.0)
+
+        current_version = get_schema_version(conn)
+        latest_version = MIGRATIONS[-1][0]
+        print(f"当前数据库版本: {current_version}，最新版本: {latest_version}")
+
+        if current_version >= latest_version:
+            print("数据库已是最新版本。")
+            return True
+
+        for version, description, _ in MIGRATIONS:
+            if version > current_version:
+                print(f"待执行迁移 {version}: {description}")
+
+        applied = run_migrations(conn)
+        print(f"已执行迁移: {applied}，当前版本: {get_schema_version(conn)}")
         print("数据库升级完成。")
-        
+
         return True
     except Exception as e:
         print(f"升级数据库时出错: {str(e)}")
         return False
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 if __name__ == "__main__":
     print("开始升级数据库...")
@@ -53,4 +49,4 @@ if __name__ == "__main__":
     if success:
         print("数据库结构已成功更新。")
     else:
-        print("数据库升级失败。") 
\ No newline at end of file
+        print("数据库升级失败。")
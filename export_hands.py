@@ -0,0 +1,81 @@
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+from src.utils.hand_codec import HandReader, HandWriter, export_text, load_hand
+
+def iter_payloads(db_path, room_id=None, batch_size=1000):
+    """按结束时间顺序逐批读取 hands 表中的原始记录（bytes 或旧版本的 JSON 文本）"""
+    # 只读打开，导出时不影响正在运行的服务器
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if room_id:
+            cursor = conn.execute(
+                'SELECT payload FROM hands WHERE room_id = ? ORDER BY ended_at', (room_id,))
+        else:
+            cursor = conn.execute('SELECT payload FROM hands ORDER BY ended_at')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+    finally:
+        conn.close()
+
+def iter_hands(source, room_id=None):
+    """从数据库或 .hh 文件逐条读取牌局记录"""
+    if source.endswith(".hh"):
+        with open(source, "rb") as f:
+            yield from HandReader(f)
+    else:
+        for payload in iter_payloads(source, room_id):
+            yield load_hand(payload)
+
+def export_binary(db_path, out_path, room_id=None):
+    """把数据库中的牌局导出为二进制 .hh 文件，已经是二进制的记录直接写出不重新编码"""
+    with open(out_path, "wb") as f:
+        writer = HandWriter(f)
+        for payload in iter_payloads(db_path, room_id):
+            if isinstance(payload, bytes):
+                writer.write_encoded(payload)
+            else:
+                writer.write(load_hand(payload))
+    return writer.count
+
+def main():
+    parser = argparse.ArgumentParser(description="导出牌局历史")
+    parser.add_argument("source", nargs="?", default=os.getenv("DB_PATH", "poker.db"),
+                        help="数据库文件或 .hh 牌局历史文件（默认: DB_PATH 或 poker.db）")
+    parser.add_argument("-o", "--output", help="输出文件，默认输出到标准输出（仅文本格式）")
+    parser.add_argument("-f", "--format", choices=["text", "binary"], default="text", help="导出格式")
+    parser.add_argument("-r", "--room", help="只导出指定房间的牌局")
+    args = parser.parse_args()
+
+    if not Path(args.source).exists():
+        print(f"文件 {args.source} 不存在。")
+        return 1
+
+    if args.format == "binary":
+        if not args.output or args.source.endswith(".hh"):
+            print("二进制导出需要数据库文件作为输入，并指定 --output。")
+            return 1
+        count = export_binary(args.source, args.output, args.room)
+        print(f"已导出 {count} 手牌到 {args.output}")
+        return 0
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        # 逐行写出，内存占用与牌局总数无关
+        for line in export_text(iter_hands(args.source, args.room), table_name=args.room):
+            out.write(line)
+            out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Header
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from src.database.db_manager import DBManager
+from src.database.async_db import async_db
+from src.database.db_manager import encode_record_cursor
+from src.utils.response_cache import ResponseCache
+from src.utils.hand_codec import export_text
+from src.utils.token_cache import TokenCache
+from src.utils.logging_config import get_logger
 from typing import Optional, List, Dict, Any
 import jwt
+import os
 import time
 from datetime import datetime, timedelta
 
@@ -11,6 +18,11 @@ SECRET_KEY = "c32poker_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 365 * 10  # 10年
 
+logger = get_logger("poker.auth")
+
+# 已验证令牌的缓存，REST 接口和 WebSocket 共用（见 src/main.py verify_token）
+token_cache = TokenCache(SECRET_KEY, ALGORITHM)
+
 # 创建认证相关的路由器
 auth_router = APIRouter(
     prefix="/auth",
@@ -41,7 +53,21 @@ records_router = APIRouter(
     tags=["游戏记录"]
 )
 
-db = DBManager()
+db = async_db
+
+# 排行榜和平台统计只在写入游戏记录后变化，缓存结果，写入提交后失效
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "30"))
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+leaderboard_cache = ResponseCache("leaderboard", ttl=LEADERBOARD_CACHE_TTL)
+stats_cache = ResponseCache("platform_stats", ttl=STATS_CACHE_TTL)
+
+def _on_records_flushed(kinds):
+    """批量写入提交后的回调（在数据库写入线程中执行）"""
+    if "game_record" in kinds:
+        leaderboard_cache.invalidate()
+        stats_cache.invalidate()
+
+db.db.write_batcher.add_flush_listener(_on_records_flushed)
 
 class UserCredentials(BaseModel):
     username: str
@@ -78,51 +104,48 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # iat 用于按用户撤销令牌，使用精确时间，避免与撤销发生在同一秒的新令牌被误判
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
-    print(f"[DEBUG] 开始验证用户认证: {authorization[:20] if authorization else 'None'}...")
-    
+def _get_bearer_token(authorization: Optional[str]) -> str:
+    """从 Authorization 头中取出 Bearer 令牌"""
     if not authorization:
-        print("[ERROR] 未提供认证令牌")
         raise HTTPException(
             status_code=401,
             detail="未提供认证令牌",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        raise HTTPException(
+            status_code=401,
+            detail="无效的认证类型",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return parts[1]
+
+async def get_current_user(authorization: Optional[str] = Header(None)):
+    token = _get_bearer_token(authorization)
+    
     try:
-        token_type, token = authorization.split()
-        print(f"[DEBUG] Token类型: {token_type}")
-        
-        if token_type.lower() != "bearer":
-            print(f"[ERROR] 无效的认证类型: {token_type}")
-            raise HTTPException(
-                status_code=401,
-                detail="无效的认证类型",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        print(f"[DEBUG] 解码后的用户名: {username}")
-        
-        return username
-        
+        payload = token_cache.verify(token)
     except jwt.PyJWTError as e:
-        print(f"[ERROR] JWT解码错误: {str(e)}")
+        logger.debug("JWT验证失败: %s", str(e))
         raise HTTPException(
             status_code=401,
             detail="无效的认证令牌",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    return payload.get("sub")
 
 # 认证相关路由
 @auth_router.post("/login", summary="用户登录", response_model=Token)
 async def login(user: UserCredentials):
-    success, message = db.verify_user(user.username, user.password)
+    success, message = await db.verify_user(user.username, user.password)
     if not success:
         raise HTTPException(status_code=401, detail=message)
     
@@ -138,11 +161,19 @@ async def login(user: UserCredentials):
 
 @auth_router.post("/register", summary="用户注册")
 async def register(user: UserCredentials):
-    success, message = db.register_user(user.username, user.password, user.avatar)
+    success, message = await db.register_user(user.username, user.password, user.avatar)
     if not success:
         raise HTTPException(status_code=400, detail=message)
+    # 平台统计包含总用户数
+    stats_cache.invalidate()
     return {"message": message}
 
+@auth_router.post("/logout", summary="退出登录")
+async def logout(authorization: Optional[str] = Header(None), current_user: str = Depends(get_current_user)):
+    # 当前令牌立即失效
+    token_cache.revoke_token(_get_bearer_token(authorization))
+    return {"message": "已退出登录"}
+
 @auth_router.post("/refresh-token", summary="刷新认证令牌", response_model=Token)
 async def refresh_token(user_data: RefreshToken, current_user: str = Depends(get_current_user)):
     # 验证请求中的用户名与当前认证的用户名是否一致
@@ -168,7 +199,7 @@ async def get_user_info(username: str, current_user: str = Depends(get_current_u
         print('获取用户信息 raise', current_user, username)
         raise HTTPException(status_code=403, detail="没有权限查询其他用户信息")
         
-    user_info = db.get_user_info(username)
+    user_info = await db.get_user_info(username)
     if not user_info:
         print(f'[ERROR] 用户不存在: {username}')
         raise HTTPException(status_code=404, detail="用户不存在")
@@ -184,7 +215,7 @@ async def update_user_info(username: str, user_data: UserUpdate, current_user: s
         raise HTTPException(status_code=403, detail="无权更新其他用户信息")
     
     # 验证当前密码
-    success, _ = db.verify_user(username, user_data.current_password)
+    success, _ = await db.verify_user(username, user_data.current_password)
     if not success:
         raise HTTPException(status_code=401, detail="密码验证失败")
     
@@ -197,10 +228,19 @@ async def update_user_info(username: str, user_data: UserUpdate, current_user: s
     # 过滤掉为None的字段
     update_data = {k: v for k, v in update_data.items() if v is not None}
     
-    success, message = db.update_user(username, update_data)
+    success, message = await db.update_user(username, update_data)
     if not success:
         raise HTTPException(status_code=400, detail=message)
     
+    if user_data.new_password is not None:
+        # 修改密码后之前签发的令牌全部失效，返回新的令牌
+        token_cache.revoke_user(username)
+        return {
+            "message": "用户信息更新成功",
+            "access_token": create_access_token(data={"sub": username}),
+            "token_type": "bearer"
+        }
+    
     return {"message": "用户信息更新成功"}
 
 @user_router.post("/{username}/balance", summary="用户充值")
@@ -210,7 +250,7 @@ async def update_user_balance(username: str, balance_data: BalanceUpdate, curren
         raise HTTPException(status_code=403, detail="无权更新其他用户余额")
     
     # 验证密码
-    success, _ = db.verify_user(username, balance_data.password)
+    success, _ = await db.verify_user(username, balance_data.password)
     if not success:
         raise HTTPException(status_code=401, detail="密码验证失败")
     
@@ -219,7 +259,7 @@ async def update_user_balance(username: str, balance_data: BalanceUpdate, curren
         raise HTTPException(status_code=400, detail="充值金额必须大于0")
     
     # 获取用户当前余额
-    user_info = db.get_user_info(username)
+    user_info = await db.get_user_info(username)
     if not user_info:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -227,7 +267,7 @@ async def update_user_balance(username: str, balance_data: BalanceUpdate, curren
     current_balance = user_info.get("balance", 0)
     new_balance = current_balance + balance_data.amount
     
-    success, message = db.update_user(username, {"balance": new_balance})
+    success, message = await db.update_user(username, {"balance": new_balance})
     if not success:
         raise HTTPException(status_code=400, detail=message)
     
@@ -246,19 +286,27 @@ async def reset_password(reset_data: PasswordReset, current_user: str = Depends(
         raise HTTPException(status_code=403, detail="无权修改其他用户密码")
         
     # 验证当前密码
-    success, _ = db.verify_user(reset_data.username, reset_data.current_password)
+    success, _ = await db.verify_user(reset_data.username, reset_data.current_password)
     if not success:
         raise HTTPException(status_code=401, detail="密码验证失败")
     
     # 更新密码
-    success, message = db.update_user(
+    success, message = await db.update_user(
         reset_data.username, 
         {"password": reset_data.new_password}
     )
     if not success:
         raise HTTPException(status_code=400, detail=message)
     
-    return {"message": "密码重置成功"}
+    # 修改密码后之前签发的令牌全部失效，返回新的令牌
+    token_cache.revoke_user(reset_data.username)
+    access_token = create_access_token(data={"sub": reset_data.username})
+    
+    return {
+        "message": "密码重置成功",
+        "access_token": access_token,
+        "token_type": "bearer"
+    }
 
 @user_router.get("/{username}/statistics", summary="获取用户统计信息")
 async def get_user_statistics(username: str, current_user: str = Depends(get_current_user)):
@@ -267,11 +315,11 @@ async def get_user_statistics(username: str, current_user: str = Depends(get_cur
         raise HTTPException(status_code=403, detail="没有权限查询其他用户统计信息")
         
     # 检查用户是否存在
-    user_info = db.get_user_info(username)
+    user_info = await db.get_user_info(username)
     if not user_info:
         raise HTTPException(status_code=404, detail="用户不存在")
         
-    stats = db.get_user_statistics(username)
+    stats = await db.get_user_statistics(username)
     return {
         "username": username,
         "statistics": stats
@@ -282,6 +330,7 @@ async def get_user_game_records(
     username: str,
     limit: int = Query(10, description="每页记录数"),
     offset: int = Query(0, description="偏移量"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的next_cursor），提供时忽略offset"),
     current_user: str = Depends(get_current_user)
 ):
     # 权限检查: 只能查询自己的信息或系统管理员
@@ -289,46 +338,110 @@ async def get_user_game_records(
         raise HTTPException(status_code=403, detail="没有权限查询其他用户游戏记录")
         
     # 检查用户是否存在
-    user_info = db.get_user_info(username)
+    user_info = await db.get_user_info(username)
     if not user_info:
         raise HTTPException(status_code=404, detail="用户不存在")
         
-    records = db.get_user_game_records(username, limit, offset)
-    total = db.count_user_game_records(username)
+    try:
+        records = await db.get_user_game_records(username, limit, offset, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await db.count_user_game_records(username)
     
     return {
         "username": username,
         "records": records,
         "total": total,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": encode_record_cursor(records[-1]) if len(records) == limit else None
+    }
+
+@user_router.get("/{username}/hands", summary="获取用户参与的牌局")
+async def get_user_hands(
+    username: str,
+    start_time: Optional[float] = Query(None, description="开始时间（Unix时间戳，包含）"),
+    end_time: Optional[float] = Query(None, description="结束时间（Unix时间戳，不包含）"),
+    limit: int = Query(20, ge=1, le=100, description="最多返回的牌局数"),
+    current_user: str = Depends(get_current_user)
+):
+    # 权限检查: 只能查询自己的牌局或系统管理员
+    if current_user != username and current_user != "admin":
+        raise HTTPException(status_code=403, detail="没有权限查询其他用户的牌局")
+    
+    hands = await db.get_player_hands(username, start_time, end_time, limit)
+    return {
+        "username": username,
+        "hands": [
+            {
+                "hand_id": item["hand"].get("game_id"),
+                "room_id": item["room_id"],
+                "start_time": item["hand"].get("start_time"),
+                "end_time": item["hand"].get("end_time"),
+                "pot": item["hand"].get("pot"),
+                "community_cards": item["hand"].get("community_cards"),
+                "players": item["hand"].get("players"),
+                "winners": item["hand"].get("winners")
+            }
+            for item in hands
+        ],
+        "limit": limit
     }
 
 # 游戏记录相关路由
+@records_router.get("/hands/{hand_id}", summary="回放指定牌局")
+async def get_hand_replay(
+    hand_id: str,
+    format: str = Query("json", description="返回格式: json 或 text（文本手牌历史）"),
+    current_user: str = Depends(get_current_user)
+):
+    found = await db.get_hand(hand_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="牌局不存在")
+    
+    hand = found["hand"]
+    # 权限检查: 只有参与牌局的玩家或系统管理员可以查看
+    if current_user != "admin" and all(p.get("name") != current_user for p in hand.get("players", [])):
+        raise HTTPException(status_code=403, detail="没有权限查看此牌局")
+    
+    if format == "text":
+        return PlainTextResponse("\n".join(export_text([hand], table_name=found["room_id"])))
+    return {
+        "hand_id": hand_id,
+        "room_id": found["room_id"],
+        "hand": hand
+    }
+
 @records_router.get("/", summary="获取所有游戏历史记录")
 async def get_all_game_records(
     limit: int = Query(10, description="每页记录数"),
     offset: int = Query(0, description="偏移量"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的next_cursor），提供时忽略offset"),
     current_user: str = Depends(get_current_user)
 ):
     # 这里不做权限检查，因为游戏记录是公开的
-    records = db.get_game_records(limit, offset)
-    total = db.count_game_records()
+    try:
+        records = await db.get_game_records(limit, offset, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await db.count_game_records()
     return {
         "records": records,
         "total": total,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": encode_record_cursor(records[-1]) if len(records) == limit else None
     }
 
 # 排行榜相关路由
 @leaderboard_router.get("/win-rate", summary="获取胜率排行榜")
 async def get_win_rate_leaderboard(
-    limit: int = Query(10, description="排行榜长度"),
+    limit: int = Query(10, ge=1, le=100, description="排行榜长度"),
     current_user: str = Depends(get_current_user)
 ):
     # 这里不做权限检查，因为排行榜是公开的
-    leaderboard = db.get_win_rate_leaderboard(limit)
+    leaderboard = await leaderboard_cache.get_or_load(
+        ("win_rate", limit), lambda: db.get_win_rate_leaderboard(limit))
     return {
         "leaderboard": leaderboard,
         "limit": limit
@@ -336,11 +449,12 @@ async def get_win_rate_leaderboard(
 
 @leaderboard_router.get("/profit", summary="获取盈利排行榜")
 async def get_profit_leaderboard(
-    limit: int = Query(10, description="排行榜长度"),
+    limit: int = Query(10, ge=1, le=100, description="排行榜长度"),
     current_user: str = Depends(get_current_user)
 ):
     # 这里不做权限检查，因为排行榜是公开的
-    leaderboard = db.get_profit_leaderboard(limit)
+    leaderboard = await leaderboard_cache.get_or_load(
+        ("profit", limit), lambda: db.get_profit_leaderboard(limit))
     return {
         "leaderboard": leaderboard,
         "limit": limit
@@ -350,7 +464,7 @@ async def get_profit_leaderboard(
 @stats_router.get("/platform", summary="获取平台统计信息")
 async def get_platform_statistics(current_user: str = Depends(get_current_user)):
     # 这里不做权限检查，因为平台统计信息是公开的
-    stats = db.get_platform_statistics()
+    stats = await stats_cache.get_or_load("platform", db.get_platform_statistics)
     return stats
 
 # 导出所有路由器
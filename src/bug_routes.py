@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Header, Body
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from src.database.db_manager import DBManager
+from src.database.async_db import async_db
 from src.api_routes import get_current_user
 import base64
 import json
@@ -16,7 +16,7 @@ bug_router = APIRouter(
     tags=["Bug报告"]
 )
 
-db = DBManager()
+db = async_db
 
 # 创建保存图片的目录
 # 使用环境变量或默认为当前目录中的bug_report_images
@@ -89,7 +89,7 @@ async def submit_bug_report(
                 })
     
     # 提交Bug报告
-    success, result = db.submit_bug_report(
+    success, result = await db.submit_bug_report(
         user_id=current_user,
         description=report.description,
         contact=report.contact,
@@ -113,7 +113,7 @@ async def get_bug_reports(
     if current_user != "admin":
         raise HTTPException(status_code=403, detail="无权查看所有Bug报告")
     
-    reports = db.get_bug_reports(limit=limit, offset=offset, status=status)
+    reports = await db.get_bug_reports(limit=limit, offset=offset, status=status)
     return {"reports": reports, "total": len(reports)}
 
 @bug_router.get("/{report_id}", summary="获取Bug报告详情")
@@ -121,7 +121,7 @@ async def get_bug_report(
     report_id: int,
     current_user: str = Depends(get_current_user)
 ):
-    report = db.get_bug_report_by_id(report_id)
+    report = await db.get_bug_report_by_id(report_id)
     
     if not report:
         raise HTTPException(status_code=404, detail="Bug报告不存在")
@@ -150,7 +150,7 @@ async def update_bug_report_status(
             detail=f"无效的状态值，有效值为: {', '.join(valid_statuses)}"
         )
     
-    success, message = db.update_bug_report_status(report_id, status_update.status)
+    success, message = await db.update_bug_report_status(report_id, status_update.status)
     
     if not success:
         raise HTTPException(status_code=400, detail=message)
@@ -169,7 +169,7 @@ async def get_user_bug_reports(
         raise HTTPException(status_code=403, detail="无权查看其他用户的Bug报告")
     
     # 获取用户的Bug报告
-    reports = db.get_bug_reports(limit=limit, offset=offset)
+    reports = await db.get_bug_reports(limit=limit, offset=offset)
     user_reports = [r for r in reports if r["user_id"] == username]
     
     return {"reports": user_reports, "total": len(user_reports)} 
\ No newline at end of file
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src.database.db_manager import DBManager
+from src.utils.logging_config import get_logger
+from src.utils.passwords import password_service
+
+logger = get_logger("database.async")
+
+# 数据库工作线程数，与连接池大小保持一致，避免线程在连接池上排队
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "5"))
+
+
+class AsyncDBManager:
+    """DBManager 的异步封装
+
+    所有 DBManager 方法都在专用的有界线程池中执行，路由处理函数
+    通过 await 调用，连接池等待和重试中的 time.sleep 不会阻塞主事件循环。
+
+    用法与 DBManager 相同，只是需要 await：
+        success, message = await async_db.verify_user(username, password)
+    """
+
+    def __init__(self, db_manager=None, max_workers=DB_EXECUTOR_WORKERS):
+        self.db = db_manager if db_manager is not None else DBManager()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self._methods = {}
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行任意同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        # 只有实例上不存在的属性才会进入这里，把 DBManager 的方法包装为协程函数
+        attr = getattr(self.db, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        method = self._methods.get(name)
+        if method is None:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await self.run(attr, *args, **kwargs)
+            self._methods[name] = method
+        return method
+
+    # 密码哈希在独立的进程池中计算，数据库线程只执行读写
+    async def verify_user(self, username, password):
+        """验证用户登录，旧格式的密码哈希在验证成功后升级"""
+        stored = await self.get_password_hash(username)
+        ok, rehash = await password_service.verify(password, stored)
+        if not ok:
+            return False, "用户名或密码错误"
+        if rehash:
+            new_hash = await password_service.hash(password)
+            await self.set_password_hash(username, new_hash, expected=stored)
+            logger.info("Upgraded password hash for %s", username)
+        return True, "登录成功"
+
+    async def register_user(self, username, password, avatar):
+        """注册新用户"""
+        password_hash = await password_service.hash(password)
+        return await self.create_user(username, password_hash, avatar)
+
+    async def update_user(self, username, update_data):
+        """更新用户信息"""
+        if "password" in update_data:
+            update_data = dict(update_data)
+            update_data["password_hash"] = await password_service.hash(update_data.pop("password"))
+        return await self.run(self.db.update_user, username, update_data)
+
+    def shutdown(self, wait=True):
+        """关闭数据库线程池和密码哈希进程池"""
+        logger.info("Shutting down database executor")
+        self.executor.shutdown(wait=wait)
+        password_service.shutdown(wait=wait)
+
+
+# Create a singleton instance
+async_db = AsyncDBManager()
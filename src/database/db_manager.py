@@ -1,327 +1,341 @@
 import sqlite3
-import hashlib
+from collections import deque
+import base64
 from pathlib import Path
 import time
 import threading
-import logging
 import functools
 import os
 import atexit
 
+from src.utils.logging_config import get_logger
+from src.utils.metrics import DB_OPERATION_SECONDS, DB_ERRORS_TOTAL
+from src.database.write_batcher import WriteBatcher
+from src.database.migrations import run_migrations, get_schema_version
+from src.utils.hand_codec import encode_hand, load_hand
+from src.database.hand_archive import HandArchive
+from src.utils.passwords import password_service
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger("database")
+logger = get_logger("database")
+
+# SQLite 连接参数
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 内存映射读取大小（字节）
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(16 * 1024)))  # 每个连接的页缓存大小（KB）
+WRITE_POOL_SIZE = 5   # 写连接数，SQLite同一时间只有一个写事务
+READ_POOL_SIZE = 10   # 只读连接数，WAL模式下读不阻塞写
+SQLITE_CACHED_STATEMENTS = 256  # 每个连接缓存的预编译语句数量（默认128）
+HAND_ARCHIVE_AGE = float(os.getenv("HAND_ARCHIVE_AGE", "600"))  # 牌局结束多少秒后移入归档
+HAND_ARCHIVE_INTERVAL = float(os.getenv("HAND_ARCHIVE_INTERVAL", "300"))  # 归档检查间隔（秒）
+HAND_ARCHIVE_BATCH = 50000  # 每个归档段最多包含的牌局数
+
+def encode_record_cursor(record):
+    """根据一页的最后一条记录生成下一页的游标"""
+    raw = f"{record['timestamp']}|{record['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_record_cursor(cursor):
+    """解析游标，返回 (timestamp, id)；格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, record_id = raw.rsplit("|", 1)
+        return timestamp, int(record_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
 
 class DBConnectionPool:
-    """改进的SQLite连接池实现，带有超时控制和健康检查"""
+    """SQLite连接池：空闲连接队列 + 条件变量等待，健康检查按需进行"""
     
-    def __init__(self, db_path, max_connections=5, timeout=10.0):
+    def __init__(self, db_path, max_connections=5, timeout=10.0, read_only=False):
         self.db_path = db_path
         self.max_connections = max_connections
         self.timeout = timeout
-        self.connections = []
-        self.lock = threading.Lock()
-        self.connection_attempts = 0
+        self.read_only = read_only
+        
+        # 空闲连接（后进先出，保持缓存热度），元素为 (连接, 归还时间)
+        self.idle = deque()
+        # 已创建且未关闭的连接总数（包括正在使用的）
+        self.total_connections = 0
+        self.condition = threading.Condition(threading.Lock())
+        
         self.last_connection_error = None
-        self.last_health_check = time.time()
-        self.health_check_interval = 60.0  # 1分钟检查一次连接健康
+        self.health_check_interval = 60.0  # 空闲超过1分钟的连接在取出时检查健康
+        self.max_wait_time = 5.0  # 获取连接最多等待5秒
         
-    def get_connection(self):
-        """获取一个数据库连接，带有超时控制"""
-        # 记录获取连接的开始时间和尝试ID
-        start_time = time.time()
-        self.connection_attempts += 1
-        attempt_id = self.connection_attempts
-        max_wait_time = 5.0  # 最多等待5秒
+    def get_connection(self, timeout=None):
+        """获取一个数据库连接
         
-        logger.debug(f"尝试获取连接 #{attempt_id}")
+        有空闲连接时直接取出；未达到上限时新建连接；否则在条件变量上
+        等待其他线程归还连接，直到截止时间。
         
-        # 循环尝试获取连接，直到成功或超时
-        while time.time() - start_time < max_wait_time:
-            try:
-                with self.lock:
-                    # 尝试获取一个现有的空闲连接，并进行健康检查
-                    if self.connections:
-                        conn = self.connections.pop()
-                        
-                        # 检查连接是否健康
-                        try:
-                            # 简单测试连接是否有效
-                            conn.execute("SELECT 1").fetchone()
-                            logger.debug(f"连接 #{attempt_id}: 从连接池获取空闲连接并通过健康检查")
-                            return conn
-                        except Exception as e:
-                            # 连接不健康，关闭并创建新连接
-                            logger.warning(f"连接 #{attempt_id}: 连接健康检查失败: {str(e)}")
-                            try:
-                                conn.close()
-                            except:
-                                pass
-                    
-                    # 如果没有空闲连接且未达到最大连接数，创建新连接
-                    if len(self.connections) < self.max_connections:
-                        try:
-                            logger.info(f"连接 #{attempt_id}: 创建新连接: {self.db_path}")
-                            # 使用参数化的超时设置创建新连接
-                            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
-                            # 启用外键约束
-                            conn.execute("PRAGMA foreign_keys = ON")
-                            # 设置更安全的等待超时
-                            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
-                            return conn
-                        except Exception as e:
-                            self.last_connection_error = e
-                            logger.error(f"连接 #{attempt_id}: 创建数据库连接失败: {str(e)}")
-                            # 抛出异常，允许外部处理
-                            raise
+        Args:
+            timeout (float, optional): 最长等待时间，默认 max_wait_time
+        """
+        deadline = time.monotonic() + (self.max_wait_time if timeout is None else timeout)
+        
+        while True:
+            conn = None
+            idle_since = None
+            create = False
+            
+            with self.condition:
+                while True:
+                    if self.idle:
+                        conn, idle_since = self.idle.pop()
+                        break
+                    if self.total_connections < self.max_connections:
+                        # 先占用名额，在锁外创建连接
+                        self.total_connections += 1
+                        create = True
+                        break
                     
-                    # 如果已达到最大连接数，等待并重试
-                    logger.warning(f"连接 #{attempt_id}: 已达到最大连接数 {self.max_connections}，等待空闲连接")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.error("获取连接超时（>%.1f秒），最大连接数: %s", self.max_wait_time if timeout is None else timeout, self.max_connections)
+                        raise Exception(f"获取数据库连接超时，最大连接数:{self.max_connections}")
+                    self.condition.wait(remaining)
             
-            # 在循环中释放锁，避免死锁
+            if create:
+                try:
+                    logger.debug("创建新连接: %s", self.db_path)
+                    return self._create_connection()
+                except Exception as e:
+                    self.last_connection_error = e
+                    logger.error("创建数据库连接失败: %s", str(e))
+                    self._forget_connection()
+                    # 抛出异常，允许外部处理
+                    raise
+            
+            # 只对空闲较久的连接做健康检查
+            if time.monotonic() - idle_since < self.health_check_interval:
+                return conn
+            try:
+                conn.execute("SELECT 1").fetchone()
+                return conn
             except Exception as e:
-                logger.error(f"连接 #{attempt_id}: 获取连接时发生错误: {str(e)}")
-                # 小延迟后重试
-                time.sleep(0.1)
-                continue
-            
-            # 添加随机等待时间，避免多个请求同时重试导致的冲突
-            # 使用随机退避策略
-            import random
-            wait_time = 0.1 + (random.random() * 0.2)
-            time.sleep(wait_time)
-            
-            # 检查是否已经等待太久
-            elapsed = time.time() - start_time
-            if elapsed > max_wait_time - 0.5:  # 预留0.5秒用于最后处理
-                logger.error(f"连接 #{attempt_id}: 获取连接超时（>{max_wait_time}秒），可能存在死锁")
-                break
-        
-        # 如果达到这里，表示获取连接超时
-        raise Exception(f"获取数据库连接超时，已等待{time.time() - start_time:.2f}秒，最大连接数:{self.max_connections}")
+                logger.warning("连接健康检查失败，重新获取: %s", str(e))
+                self.discard_connection(conn)
+    
+    def _create_connection(self):
+        """创建并配置一个新连接"""
+        if self.read_only:
+            # 只读连接：在WAL模式下读取不会阻塞写入，也不会被写入阻塞
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, timeout=self.timeout, uri=True, check_same_thread=False,
+                                   cached_statements=SQLITE_CACHED_STATEMENTS)
+        else:
+            # 使用参数化的超时设置创建新连接
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                                   cached_statements=SQLITE_CACHED_STATEMENTS)
+            # WAL模式是持久化到数据库文件的，只需由写连接设置
+            conn.execute("PRAGMA journal_mode = WAL")
+            # WAL模式下NORMAL同步级别已能保证数据库一致性，只在检查点时fsync
+            conn.execute("PRAGMA synchronous = NORMAL")
+            # 启用外键约束
+            conn.execute("PRAGMA foreign_keys = ON")
+        
+        # 设置更安全的等待超时
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        # 负数表示以KB为单位
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        return conn
+    
+    def _forget_connection(self):
+        """释放一个连接名额并唤醒等待者"""
+        with self.condition:
+            self.total_connections -= 1
+            self.condition.notify()
     
     def release_connection(self, conn):
-        """归还连接到连接池，包含健康检查"""
+        """归还连接到连接池"""
         if not conn:
             return
-            
+        
         try:
-            with self.lock:
-                # 进行周期性健康检查
-                current_time = time.time()
-                should_check_health = (current_time - self.last_health_check) > self.health_check_interval
-                
-                if should_check_health:
-                    self.last_health_check = current_time
-                    self._check_pool_health()
-                
-                # 测试连接是否有效
-                try:
-                    conn.execute("SELECT 1").fetchone()
-                    
-                    # 如果连接有效且连接池未满，则归还
-                    if len(self.connections) < self.max_connections:
-                        self.connections.append(conn)
-                        logger.debug(f"成功归还连接到连接池，当前连接数: {len(self.connections)}")
-                    else:
-                        # 如果连接池已满，关闭连接
-                        conn.close()
-                        logger.debug(f"连接池已满，关闭连接")
-                except Exception as e:
-                    # 如果连接已无效，直接关闭
-                    logger.warning(f"归还无效连接，关闭: {str(e)}")
-                    try:
-                        conn.close()
-                    except:
-                        pass
+            # 未提交的事务不能带回连接池，否则会一直持有写锁
+            if conn.in_transaction:
+                conn.rollback()
         except Exception as e:
-            logger.error(f"归还连接到连接池时发生错误: {str(e)}")
-            # 尝试关闭连接，避免泄漏
-            try:
-                conn.close()
-            except:
-                pass
-    
-    def _check_pool_health(self):
-        """检查连接池中所有连接的健康状态"""
-        logger.debug(f"执行连接池健康检查，当前连接数: {len(self.connections)}")
-        healthy_connections = []
-        
-        for conn in self.connections:
-            try:
-                # 测试连接是否有效
-                conn.execute("SELECT 1").fetchone()
-                healthy_connections.append(conn)
-            except Exception as e:
-                logger.warning(f"移除不健康的连接: {str(e)}")
-                try:
-                    conn.close()
-                except:
-                    pass
+            logger.warning("归还无效连接，关闭: %s", str(e))
+            self.discard_connection(conn)
+            return
         
-        # 更新连接池为健康的连接
-        self.connections = healthy_connections
-        logger.debug(f"健康检查完成，保留 {len(self.connections)} 个健康连接")
+        with self.condition:
+            self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+    
+    def discard_connection(self, conn):
+        """关闭一个已取出的连接，不再归还连接池"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._forget_connection()
     
     def close_all(self):
-        """关闭所有连接，在应用退出时调用"""
-        with self.lock:
-            for conn in self.connections:
+        """关闭所有空闲连接，在应用退出时调用"""
+        with self.condition:
+            while self.idle:
+                conn, _ = self.idle.pop()
                 try:
                     conn.close()
-                except:
+                except Exception:
                     pass
-            self.connections = []
-            logger.info("已关闭所有数据库连接")
+                self.total_connections -= 1
+            self.condition.notify_all()
+        logger.info("已关闭所有数据库连接")
 
 # 数据库操作装饰器 - 处理连接获取、异常处理和重试
-def db_operation(max_attempts=3, initial_delay=0.1, operation_timeout=5.0):
+def db_operation(max_attempts=3, initial_delay=0.1, operation_timeout=5.0, read_only=False):
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(self, *args, **kwargs):
+        def run_with_retries(self, *args, **kwargs):
+            pool = self.read_pool if read_only else self.connection_pool
             attempts = 0
             last_error = None
-            start_time = time.time()
+            start_time = time.monotonic()
             
             while attempts < max_attempts:
                 conn = None
-                operation_timer = None
                 
                 try:
-                    # 设置操作超时定时器
-                    operation_timer = threading.Timer(
-                        operation_timeout, 
-                        lambda: logger.error(f"数据库操作超时: {func.__name__}, 参数: {args}, {kwargs}")
-                    )
-                    operation_timer.daemon = True
-                    operation_timer.start()
-                    
-                    # 记录开始获取连接的时间
-                    conn_start_time = time.time()
-                    logger.debug(f"开始获取数据库连接: {func.__name__}")
-                    
-                    # 获取连接，添加最大等待时间（5秒）
-                    conn_timeout = 5.0
-                    conn_timer = threading.Timer(
-                        conn_timeout, 
-                        lambda: logger.error(f"获取数据库连接超时: {func.__name__}, 已等待{conn_timeout}秒")
-                    )
-                    conn_timer.daemon = True
-                    conn_timer.start()
-                    
-                    # 尝试获取连接
-                    conn = self.connection_pool.get_connection()
-                    
-                    # 取消连接超时定时器
-                    if conn_timer.is_alive():
-                        conn_timer.cancel()
-                    
-                    conn_elapsed = time.time() - conn_start_time
-                    logger.debug(f"获取连接耗时: {conn_elapsed:.3f}秒")
+                    # 获取连接，最多等待5秒
+                    conn = pool.get_connection(timeout=5.0)
                     
                     # 调用原始函数，传入连接
-                    logger.debug(f"执行数据库操作: {func.__name__}")
                     result = func(self, conn, *args, **kwargs)
                     
-                    # 取消操作超时定时器
-                    if operation_timer.is_alive():
-                        operation_timer.cancel()
-                    
-                    elapsed = time.time() - start_time
-                    logger.debug(f"数据库操作完成: {func.__name__}, 耗时: {elapsed:.3f}秒")
-                    
+                    # 用单调时钟检查操作耗时，不再为每次操作启动计时线程
+                    elapsed = time.monotonic() - start_time
+                    if elapsed > operation_timeout:
+                        logger.warning("数据库操作超时: %s, 已耗时 %.3f秒", func.__name__, elapsed)
                     return result
                     
                 except sqlite3.OperationalError as e:
                     # 处理数据库锁定或超时错误
                     attempts += 1
                     last_error = e
-                    logger.warning(f"数据库操作失败 (attempt {attempts}/{max_attempts}): {str(e)}")
+                    logger.warning("数据库操作失败 (attempt %s/%s): %s", attempts, max_attempts, str(e))
                     
-                    if "database is locked" in str(e) or "timeout" in str(e):
-                        # 指数退避延迟
-                        delay = initial_delay * (2 ** attempts)
-                        logger.info(f"等待 {delay}秒后重试...")
-                        time.sleep(delay)
-                    else:
+                    if "database is locked" not in str(e) and "timeout" not in str(e):
                         # 其他操作错误直接失败
                         raise
                         
                 except Exception as e:
                     # 非数据库锁定相关错误
-                    logger.error(f"数据库操作出现意外错误: {str(e)}")
+                    logger.error("数据库操作出现意外错误: %s", str(e))
                     raise
                     
                 finally:
-                    # 取消操作超时定时器（如果仍然活动）
-                    if operation_timer and operation_timer.is_alive():
-                        operation_timer.cancel()
-                    
                     # 确保连接被归还到连接池
                     if conn:
-                        try:
-                            logger.debug(f"释放数据库连接: {func.__name__}")
-                            self.connection_pool.release_connection(conn)
-                        except Exception as e:
-                            logger.error(f"归还连接到连接池失败: {str(e)}")
-                    
-                    # 检查总操作时间是否超过允许的最大时间
-                    elapsed = time.time() - start_time
-                    if elapsed > operation_timeout * 1.5:  # 给1.5倍的余量
-                        logger.warning(f"数据库操作耗时过长: {func.__name__}, 已耗时 {elapsed:.3f}秒")
-                        if attempts >= max_attempts - 1:  # 如果是最后一次尝试
-                            break
+                        pool.release_connection(conn)
+                
+                # 超过允许的最大时间后不再重试
+                if time.monotonic() - start_time > operation_timeout * 1.5:
+                    break
+                
+                if attempts < max_attempts:
+                    # 指数退避延迟
+                    delay = initial_delay * (2 ** attempts)
+                    logger.info("等待 %s秒后重试...", delay)
+                    time.sleep(delay)
             
             # 达到最大重试次数后仍然失败
             if last_error:
-                elapsed = time.time() - start_time
-                logger.error(f"数据库操作失败，已达到最大重试次数 {max_attempts}: {str(last_error)}, 总耗时: {elapsed:.3f}秒")
+                elapsed = time.monotonic() - start_time
+                logger.error("数据库操作失败，已达到最大重试次数 %s: %s, 总耗时: %.3f秒", max_attempts, str(last_error), elapsed)
                 raise last_error
+        
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return run_with_retries(self, *args, **kwargs)
+            except Exception:
+                DB_ERRORS_TOTAL.inc(func.__name__)
+                raise
+            finally:
+                DB_OPERATION_SECONDS.observe(time.perf_counter() - start, func.__name__)
                 
         return wrapper
     return decorator
 
 class DBManager:
+    _instance = None
+    _instance_lock = threading.RLock()
+    
+    def __new__(cls):
+        # 每个进程只使用一个DBManager和一组连接池
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(DBManager, cls).__new__(cls)
+                cls._instance.initialized = False
+        return cls._instance
+    
     def __init__(self):
+        with self._instance_lock:
+            if self.initialized:
+                return
+            self._initialize()
+            self.initialized = True
+    
+    def _initialize(self):
         # 使用环境变量设置数据库路径，如果没有设置则使用默认路径
         db_path_env = os.getenv("DB_PATH")
         if db_path_env:
             # 使用环境变量中的路径
             self.db_path = db_path_env
-            logger.info(f"使用环境变量中的数据库路径: {self.db_path}")
+            logger.info("使用环境变量中的数据库路径: %s", self.db_path)
         else:
             # 默认的开发环境路径
             self.db_path = "poker.db"  # 使用相对路径，更加通用
-            logger.info(f"使用默认数据库路径: {self.db_path}")
+            logger.info("使用默认数据库路径: %s", self.db_path)
         
-        # 创建连接池
-        self.connection_pool = DBConnectionPool(self.db_path, max_connections=10, timeout=15.0)
+        # 创建写连接池
+        self.connection_pool = DBConnectionPool(self.db_path, max_connections=WRITE_POOL_SIZE, timeout=15.0)
         
         # 设置进程退出时的清理函数
         atexit.register(self._cleanup_resources)
         
-        # 初始化数据库
+        # 初始化数据库（同时切换到WAL模式）
         self.init_database()
         
+        # 创建只读连接池，需要在数据库文件创建之后
+        self.read_pool = DBConnectionPool(self.db_path, max_connections=READ_POOL_SIZE, timeout=15.0, read_only=True)
+        
+        # 批量写入服务：游戏记录等高频写入合并到一个事务中提交
+        self.write_batcher = WriteBatcher(self.connection_pool)
+        self.write_batcher.register("game_record", self._write_game_records)
+        self.write_batcher.register("hand", self._write_hands, prepare=self._encode_hand_row)
+        self.write_batcher.start()
+        
+        # 牌局历史归档：较早的牌局定期从 hands 表移入只读段文件
+        self.hand_archive = HandArchive()
+        self.archive_stop = threading.Event()
+        self.archive_thread = threading.Thread(target=self._archive_loop, name="hand-archiver")
+        self.archive_thread.daemon = True
+        self.archive_thread.start()
+        
         logger.info("数据库管理器初始化完成")
     
     def _cleanup_resources(self):
         """在进程退出时清理资源"""
         try:
             logger.info("正在清理数据库资源...")
+            if hasattr(self, 'archive_stop'):
+                self.archive_stop.set()
+            # 先写入缓冲中的数据，再关闭连接
+            if hasattr(self, 'write_batcher'):
+                self.write_batcher.stop()
             if hasattr(self, 'connection_pool'):
                 self.connection_pool.close_all()
+            if hasattr(self, 'read_pool'):
+                self.read_pool.close_all()
             logger.info("数据库资源清理完成")
         except Exception as e:
-            logger.error(f"清理数据库资源时出错: {str(e)}")
+            logger.error("清理数据库资源时出错: %s", str(e))
             
-    def __del__(self):
-        """析构函数，确保资源被释放"""
-        self._cleanup_resources()
-    
     def init_database(self):
         """初始化数据库表结构"""
         conn = None
@@ -368,19 +382,31 @@ class DBManager:
             ''')
             
             conn.commit()
+            
+            # 执行结构迁移（索引、汇总表等），已是最新版本时不做任何操作
+            applied = run_migrations(conn)
+            if applied:
+                logger.info("已执行数据库迁移: %s，当前版本: %s", applied, get_schema_version(conn))
+            
             logger.info("数据库初始化成功")
             
         except Exception as e:
-            logger.error(f"初始化数据库失败: {str(e)}")
+            logger.error("初始化数据库失败: %s", str(e))
             raise
         finally:
             if conn:
                 self.connection_pool.release_connection(conn)
     
+    def register_user(self, username, password, avatar):
+        """注册新用户，密码在获取数据库连接之前由密码哈希进程池计算"""
+        return self.create_user(username, password_service.hash_sync(password), avatar)
+
     @db_operation(max_attempts=3)
-    def register_user(self, conn, username, password, avatar):
-        """注册新用户"""
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+    def create_user(self, conn, username, password_hash, avatar):
+        """使用已经生成的密码哈希注册新用户"""
+        return self._insert_user(conn, username, password_hash, avatar)
+
+    def _insert_user(self, conn, username, password_hash, avatar):
         try:
             c = conn.cursor()
             c.execute('INSERT INTO users (username, password_hash, avatar) VALUES (?, ?, ?)',
@@ -389,36 +415,236 @@ class DBManager:
             return True, "注册成功"
         except sqlite3.IntegrityError:
             return False, "用户名已存在"
-            
-    @db_operation(max_attempts=3)        
-    def verify_user(self, conn, username, password):
-        """验证用户登录"""
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+
+    def verify_user(self, username, password):
+        """验证用户登录，旧格式的密码哈希在验证成功后升级"""
+        stored = self.get_password_hash(username)
+        # 用户不存在时同样执行一次验证（见 verify_missing_user）
+        ok, rehash = password_service.verify_sync(password, stored)
+        if not ok:
+            return False, "用户名或密码错误"
+        if rehash:
+            self.set_password_hash(username, password_service.hash_sync(password), expected=stored)
+        return True, "登录成功"
+
+    @db_operation(max_attempts=3, read_only=True)
+    def get_password_hash(self, conn, username):
+        """获取用户的密码哈希，用户不存在时返回 None"""
         c = conn.cursor()
         c.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
         result = c.fetchone()
-        
-        if result and result[0] == password_hash:
-            return True, "登录成功"
-        return False, "用户名或密码错误"
-        
-    @db_operation(max_attempts=3)        
-    def record_game(self, conn, room_id, player, buy_in, cash_out):
-        """记录游戏结果"""
+        return result[0] if result else None
+
+    @db_operation(max_attempts=3)
+    def set_password_hash(self, conn, username, password_hash, expected=None):
+        """更新密码哈希
+
+        指定 expected 时只在当前哈希仍等于 expected 时更新，
+        登录时的重新哈希不会覆盖同时发生的密码修改。
+        """
         c = conn.cursor()
-        c.execute('''
-        INSERT INTO game_records (room_id, player, buy_in, cash_out)
-        VALUES (?, ?, ?, ?)
-        ''', (room_id, player, buy_in, cash_out))
+        if expected is None:
+            c.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username))
+        else:
+            c.execute('UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?',
+                      (password_hash, username, expected))
         conn.commit()
+        return c.rowcount > 0
+
+    def record_game(self, room_id, player, buy_in, cash_out, durable=False):
+        """记录游戏结果
+        
+        记录进入批量写入缓冲区，与同一时间窗口内的其他记录一起提交。
+        
+        Args:
+            durable (bool): 为True时等待记录所在的事务提交后再返回
+        """
+        self.write_batcher.submit("game_record", (room_id, player, buy_in, cash_out), durable=durable)
         return True
+    
+    def record_hand(self, hand_id, room_id, ended_at, record, durable=False):
+        """保存一手牌的完整历史记录（通过批量写入提交，在写入线程中、打开事务之前编码）"""
+        self.write_batcher.submit("hand", (hand_id, room_id, ended_at, record), durable=durable)
+        return True
+    
+    def get_room_hands(self, room_id, limit=20, before=None):
+        """按 (结束时间, 牌局ID) 倒序获取房间的牌局历史
         
-    @db_operation(max_attempts=3)        
+        最近的牌局在 hands 表中，超出的部分从归档中读取。
+        读取前先提交写入缓冲区中的牌局，刚结束的牌局也能查到。
+        
+        Args:
+            before: 可选，牌局ID，只返回该牌局之前的牌局；牌局不属于该房间时返回空列表
+        """
+        self.write_batcher.flush()
+        
+        conn = None
+        try:
+            conn = self.read_pool.get_connection()
+            c = conn.cursor()
+            cursor = None
+            if before is not None:
+                c.execute('SELECT ended_at FROM hands WHERE hand_id = ? AND room_id = ?', (before, room_id))
+                row = c.fetchone()
+                if row:
+                    cursor = (row[0], before)
+                else:
+                    found = self.hand_archive.get_hand(before)
+                    if not found or found[0] != room_id:
+                        return []
+                    cursor = (found[1].get("end_time"), before)
+                c.execute('''
+                SELECT payload
+                FROM hands
+                WHERE room_id = ? AND (ended_at < ? OR (ended_at = ? AND hand_id < ?))
+                ORDER BY ended_at DESC, hand_id DESC
+                LIMIT ?
+                ''', (room_id, cursor[0], cursor[0], cursor[1], limit))
+            else:
+                c.execute('''
+                SELECT payload
+                FROM hands
+                WHERE room_id = ?
+                ORDER BY ended_at DESC, hand_id DESC
+                LIMIT ?
+                ''', (room_id, limit))
+            hands = [load_hand(row[0]) for row in c.fetchall()]
+        finally:
+            if conn:
+                self.read_pool.release_connection(conn)
+        
+        if len(hands) < limit:
+            # 数据库中的牌局不够一页，剩余部分从归档读取（归档中的牌局都早于 hands 表中的牌局）
+            hands.extend(self.hand_archive.room_hands(room_id, limit - len(hands), cursor))
+        return hands
+    
+    def get_hand(self, hand_id):
+        """按牌局ID获取一手牌的完整记录，返回 {"room_id", "hand"} 或 None"""
+        conn = None
+        try:
+            conn = self.read_pool.get_connection()
+            c = conn.cursor()
+            c.execute('SELECT room_id, payload FROM hands WHERE hand_id = ?', (hand_id,))
+            row = c.fetchone()
+        finally:
+            if conn:
+                self.read_pool.release_connection(conn)
+        
+        if row:
+            return {"room_id": row[0], "hand": load_hand(row[1])}
+        found = self.hand_archive.get_hand(hand_id)
+        if found:
+            return {"room_id": found[0], "hand": found[1]}
+        return None
+    
+    def get_player_hands(self, player, start_time=None, end_time=None, limit=20):
+        """获取玩家在时间范围 [start_time, end_time) 内参与的牌局，按结束时间倒序
+        
+        Returns:
+            list: [{"room_id", "hand"}, ...]
+        """
+        start_time = start_time if start_time is not None else 0
+        end_time = end_time if end_time is not None else float("inf")
+        
+        results = []
+        seen = set()
+        conn = None
+        try:
+            # 尚未归档的牌局只有最近 HAND_ARCHIVE_AGE 秒左右，直接扫描
+            conn = self.read_pool.get_connection()
+            c = conn.cursor()
+            c.execute('''
+            SELECT room_id, payload
+            FROM hands
+            WHERE ended_at >= ? AND ended_at < ?
+            ORDER BY ended_at DESC
+            ''', (start_time, end_time))
+            for room_id, payload in c:
+                hand = load_hand(payload)
+                if any(p.get("name") == player for p in hand.get("players", [])):
+                    results.append({"room_id": room_id, "hand": hand})
+                    seen.add(hand.get("game_id"))
+                    if len(results) >= limit:
+                        return results
+        finally:
+            if conn:
+                self.read_pool.release_connection(conn)
+        
+        archived = self.hand_archive.player_hands(
+            player, start_time, end_time if end_time != float("inf") else None, limit)
+        for room_id, hand in archived:
+            if hand.get("game_id") not in seen:
+                results.append({"room_id": room_id, "hand": hand})
+                if len(results) >= limit:
+                    break
+        return results
+    
+    def roll_hand_archive(self, older_than=HAND_ARCHIVE_AGE):
+        """把结束超过 older_than 秒的牌局从 hands 表移入归档段文件
+        
+        先写入段文件，成功后再从数据库删除，中途失败不会丢失牌局。
+        
+        Returns:
+            int: 归档的牌局数
+        """
+        cutoff = time.time() - older_than
+        total = 0
+        while True:
+            conn = None
+            try:
+                conn = self.read_pool.get_connection()
+                rows = conn.execute('''
+                SELECT hand_id, room_id, ended_at, payload
+                FROM hands
+                WHERE ended_at < ?
+                ORDER BY ended_at
+                LIMIT ?
+                ''', (cutoff, HAND_ARCHIVE_BATCH)).fetchall()
+            finally:
+                if conn:
+                    self.read_pool.release_connection(conn)
+            if not rows:
+                return total
+            
+            def archive_items():
+                for hand_id, room_id, ended_at, payload in rows:
+                    hand = load_hand(payload)
+                    if not isinstance(payload, bytes):
+                        # 旧版本保存的 JSON 记录
+                        payload = encode_hand(hand)
+                    players = [p.get("name", "") for p in hand.get("players", [])]
+                    yield hand_id, room_id, ended_at, players, payload
+            
+            self.hand_archive.append(archive_items())
+            
+            conn = None
+            try:
+                conn = self.connection_pool.get_connection()
+                with conn:
+                    conn.executemany('DELETE FROM hands WHERE hand_id = ?', [(row[0],) for row in rows])
+            finally:
+                if conn:
+                    self.connection_pool.release_connection(conn)
+            
+            total += len(rows)
+            if len(rows) < HAND_ARCHIVE_BATCH:
+                return total
+    
+    def _archive_loop(self):
+        """后台线程：定期归档较早的牌局"""
+        while not self.archive_stop.wait(HAND_ARCHIVE_INTERVAL):
+            try:
+                count = self.roll_hand_archive()
+                if count:
+                    logger.info("已归档 %s 手牌", count)
+            except Exception as e:
+                logger.exception("归档牌局历史时出错: %s", str(e))
+    
+    @db_operation(max_attempts=3, read_only=True)
     def get_user_info(self, conn, username):
         """获取用户信息"""
         try:
-            print(f"[DATABASE][get_user_info] 获取用户信息: username={username}")
-            logger.info(f"获取用户信息: username={username}")
+            logger.debug("获取用户信息: username=%s", username)
             
             c = conn.cursor()
             c.execute('SELECT username, balance, email, avatar FROM users WHERE username = ?', (username,))
@@ -431,15 +657,13 @@ class DBManager:
                     "email": result[2],
                     "avatar": result[3]
                 }
-                logger.info(f"成功获取用户 {username} 的信息")
+                logger.debug("成功获取用户 %s 的信息", username)
                 return user_info
             
-            logger.warning(f"用户不存在: {username}")
-            print(f"[DATABASE][get_user_info] 用户不存在: {username}")
+            logger.warning("用户不存在: %s", username)
             return None
         except Exception as e:
-            logger.error(f"获取用户信息时出错: {str(e)}")
-            print(f"[DATABASE][get_user_info] 出错: {str(e)}")
+            logger.error("获取用户信息时出错: %s", str(e))
             raise
     
     @db_operation(max_attempts=3)        
@@ -455,17 +679,23 @@ class DBManager:
             
         return True, "余额更新成功"
     
+    def update_user(self, username, update_data):
+        """更新用户信息，新密码在获取数据库连接之前由密码哈希进程池计算"""
+        if "password" in update_data and "password_hash" not in update_data:
+            update_data = dict(update_data)
+            update_data["password_hash"] = password_service.hash_sync(update_data.pop("password"))
+        return self._update_user_fields(username, update_data)
+    
     @db_operation(max_attempts=3)    
-    def update_user(self, conn, username, update_data):
-        """更新用户信息"""
+    def _update_user_fields(self, conn, username, update_data):
+        """更新用户信息（password_hash 需已计算好）"""
         # 构建更新语句
         update_fields = []
         values = []
         
-        if "password" in update_data:
+        if "password_hash" in update_data:
             update_fields.append("password_hash = ?")
-            password_hash = hashlib.sha256(update_data["password"].encode()).hexdigest()
-            values.append(password_hash)
+            values.append(update_data["password_hash"])
             
         if "email" in update_data:
             update_fields.append("email = ?")
@@ -495,18 +725,89 @@ class DBManager:
             
         return True, "更新成功"
 
-    def get_game_records(self, limit=10, offset=0):
-        """获取所有游戏记录，支持分页"""
+    @staticmethod
+    def _encode_hand_row(row):
+        """把牌局记录编码为二进制（见 src/utils/hand_codec.py），编码失败只丢弃这一手牌"""
+        hand_id, room_id, ended_at, record = row
+        return hand_id, room_id, ended_at, encode_hand(record)
+
+    def _write_hands(self, conn, rows):
+        """写入一批已编码的牌局历史
+        
+        Args:
+            rows (list): [(hand_id, room_id, ended_at, payload), ...]
+        """
+        conn.executemany('''
+        INSERT OR REPLACE INTO hands (hand_id, room_id, ended_at, payload)
+        VALUES (?, ?, ?, ?)
+        ''', rows)
+
+    def _write_game_records(self, conn, rows):
+        """写入一批游戏记录，并在同一事务中更新玩家统计汇总表
+        
+        Args:
+            rows (list): [(room_id, player, buy_in, cash_out), ...]
+        """
+        conn.executemany('''
+        INSERT INTO game_records (room_id, player, buy_in, cash_out)
+        VALUES (?, ?, ?, ?)
+        ''', rows)
+        
+        stats_rows = []
+        for _, player, buy_in, cash_out in rows:
+            win = 1 if cash_out > buy_in else 0
+            stats_rows.append((
+                player,
+                win,
+                1 if cash_out < buy_in else 0,
+                1 if cash_out == buy_in else 0,
+                buy_in,
+                cash_out,
+                cash_out - buy_in,
+                win * 100.0
+            ))
+        
+        # SET 子句中的列引用的是更新前的值
+        conn.executemany('''
+        INSERT INTO player_stats (player, games, wins, losses, draws, total_buy_in, total_cash_out, profit, win_rate)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(player) DO UPDATE SET
+            games = games + 1,
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses,
+            draws = draws + excluded.draws,
+            total_buy_in = total_buy_in + excluded.total_buy_in,
+            total_cash_out = total_cash_out + excluded.total_cash_out,
+            profit = profit + excluded.profit,
+            win_rate = (wins + excluded.wins) * 100.0 / (games + 1)
+        ''', stats_rows)
+    
+    def get_game_records(self, limit=10, offset=0, cursor=None):
+        """获取所有游戏记录，支持分页
+        
+        提供 cursor（上一页返回的 next_cursor）时使用键集分页，
+        翻到任意深度都只需一次索引查找；否则使用 offset 分页。
+        """
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
-            c.execute('''
-            SELECT id, room_id, player, buy_in, cash_out, timestamp
-            FROM game_records
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-            ''', (limit, offset))
+            if cursor:
+                timestamp, record_id = decode_record_cursor(cursor)
+                c.execute('''
+                SELECT id, room_id, player, buy_in, cash_out, timestamp
+                FROM game_records
+                WHERE (timestamp, id) < (?, ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+                ''', (timestamp, record_id, limit))
+            else:
+                c.execute('''
+                SELECT id, room_id, player, buy_in, cash_out, timestamp
+                FROM game_records
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ? OFFSET ?
+                ''', (limit, offset))
             
             records = []
             for row in c.fetchall():
@@ -523,34 +824,44 @@ class DBManager:
             return records
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def count_game_records(self):
         """获取游戏记录总数"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT COUNT(*) FROM game_records')
             count = c.fetchone()[0]
             return count
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
-    def get_user_game_records(self, username, limit=10, offset=0):
-        """获取指定用户的游戏记录，支持分页"""
+    def get_user_game_records(self, username, limit=10, offset=0, cursor=None):
+        """获取指定用户的游戏记录，支持分页（cursor 用法同 get_game_records）"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
-            c.execute('''
-            SELECT id, room_id, player, buy_in, cash_out, timestamp
-            FROM game_records
-            WHERE player = ?
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-            ''', (username, limit, offset))
+            if cursor:
+                timestamp, record_id = decode_record_cursor(cursor)
+                c.execute('''
+                SELECT id, room_id, player, buy_in, cash_out, timestamp
+                FROM game_records
+                WHERE player = ? AND (timestamp, id) < (?, ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+                ''', (username, timestamp, record_id, limit))
+            else:
+                c.execute('''
+                SELECT id, room_id, player, buy_in, cash_out, timestamp
+                FROM game_records
+                WHERE player = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ? OFFSET ?
+                ''', (username, limit, offset))
             
             records = []
             for row in c.fetchall():
@@ -567,45 +878,33 @@ class DBManager:
             return records
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def count_user_game_records(self, username):
         """获取指定用户的游戏记录总数"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT COUNT(*) FROM game_records WHERE player = ?', (username,))
             count = c.fetchone()[0]
             return count
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def get_win_rate_leaderboard(self, limit=10):
         """获取胜率排行榜"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
-            # 查询每个玩家的游戏次数和赢得次数
+            # 从统计汇总表按索引读取前 limit 名
             c.execute('''
-            WITH player_games AS (
-                SELECT 
-                    player,
-                    COUNT(*) as total_games,
-                    SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END) as wins
-                FROM game_records
-                GROUP BY player
-            )
-            SELECT 
-                player,
-                total_games,
-                wins,
-                CASE WHEN total_games > 0 THEN (wins * 100.0 / total_games) ELSE 0 END as win_rate
-            FROM player_games
-            ORDER BY win_rate DESC, total_games DESC
+            SELECT player, games, wins, win_rate
+            FROM player_stats
+            ORDER BY win_rate DESC, games DESC
             LIMIT ?
             ''', (limit,))
             
@@ -621,24 +920,19 @@ class DBManager:
             return leaderboard
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def get_profit_leaderboard(self, limit=10):
         """获取盈利排行榜"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
-            # 查询每个玩家的总买入和总提现
+            # 从统计汇总表按索引读取前 limit 名
             c.execute('''
-            SELECT 
-                player,
-                SUM(buy_in) as total_buy_in,
-                SUM(cash_out) as total_cash_out,
-                SUM(cash_out - buy_in) as profit
-            FROM game_records
-            GROUP BY player
+            SELECT player, total_buy_in, total_cash_out, profit
+            FROM player_stats
             ORDER BY profit DESC
             LIMIT ?
             ''', (limit,))
@@ -655,26 +949,19 @@ class DBManager:
             return leaderboard
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def get_user_statistics(self, username):
         """获取用户统计信息"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
             # 查询用户的游戏总数、赢的次数、总买入、总提现和盈利情况
             c.execute('''
-            SELECT 
-                COUNT(*) as total_games,
-                SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END) as wins,
-                SUM(CASE WHEN cash_out < buy_in THEN 1 ELSE 0 END) as losses,
-                SUM(CASE WHEN cash_out = buy_in THEN 1 ELSE 0 END) as draws,
-                SUM(buy_in) as total_buy_in,
-                SUM(cash_out) as total_cash_out,
-                SUM(cash_out - buy_in) as profit
-            FROM game_records
+            SELECT games, wins, losses, draws, total_buy_in, total_cash_out, profit
+            FROM player_stats
             WHERE player = ?
             ''', (username,))
             
@@ -718,39 +1005,33 @@ class DBManager:
             return stats
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def get_platform_statistics(self):
         """获取平台整体统计信息"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
             # 查询总用户数
             c.execute('SELECT COUNT(*) FROM users')
             total_users = c.fetchone()[0]
             
-            # 查询总游戏局数
-            c.execute('SELECT COUNT(*) FROM game_records')
-            total_games = c.fetchone()[0]
-            
-            # 查询总交易量
-            c.execute('SELECT SUM(buy_in) FROM game_records')
-            total_buy_in = c.fetchone()[0] or 0
-            
-            # 查询总提现
-            c.execute('SELECT SUM(cash_out) FROM game_records')
-            total_cash_out = c.fetchone()[0] or 0
+            # 查询总游戏局数、总交易量和总提现（汇总表每名玩家一行）
+            c.execute('SELECT SUM(games), SUM(total_buy_in), SUM(total_cash_out) FROM player_stats')
+            row = c.fetchone()
+            total_games = row[0] or 0
+            total_buy_in = row[1] or 0
+            total_cash_out = row[2] or 0
             
             # 查询平均每局金额
             average_pot = total_buy_in / total_games if total_games > 0 else 0
             
             # 查询最高盈利玩家
             c.execute('''
-            SELECT player, SUM(cash_out - buy_in) as profit
-            FROM game_records
-            GROUP BY player
+            SELECT player, profit
+            FROM player_stats
             ORDER BY profit DESC
             LIMIT 1
             ''')
@@ -762,21 +1043,9 @@ class DBManager:
             
             # 查询最高胜率玩家
             c.execute('''
-            WITH player_games AS (
-                SELECT 
-                    player,
-                    COUNT(*) as total_games,
-                    SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END) as wins
-                FROM game_records
-                GROUP BY player
-                HAVING total_games >= 5
-            )
-            SELECT 
-                player,
-                total_games,
-                wins,
-                (wins * 100.0 / total_games) as win_rate
-            FROM player_games
+            SELECT player, games, wins, win_rate
+            FROM player_stats
+            WHERE games >= 5
             ORDER BY win_rate DESC
             LIMIT 1
             ''')
@@ -800,7 +1069,7 @@ class DBManager:
             }
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def submit_bug_report(self, user_id, description, contact=None, system_info=None, images=None):
         """提交Bug报告"""
@@ -833,7 +1102,7 @@ class DBManager:
         """获取Bug报告列表，支持分页和状态筛选"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
             query = '''
@@ -872,13 +1141,13 @@ class DBManager:
             return reports
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
             
     def get_bug_report_by_id(self, report_id):
         """根据ID获取Bug报告详情"""
         conn = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.read_pool.get_connection()
             c = conn.cursor()
             
             c.execute('''
@@ -900,7 +1169,7 @@ class DBManager:
             }
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
+                self.read_pool.release_connection(conn)
         
     def update_bug_report_status(self, report_id, status):
         """更新Bug报告状态"""
@@ -925,4 +1194,8 @@ class DBManager:
             return False, f"更新状态失败: {str(e)}"
         finally:
             if conn:
-                self.connection_pool.release_connection(conn)
\ No newline at end of file
+                self.connection_pool.release_connection(conn)
+
+# 全局单例实例 - 确保所有导入都使用相同的连接池
+def get_instance():
+    return DBManager()
@@ -0,0 +1,469 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from src.utils.hand_codec import decode_hand
+from src.utils.logging_config import get_logger
+
+logger = get_logger("database.archive")
+
+# 归档目录，使用环境变量或默认为当前目录中的hand_archive
+HAND_ARCHIVE_DIR = os.getenv("HAND_ARCHIVE_DIR", "hand_archive")
+# 段文件数量超过该值时合并
+HAND_ARCHIVE_MAX_SEGMENTS = int(os.getenv("HAND_ARCHIVE_MAX_SEGMENTS", "32"))
+# 每次合并的相邻段数量
+HAND_ARCHIVE_MERGE_FACTOR = int(os.getenv("HAND_ARCHIVE_MERGE_FACTOR", "4"))
+
+SEGMENT_MAGIC = b"C32SEG01"
+SEGMENT_SUFFIX = ".seg"
+# 清单文件，记录当前有效的段文件（按时间先后）；不在清单中的段文件是已合并或未完成写入的旧文件
+MANIFEST_NAME = "MANIFEST"
+
+# 段文件头: 魔数, 牌局数, 玩家索引条数, 房间索引条数, 三个索引的偏移, 最早/最晚结束时间(毫秒)
+_HEADER = struct.Struct("<8sIIIQQQQQ")
+# 索引条目: 键(16字节), 结束时间毫秒(大端，使 键+时间 可以按字节比较), 数据偏移, 数据长度
+_ENTRY = struct.Struct(">16sQQI")
+_KEY_SIZE = 16
+_KEY_TIME_SIZE = 24
+_TIME = struct.Struct(">Q")
+_MAX_TIME_MS = 2 ** 64 - 1
+
+
+def _hash_key(value):
+    return hashlib.sha256(value.encode()).digest()[:_KEY_SIZE]
+
+
+def hand_key(hand_id):
+    """牌局ID对应的索引键：UUID直接使用16字节，其余取哈希"""
+    try:
+        parsed = uuid.UUID(hand_id)
+        if str(parsed) == hand_id:
+            return parsed.bytes
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return _hash_key(str(hand_id))
+
+
+def _encode_uvarint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _decode_uvarint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class _IndexKeys:
+    """把 mmap 中的定长索引条目的前 width 个字节当作有序序列，供 bisect 二分查找"""
+
+    def __init__(self, buf, offset, count, width):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.width = width
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * _ENTRY.size
+        return self.buf[start:start + self.width]
+
+
+class Segment:
+    """一个只读的归档段文件，通过 mmap 读取
+
+    文件结构: [文件头][牌局数据][牌局ID索引][玩家索引][房间索引]
+    每条牌局数据为 [varint 房间ID长度][房间ID][hand_codec 编码的记录]，
+    三个索引都是按键排序的定长条目，查询时二分查找，只读取命中的条目和数据。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.hand_count, self.player_count, self.room_count,
+         self.hand_index, self.player_index, self.room_index,
+         self.min_ended_ms, self.max_ended_ms) = _HEADER.unpack_from(self.buf, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"不是归档段文件: {self.path}")
+
+        self.hand_keys = _IndexKeys(self.buf, self.hand_index, self.hand_count, _KEY_SIZE)
+        self.player_keys = _IndexKeys(self.buf, self.player_index, self.player_count, _KEY_TIME_SIZE)
+        self.room_keys = _IndexKeys(self.buf, self.room_index, self.room_count, _KEY_TIME_SIZE)
+
+    def _entry(self, index_offset, i):
+        return _ENTRY.unpack_from(self.buf, index_offset + i * _ENTRY.size)
+
+    def read(self, offset, length):
+        """读取一条牌局数据，返回 (房间ID, 编码后的记录)"""
+        room_length, pos = _decode_uvarint(self.buf, offset)
+        room_id = self.buf[pos:pos + room_length].decode()
+        return room_id, self.buf[pos + room_length:offset + length]
+
+    def find_hand(self, key):
+        """按牌局ID查找，返回 (结束时间毫秒, 偏移, 长度) 或 None"""
+        i = bisect.bisect_left(self.hand_keys, key)
+        if i < self.hand_count and self.hand_keys[i] == key:
+            _, ended_ms, offset, length = self._entry(self.hand_index, i)
+            return ended_ms, offset, length
+        return None
+
+    @staticmethod
+    def _range(keys, key, start_ms, end_ms):
+        lo = bisect.bisect_left(keys, key + _TIME.pack(start_ms))
+        hi = bisect.bisect_left(keys, key + _TIME.pack(end_ms))
+        return lo, hi
+
+    def player_range(self, key, start_ms, end_ms):
+        """玩家在 [start_ms, end_ms) 内的牌局在玩家索引中的范围"""
+        return self._range(self.player_keys, key, start_ms, end_ms)
+
+    def room_range(self, key, end_ms=_MAX_TIME_MS):
+        """房间在 end_ms 之前结束的牌局在房间索引中的范围"""
+        return self._range(self.room_keys, key, 0, end_ms)
+
+    def player_entry(self, i):
+        return self._entry(self.player_index, i)
+
+    def room_entry(self, i):
+        return self._entry(self.room_index, i)
+
+    def iter_hands(self):
+        """按牌局ID索引顺序遍历，返回 (牌局ID键, 结束时间毫秒, 数据偏移, 房间ID, 编码后的记录)"""
+        for i in range(self.hand_count):
+            key, ended_ms, offset, length = self._entry(self.hand_index, i)
+            room_id, data = self.read(offset, length)
+            yield key, ended_ms, offset, room_id, data
+
+    def player_entries(self):
+        for i in range(self.player_count):
+            yield self.player_entry(i)
+
+
+def write_segment(path, hands):
+    """写入一个新的段文件
+
+    Args:
+        path: 目标文件路径，先写入临时文件再原子重命名
+        hands: 可迭代对象，元素为 (hand_id, room_id, ended_at, players, payload)，
+               payload 为 hand_codec 编码的记录，players 为参与的玩家名列表
+
+    Returns:
+        int: 写入的牌局数
+    """
+    return _write_segment(path, (
+        (hand_key(hand_id), int(round(ended_at * 1000)), room_id or "",
+         {_hash_key(name) for name in players}, payload)
+        for hand_id, room_id, ended_at, players, payload in hands
+    ))
+
+
+def _write_segment(path, items):
+    """items 的元素为 (牌局ID键, 结束时间毫秒, 房间ID, 玩家键集合, 编码后的记录)"""
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+    hand_entries = []
+    player_entries = []
+    room_entries = []
+    min_ended_ms = None
+    max_ended_ms = 0
+
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for key, ended_ms, room_id, player_keys, payload in items:
+            room_bytes = room_id.encode()
+            record = _encode_uvarint(len(room_bytes)) + room_bytes + bytes(payload)
+            f.write(record)
+
+            min_ended_ms = ended_ms if min_ended_ms is None else min(min_ended_ms, ended_ms)
+            max_ended_ms = max(max_ended_ms, ended_ms)
+
+            hand_entries.append((key, ended_ms, offset, len(record)))
+            for player_key in player_keys:
+                player_entries.append((player_key, ended_ms, offset, len(record)))
+            room_entries.append((_hash_key(room_id), ended_ms, offset, len(record)))
+            offset += len(record)
+
+        index_offsets = []
+        for entries in (hand_entries, player_entries, room_entries):
+            entries.sort()
+            index_offsets.append(offset)
+            f.write(b"".join(_ENTRY.pack(*entry) for entry in entries))
+            offset += len(entries) * _ENTRY.size
+
+        f.seek(0)
+        f.write(_HEADER.pack(SEGMENT_MAGIC, len(hand_entries), len(player_entries), len(room_entries),
+                             index_offsets[0], index_offsets[1], index_offsets[2],
+                             min_ended_ms or 0, max_ended_ms))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return len(hand_entries)
+
+
+class HandArchive:
+    """牌局历史归档
+
+    已完成的牌局定期从数据库 hands 表滚动写入不可变的段文件（见 DBManager.roll_hand_archive），
+    查询通过每个段的索引二分查找，复杂度为 O(段数 * log n)，不需要把段文件读入内存。
+    段按牌局数分层，出现 HAND_ARCHIVE_MERGE_FACTOR 个同层的相邻段时合并为一个段（相邻段的时间范围连续，
+    合并后段的顺序仍按时间排列），每手牌被重写的次数只随总量对数增长；
+    段数仍超过 HAND_ARCHIVE_MAX_SEGMENTS 时合并牌局数最少的一组相邻段。
+
+    当前有效的段记录在清单文件中，合并后先更新清单再删除旧段；
+    删除失败（例如 Windows 上仍被 mmap 映射）的旧段不会再被加载，下次启动或合并时再清理。
+    """
+
+    def __init__(self, directory=HAND_ARCHIVE_DIR, max_segments=HAND_ARCHIVE_MAX_SEGMENTS,
+                 merge_factor=HAND_ARCHIVE_MERGE_FACTOR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_segments = max(max_segments, 1)
+        self.merge_factor = max(merge_factor, 2)
+        # 写入（滚动、合并）串行执行；读取使用 segments 的快照，不需要加锁
+        self.write_lock = threading.Lock()
+        self.segments = self._load_segments()
+
+    @property
+    def manifest_path(self):
+        return self.directory / MANIFEST_NAME
+
+    def _read_manifest(self):
+        """返回清单中的段文件名列表，没有清单时返回 None"""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)["segments"]
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, segments):
+        """原子地替换清单文件"""
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segments": [segment.path.name for segment in segments]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def _load_segments(self):
+        names = self._read_manifest()
+        if names is None:
+            # 旧版本的归档目录没有清单，加载全部段文件（文件名按时间排序）
+            names = sorted(path.name for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+        segments = []
+        for name in names:
+            try:
+                segments.append(Segment(self.directory / name))
+            except Exception as e:
+                logger.error("无法打开归档段 %s: %s", name, str(e))
+        self._write_manifest(segments)
+        self._remove_stale_segments(segments)
+        if segments:
+            logger.info("已加载 %s 个归档段，共 %s 手牌", len(segments), sum(s.hand_count for s in segments))
+        return segments
+
+    def _remove_stale_segments(self, segments):
+        """删除不在清单中的段文件，删除失败的留到下次再删"""
+        live = {segment.path.name for segment in segments}
+        for path in self.directory.iterdir():
+            if path.name in live or not (path.name.endswith(SEGMENT_SUFFIX) or path.name.endswith(".seg.tmp")):
+                continue
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.debug("暂时无法删除旧的归档段 %s: %s", path, str(e))
+
+    def _new_segment_path(self):
+        # 文件名按时间排序，新段总在最后
+        return self.directory / f"{time.time_ns():020d}{SEGMENT_SUFFIX}"
+
+    @property
+    def hand_count(self):
+        return sum(segment.hand_count for segment in self.segments)
+
+    def append(self, hands):
+        """把一批牌局写成一个新段，返回写入的牌局数"""
+        with self.write_lock:
+            path = self._new_segment_path()
+            count = write_segment(path, hands)
+            if count == 0:
+                path.unlink()
+                return 0
+            segments = self.segments + [Segment(path)]
+            self._write_manifest(segments)
+            self.segments = segments
+            logger.info("已写入归档段 %s（%s 手牌）", path.name, count)
+
+            while True:
+                window = self._merge_window()
+                if window is None:
+                    break
+                self._compact(*window)
+            return count
+
+    def _tier(self, segment):
+        """按牌局数分层：同一层的段大小相差不超过 merge_factor 倍"""
+        tier, size = 0, segment.hand_count
+        while size >= self.merge_factor:
+            size //= self.merge_factor
+            tier += 1
+        return tier
+
+    def _merge_window(self):
+        """需要合并的相邻段 (起始下标, 数量)，不需要合并时返回 None
+
+        优先合并最新的 merge_factor 个同层相邻段，每手牌只在升层时被重写；
+        段数仍超过上限时合并牌局总数最少的一组相邻段。
+        """
+        width = self.merge_factor
+        tiers = [self._tier(segment) for segment in self.segments]
+        for start in range(len(tiers) - width, -1, -1):
+            if len(set(tiers[start:start + width])) == 1:
+                return start, width
+
+        if len(self.segments) <= self.max_segments:
+            return None
+        width = min(width, len(self.segments))
+        sizes = [segment.hand_count for segment in self.segments]
+        return min(range(len(sizes) - width + 1), key=lambda i: sum(sizes[i:i + width])), width
+
+    def _compact(self, start, width):
+        """把一组相邻的段合并为一个段"""
+        merged = self.segments[start:start + width]
+
+        def merged_items():
+            # 直接复制已编码的数据和索引键，不需要解码；同一手牌只保留最新段中的一份
+            seen = set()
+            for segment in reversed(merged):
+                player_keys = {}
+                for key, _, offset, _ in segment.player_entries():
+                    player_keys.setdefault(offset, set()).add(key)
+                for key, ended_ms, offset, room_id, data in segment.iter_hands():
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield key, ended_ms, room_id, player_keys.get(offset, ()), data
+
+        path = self._new_segment_path()
+        count = _write_segment(path, merged_items())
+        segments = self.segments[:start] + [Segment(path)] + self.segments[start + width:]
+        self._write_manifest(segments)
+        self.segments = segments
+        # 正在进行的查询仍持有旧段的引用；删除失败的文件已不在清单中，之后再清理
+        self._remove_stale_segments(segments)
+        logger.info("已合并 %s 个归档段（%s 手牌）", width, count)
+
+    def get_hand(self, hand_id):
+        """按牌局ID读取，返回 (房间ID, 牌局记录) 或 None"""
+        key = hand_key(hand_id)
+        for segment in reversed(self.segments):
+            found = segment.find_hand(key)
+            if found:
+                _, offset, length = found
+                room_id, data = segment.read(offset, length)
+                return room_id, decode_hand(data)
+        return None
+
+    def player_hands(self, player, start_time=None, end_time=None, limit=20):
+        """玩家在时间范围 [start_time, end_time) 内的牌局，按结束时间倒序
+
+        Returns:
+            list: [(房间ID, 牌局记录), ...]
+        """
+        key = _hash_key(player)
+        start_ms = int(round(start_time * 1000)) if start_time is not None else 0
+        end_ms = int(round(end_time * 1000)) if end_time is not None else _MAX_TIME_MS
+
+        # 每个段最多取 limit 条最新的条目，再合并
+        candidates = []
+        for segment in self.segments:
+            if segment.max_ended_ms < start_ms or segment.min_ended_ms >= end_ms:
+                continue
+            lo, hi = segment.player_range(key, start_ms, end_ms)
+            for i in range(hi - 1, max(lo, hi - limit) - 1, -1):
+                _, ended_ms, offset, length = segment.player_entry(i)
+                candidates.append((ended_ms, segment, offset, length))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        results = []
+        for _, segment, offset, length in candidates:
+            room_id, data = segment.read(offset, length)
+            record = decode_hand(data)
+            # 键是哈希，确认玩家确实在这手牌中
+            if any(p.get("name") == player for p in record.get("players", [])):
+                results.append((room_id, record))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def count_room_hands(self, room_id):
+        key = _hash_key(room_id)
+        total = 0
+        for segment in self.segments:
+            lo, hi = segment.room_range(key)
+            total += hi - lo
+        return total
+
+    def room_hands(self, room_id, limit=20, before=None):
+        """房间的牌局，按 (结束时间, 牌局ID) 倒序
+
+        Args:
+            before: 可选，(结束时间, 牌局ID)，只返回排在该牌局之后（更早）的牌局
+        """
+        key = _hash_key(room_id)
+        end_ms = _MAX_TIME_MS
+        before_ms = before_id = None
+        if before is not None:
+            before_ms = int(round(before[0] * 1000))
+            before_id = str(before[1])
+            end_ms = before_ms + 1
+
+        results = []
+        # 凑够一页后，只再收集与最后一条结束时间相同的牌局，排序后再截断
+        threshold = None
+        # 新段中的牌局更晚，从最后一个段开始
+        for segment in reversed(self.segments):
+            if threshold is not None and segment.max_ended_ms < threshold:
+                break
+            lo, hi = segment.room_range(key, end_ms)
+            for i in range(hi - 1, lo - 1, -1):
+                _, ended_ms, data_offset, length = segment.room_entry(i)
+                if threshold is not None and ended_ms < threshold:
+                    break
+                stored_room, data = segment.read(data_offset, length)
+                if stored_room != room_id:
+                    continue
+                record = decode_hand(data)
+                hand_id = str(record.get("game_id"))
+                if ended_ms == before_ms and hand_id >= before_id:
+                    continue
+                results.append((ended_ms, hand_id, record))
+                if threshold is None and len(results) >= limit:
+                    threshold = ended_ms
+
+        results.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return [record for _, _, record in results[:limit]]
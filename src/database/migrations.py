@@ -0,0 +1,135 @@
+import sqlite3
+
+from src.utils.logging_config import get_logger
+
+logger = get_logger("database.migrations")
+
+
+def _add_user_profile_columns(conn):
+    """users 表添加 email / avatar 字段（原 db_upgrade.py 的升级内容）"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if "email" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN email TEXT")
+    if "avatar" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN avatar TEXT")
+
+
+def _create_player_stats(conn):
+    """创建玩家统计汇总表并从已有游戏记录回填"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS player_stats (
+        player TEXT PRIMARY KEY,
+        games INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        draws INTEGER NOT NULL DEFAULT 0,
+        total_buy_in INTEGER NOT NULL DEFAULT 0,
+        total_cash_out INTEGER NOT NULL DEFAULT 0,
+        profit INTEGER NOT NULL DEFAULT 0,
+        win_rate REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_stats_win_rate ON player_stats (win_rate DESC, games DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_stats_profit ON player_stats (profit DESC)')
+
+    # 之前版本可能已经创建并填充了汇总表，只在为空时回填
+    if conn.execute('SELECT EXISTS (SELECT 1 FROM player_stats)').fetchone()[0]:
+        return
+
+    cursor = conn.execute('''
+    INSERT INTO player_stats (player, games, wins, losses, draws, total_buy_in, total_cash_out, profit, win_rate)
+    SELECT
+        player,
+        COUNT(*),
+        SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END),
+        SUM(CASE WHEN cash_out < buy_in THEN 1 ELSE 0 END),
+        SUM(CASE WHEN cash_out = buy_in THEN 1 ELSE 0 END),
+        SUM(buy_in),
+        SUM(cash_out),
+        SUM(cash_out - buy_in),
+        SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
+    FROM game_records
+    GROUP BY player
+    ''')
+    if cursor.rowcount > 0:
+        logger.info("已从游戏记录回填 %s 名玩家的统计数据", cursor.rowcount)
+
+
+def _add_game_records_indexes(conn):
+    """为游戏记录的常用查询添加索引"""
+    # 按玩家查询并按时间排序、按玩家计数
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_records_player_ts ON game_records (player, timestamp, id)')
+    # 按房间查询
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_records_room ON game_records (room_id)')
+    # 全部记录按时间分页（键集分页使用 (timestamp, id)）
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_records_ts_id ON game_records (timestamp, id)')
+
+
+def _create_hands(conn):
+    """创建牌局历史表，每手牌一行"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS hands (
+        hand_id TEXT PRIMARY KEY,
+        room_id TEXT NOT NULL,
+        ended_at REAL NOT NULL,
+        payload TEXT NOT NULL
+    )
+    ''')
+    # 按房间倒序分页
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hands_room_ended ON hands (room_id, ended_at)')
+
+
+def _add_hands_keyset_index(conn):
+    """牌局历史按 (结束时间, 牌局ID) 键集分页，替换只包含结束时间的索引"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hands_room_ended_id ON hands (room_id, ended_at, hand_id)')
+    conn.execute('DROP INDEX IF EXISTS idx_hands_room_ended')
+
+
+# 按版本号顺序排列的迁移: (版本号, 说明, 迁移函数)
+# 新迁移只能追加到末尾，已发布的迁移不能修改
+MIGRATIONS = [
+    (1, "users 表添加 email / avatar 字段", _add_user_profile_columns),
+    (2, "创建 player_stats 汇总表", _create_player_stats),
+    (3, "game_records 添加查询索引", _add_game_records_indexes),
+    (4, "创建 hands 牌局历史表", _create_hands),
+    (5, "hands 添加键集分页索引", _add_hands_keyset_index),
+]
+
+
+def get_schema_version(conn):
+    """读取数据库的结构版本号（PRAGMA user_version）"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """把数据库升级到最新结构版本
+
+    每个迁移与版本号更新在同一个事务中执行，失败时回滚，
+    数据库保持在上一个版本，可以安全地重复运行。
+
+    Returns:
+        list: 本次执行的迁移版本号
+    """
+    applied = []
+    current_version = get_schema_version(conn)
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info("执行数据库迁移 %s: %s", version, description)
+        try:
+            # 立即获取写锁，避免与其他写入交错
+            conn.execute("BEGIN IMMEDIATE")
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            logger.error("数据库迁移 %s 失败: %s", version, str(e))
+            raise
+
+        applied.append(version)
+        current_version = version
+
+    return applied
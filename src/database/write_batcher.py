@@ -0,0 +1,246 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from src.utils.logging_config import get_logger
+from src.utils.metrics import DB_OPERATION_SECONDS, DB_ERRORS_TOTAL
+
+logger = get_logger("database.batcher")
+
+# 默认每50ms或累计200行提交一次
+BATCH_FLUSH_INTERVAL = 0.05
+BATCH_MAX_ROWS = 200
+# 数据库被锁等暂时性错误时，整批重试的次数和首次重试前的等待时间（秒，之后翻倍）
+BATCH_MAX_ATTEMPTS = 3
+BATCH_RETRY_DELAY = 0.1
+
+
+class WriteBatcher:
+    """写入批处理服务
+
+    调用方提交的行先进入内存缓冲区，后台线程每隔 flush_interval 秒或
+    累计 max_rows 行时，用一个连接、一个事务把所有缓冲的行写入数据库
+    （同类写入使用 executemany），只提交一次。
+
+    每种写入（kind）对应一个处理函数 handler(conn, rows)，在同一事务内执行，
+    因此也可以在写入记录的同时更新汇总表。
+
+    失败处理:
+        prepare(row) 在打开事务之前逐行执行（例如编码），失败只影响该行
+        每种写入在自己的 SAVEPOINT 中执行，处理函数出错只回滚并拒绝该类型的行
+        sqlite3.OperationalError（数据库被锁等）回滚整个事务，等待后整批重试
+    """
+
+    def __init__(self, connection_pool, flush_interval=BATCH_FLUSH_INTERVAL, max_rows=BATCH_MAX_ROWS):
+        self.connection_pool = connection_pool
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+
+        self.handlers = {}
+        self.preparers = {}
+        # 每次提交成功后调用的回调 callback(kinds)，用于缓存失效等
+        self.flush_listeners = []
+
+        # 待写入的行: [(kind, row, future)]
+        self.pending = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # 保证同一时间只有一个线程在执行 flush
+        self.flush_lock = threading.Lock()
+
+    def register(self, kind, handler, prepare=None):
+        """注册一种写入的处理函数 handler(conn, rows)
+
+        Args:
+            prepare: 可选，prepare(row) 返回交给 handler 的行，在事务之外执行
+        """
+        self.handlers[kind] = handler
+        if prepare is not None:
+            self.preparers[kind] = prepare
+
+    def register_statement(self, kind, sql, prepare=None):
+        """注册一种只需执行一条参数化 SQL 的写入"""
+        def handler(conn, rows):
+            conn.executemany(sql, rows)
+        self.register(kind, handler, prepare)
+
+    def add_flush_listener(self, callback):
+        """注册提交成功后的回调，回调签名为 callback(kinds)"""
+        if callback not in self.flush_listeners:
+            self.flush_listeners.append(callback)
+
+    def start(self):
+        """启动后台写入线程"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="db-write-batcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """停止后台线程并写入剩余的行"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout=5.0)
+        self.flush()
+
+    def submit(self, kind, row, durable=False, timeout=10.0):
+        """提交一行待写入的数据
+
+        Args:
+            kind (str): 写入类型，需要先 register
+            row (tuple): 参数
+            durable (bool): 为True时阻塞到该行所在的事务提交完成
+            timeout (float): durable 模式下的最长等待时间
+
+        Returns:
+            Future: 事务提交后完成；durable 模式下直接返回写入结果
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown write kind: {kind}")
+
+        future = Future()
+        with self.condition:
+            self.pending.append((kind, row, future))
+            if len(self.pending) >= self.max_rows or durable:
+                # 行数达到上限，或调用方在等待确认，立即唤醒写入线程
+                self.condition.notify()
+
+        if not self.running:
+            # 后台线程未运行（例如脚本中使用），同步写入
+            self.flush()
+
+        if durable:
+            return future.result(timeout=timeout)
+        return future
+
+    def _run(self):
+        """后台线程：按时间或行数触发写入"""
+        while True:
+            with self.condition:
+                if self.running and len(self.pending) < self.max_rows:
+                    self.condition.wait(self.flush_interval)
+                if not self.running and not self.pending:
+                    break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("Error flushing write batch: %s", str(e))
+
+    def flush(self):
+        """把当前缓冲的所有行在一个事务中写入数据库"""
+        with self.flush_lock:
+            with self.condition:
+                if not self.pending:
+                    return 0
+                batch = self.pending
+                self.pending = []
+
+            # 在事务之外准备各行，按类型分组并保持提交顺序
+            grouped = {}
+            for kind, row, future in batch:
+                prepare = self.preparers.get(kind)
+                if prepare is not None:
+                    try:
+                        row = prepare(row)
+                    except Exception as e:
+                        DB_ERRORS_TOTAL.inc("batch_prepare")
+                        logger.error("准备 %s 写入失败，丢弃该行: %s", kind, str(e))
+                        future.set_exception(e)
+                        continue
+                rows, futures = grouped.setdefault(kind, ([], []))
+                rows.append(row)
+                futures.append(future)
+
+            if not grouped:
+                return 0
+
+            delay = BATCH_RETRY_DELAY
+            for attempt in range(1, BATCH_MAX_ATTEMPTS + 1):
+                try:
+                    failed = self._write(grouped)
+                    break
+                except sqlite3.OperationalError as e:
+                    DB_ERRORS_TOTAL.inc("batch_flush")
+                    if attempt == BATCH_MAX_ATTEMPTS:
+                        logger.error("批量写入失败（已重试 %s 次）: %s", attempt, str(e))
+                        for _, futures in grouped.values():
+                            for future in futures:
+                                future.set_exception(e)
+                        return 0
+                    logger.warning("批量写入暂时失败，%.2f 秒后重试: %s", delay, str(e))
+                    time.sleep(delay)
+                    delay *= 2
+                except Exception as e:
+                    DB_ERRORS_TOTAL.inc("batch_flush")
+                    logger.error("批量写入失败: %s", str(e))
+                    for _, futures in grouped.values():
+                        for future in futures:
+                            future.set_exception(e)
+                    return 0
+
+            written = 0
+            for kind, (rows, futures) in grouped.items():
+                error = failed.get(kind)
+                for future in futures:
+                    if error is None:
+                        future.set_result(True)
+                    else:
+                        future.set_exception(error)
+                if error is None:
+                    written += len(rows)
+
+            kinds = [kind for kind in grouped if kind not in failed]
+            logger.debug("批量写入完成: %s 行, 类型: %s", written, kinds)
+
+            if kinds:
+                for callback in list(self.flush_listeners):
+                    try:
+                        callback(kinds)
+                    except Exception as e:
+                        logger.error("Error notifying flush listener: %s", str(e))
+
+            return written
+
+    def _write(self, grouped):
+        """在一个事务中写入各类型的行，每种类型使用一个 SAVEPOINT
+
+        Returns:
+            dict: 写入失败的类型 -> 异常，这些类型的修改已回滚
+
+        Raises:
+            sqlite3.OperationalError: 暂时性错误，整个事务已回滚
+        """
+        start = time.perf_counter()
+        failed = {}
+        conn = self.connection_pool.get_connection()
+        try:
+            # 立即获取写锁，数据库被锁时在写入任何行之前就失败
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for kind, (rows, _) in grouped.items():
+                    conn.execute("SAVEPOINT batch_kind")
+                    try:
+                        self.handlers[kind](conn, rows)
+                    except sqlite3.OperationalError:
+                        raise
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO batch_kind")
+                        DB_ERRORS_TOTAL.inc("batch_flush")
+                        logger.error("批量写入 %s 失败（%s 行），已回滚该类型: %s", kind, len(rows), str(e))
+                        failed[kind] = e
+                    conn.execute("RELEASE batch_kind")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            self.connection_pool.release_connection(conn)
+            DB_OPERATION_SECONDS.observe(time.perf_counter() - start, "batch_flush")
+        return failed
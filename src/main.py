@@ -1,13 +1,22 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Header, Query, HTTPException
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import json
 import time
 import asyncio
-import jwt
-import traceback
+import logging
 from typing import Optional, Dict, Any
 
+from src.utils.logging_config import get_logger, log_sampled
+from src.utils.metrics import registry as metrics_registry, WS_MESSAGE_SECONDS, WS_MESSAGES_TOTAL, WS_RATE_LIMITED_TOTAL
+from src.utils.rate_limit import ConnectionRateLimiter
+
+logger = get_logger("poker.ws")
+
+# 指标中使用的消息类型标签，其余类型统一记为 other
+WS_MESSAGE_TYPES = ("ping", "game_action", "room_action", "chat")
+
 # First get the RoomManager instance
 from src.managers.room_manager import get_instance, GLOBAL_ROOMS
 room_manager = get_instance()
@@ -16,39 +25,53 @@ rooms = room_manager.get_all_rooms()
 print(f"Initial rooms: {rooms}")
 
 # Import websocket manager
-from src.websocket_manager import ws_manager
+from src.websocket_manager import ws_manager, WS_PING_INTERVAL, WS_PING_TIMEOUT
+from src.managers.lobby_manager import lobby_manager
+from src.database.async_db import async_db
 
 # Then import route modules
-from src.api_routes import routers as api_routers
+from src.api_routes import routers as api_routers, token_cache
 from src.room_routes import router as room_router
 from src.bug_routes import bug_router
 
 # Import the timer update task from game.py
-from src.models.game import timer_update_task
+from src.models.game import timer_update_task, HAND_HISTORY_PAGE_SIZE, HAND_HISTORY_MAX_PAGE_SIZE
+from src.models.seat_state import PRIVATE_FIELDS
 
 # Inject room_manager instance to route modules
 import src.room_routes as room_routes
 room_routes.room_manager = room_manager
 
-# Authentication settings
-SECRET_KEY = "c32poker_secret_key"  # Match the key in api_routes.py
-ALGORITHM = "HS256"
-
 # Define startup event
 async def startup_event():
     print("Application starting...")
     rooms = room_manager.get_all_rooms()
     print(f"Rooms at startup: {rooms}")
     
+    # 绑定主事件循环，后台线程（房间清理等）通过它发送WebSocket消息
+    ws_manager.bind_loop(asyncio.get_running_loop())
+    
     # Start timer update task from game.py
     asyncio.create_task(timer_update_task())
     print("Timer update task started")
+    
+    # Start lobby incremental update task
+    asyncio.create_task(lobby_manager.run())
+    print("Lobby update task started")
+    
+    # 批量更新已断开连接的玩家在线状态
+    ws_manager.offline_handler = mark_clients_offline
+    asyncio.create_task(ws_manager.run_reaper())
+    print("Connection reaper task started")
 
 # Define shutdown event
 async def shutdown_event():
     print("Application stopping...")
     rooms = room_manager.get_all_rooms()
     print(f"Rooms at shutdown: {rooms}")
+    
+    # 关闭数据库线程池
+    async_db.shutdown(wait=False)
 
 app = FastAPI(
     title="C32 Poker API",
@@ -81,27 +104,177 @@ for router in api_routers:
 app.include_router(room_router, prefix="/api")  # Room-related routes
 app.include_router(bug_router, prefix="/api")  # Bug report routes
 
+# Prometheus metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# 房间删除后丢弃该房间的指标序列，避免标签无限增长
+def _forget_room_metrics(event, room_id):
+    if event == "room_removed":
+        metrics_registry.remove_label_value("room", room_id)
+
+room_manager.add_listener(_forget_room_metrics)
+
+# 房间删除后释放该房间的广播补发缓冲区
+def _forget_room_replay(event, room_id):
+    if event == "room_removed":
+        ws_manager.drop_replay_buffer(room_id)
+
+room_manager.add_listener(_forget_room_replay)
+
 # Helper function to check if the provided token is valid
 def verify_token(token: str) -> Optional[str]:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # 与 REST 接口共用已验证令牌缓存
+        payload = token_cache.verify(token)
         username = payload.get("sub")
         return username
     except Exception as e:
-        print(f"Token verification error: {str(e)}")
+        logger.warning("Token verification error: %s", str(e))
         return None
 
+# Lobby WebSocket endpoint: initial room list, then incremental room events
+@app.websocket("/ws/lobby")
+async def lobby_websocket_endpoint(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None)
+):
+    if not token:
+        logger.debug("Missing token in lobby WebSocket connection")
+        await websocket.close(code=1008, reason="Missing authentication token")
+        return
+    
+    username = verify_token(token)
+    if not username:
+        logger.debug("Invalid token in lobby WebSocket connection")
+        await websocket.close(code=1008, reason="Invalid token")
+        return
+    
+    try:
+        await lobby_manager.connect(websocket)
+        
+        # The lobby is push-only, clients only send heartbeats
+        while True:
+            data = await websocket.receive_json()
+            if data.get("type") == "ping":
+                await websocket.send_json({
+                    "type": "pong",
+                    "timestamp": time.time()
+                })
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error("Error in lobby websocket handling: %s", str(e))
+    finally:
+        lobby_manager.disconnect(websocket)
+
+async def mark_clients_offline(room_id: str, usernames: list):
+    """连接清理任务回调：把同一房间内已断开的玩家一次性标记为离线并通知其他人"""
+    room = room_manager.get_room(room_id)
+    if room:
+        for username in usernames:
+            room.player_online_status(username, False)
+    logger.debug("Marked %d players offline in room %s: %s", len(usernames), room_id, usernames)
+    
+    await ws_manager.broadcast_to_room(
+        room_id,
+        {
+            "type": "players_disconnected",
+            "data": {
+                "player_ids": usernames,
+                "timestamp": time.time()
+            }
+        }
+    )
+
+async def handle_game_disconnect(websocket: WebSocket, client_id: str, room_id: Optional[str], username: str):
+    """处理游戏连接断开
+    
+    连接已被清理任务移除（离线状态由清理任务批量处理）或已被同一玩家的新连接替换时不做任何处理。
+    """
+    if not ws_manager.owns_connection(client_id, websocket):
+        logger.debug("Stale WebSocket closed for client: %s", client_id)
+        return
+    
+    logger.debug("WebSocket disconnected for client: %s", client_id)
+    ws_manager.disconnect(client_id)
+    
+    if not room_id:
+        return
+    
+    # 更新玩家在线状态为false
+    room = room_manager.get_room(room_id)
+    if room:
+        room.player_online_status(username, False)
+        logger.debug("Game WebSocket: 更新玩家 %s 的在线状态为False", username)
+    
+    # Notify others that player has disconnected
+    await ws_manager.broadcast_to_room(
+        room_id,
+        {
+            "type": "player_disconnected",
+            "data": {
+                "player_id": username,
+                "timestamp": time.time()
+            }
+        }
+    )
+
+async def spectator_websocket_session(websocket: WebSocket, room, username: str):
+    """观众连接：只读，只接收房间广播的公开消息，不出现在房间玩家列表中"""
+    room_id = room.room_id
+    await websocket.accept()
+    if not ws_manager.add_spectator(room_id, websocket):
+        await websocket.close(code=1013, reason="Too many spectators")
+        return
+    logger.debug("Spectator %s joined room %s", username, room_id)
+    
+    try:
+        # 初始状态与后续广播走同一个队列，延迟观战时也不会提前看到当前局面
+        ws_manager.send_to_spectator(room_id, websocket, {
+            "type": "game_state",
+            "data": room.get_state(),
+            "spectator": True
+        })
+        
+        while True:
+            data = await websocket.receive_json()
+            if data.get("type") == "ping":
+                await websocket.send_json({
+                    "type": "pong",
+                    "timestamp": time.time()
+                })
+            else:
+                await websocket.send_json({
+                    "type": "error",
+                    "data": {
+                        "message": "Spectators cannot send game messages",
+                        "timestamp": time.time()
+                    }
+                })
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error("Error in spectator websocket handling: %s", str(e))
+    finally:
+        ws_manager.remove_spectator(room_id, websocket)
+        logger.debug("Spectator %s left room %s", username, room_id)
+
 # Add game-specific WebSocket endpoint, requires token authentication
 @app.websocket("/ws/game/{room_id}")
 async def game_websocket_endpoint(
     websocket: WebSocket, 
     room_id: str, 
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    spectate: bool = Query(False),
+    stream_id: Optional[str] = Query(None),
+    last_seq: Optional[int] = Query(None)
 ):
     client_id = None
     
     if not token:
-        print(f"Missing token in game WebSocket connection for room {room_id}")
+        logger.debug("Missing token in game WebSocket connection for room %s", room_id)
         await websocket.close(code=1008, reason="Missing authentication token")
         return
     
@@ -109,17 +282,26 @@ async def game_websocket_endpoint(
     try:
         username = verify_token(token)
         if not username:
-            print(f"Invalid token in game WebSocket connection for room {room_id}")
+            logger.debug("Invalid token in game WebSocket connection for room %s", room_id)
             await websocket.close(code=1008, reason="Invalid token")
             return
         
         # Use username as client_id for this connection
         client_id = username
         
-        # Check if user is in the room
         room = room_manager.get_room(room_id)
+        
+        # 观战不要求是房间成员
+        if spectate:
+            if not room:
+                await websocket.close(code=1008, reason="Room not found")
+                return
+            await spectator_websocket_session(websocket, room, username)
+            return
+        
+        # Check if user is in the room
         if not room or username not in room.players:
-            print(f"User {username} not in room {room_id}")
+            logger.debug("User %s not in room %s", username, room_id)
             await websocket.close(code=1008, reason="Not a member of this room")
             return
         
@@ -128,13 +310,13 @@ async def game_websocket_endpoint(
             # Reconnection
             reconnect_success = await ws_manager.reconnect(websocket, client_id, room_id)
             if not reconnect_success:
-                print(f"Reconnection failed for client {client_id}")
+                logger.debug("Reconnection failed for client %s", client_id)
                 return
             
             # 更新玩家在线状态
             if room:
                 room.player_online_status(username, True)
-                print(f"Game WebSocket: 更新玩家 {username} 的在线状态为True")
+                logger.debug("Game WebSocket: 更新玩家 %s 的在线状态为True", username)
         else:
             # New connection
             await ws_manager.connect(websocket, client_id, room_id)
@@ -142,12 +324,20 @@ async def game_websocket_endpoint(
         # Add client to room in websocket manager
         ws_manager.add_client_to_room(room_id, client_id)
         
+        # 重连的客户端带上最后收到的广播序号时，只补发错过的消息和 resumed 标记；
+        # 缺口超出缓冲区或服务器已重启时发送完整状态
+        resumed = await ws_manager.resume(room_id, client_id, stream_id, last_seq)
+        if resumed:
+            if room.game:
+                await ws_manager.send_player_specific_state(client_id, room.game.get_player_hand(username))
+        
         # Send initial state to client
-        game_state = room.get_state() if room else None
+        game_state = room.get_state() if room and not resumed else None
         if game_state:
             await websocket.send_json({
                 "type": "game_state",
-                "data": game_state
+                "data": game_state,
+                **ws_manager.stream_position(room_id)
             })
             # Get player's hand if game is active
             player_hand = room.game.get_player_hand(username) if room.game else [None, None]
@@ -167,16 +357,52 @@ async def game_websocket_endpoint(
             }
         )
         
+        # 每个连接独立限流
+        rate_limiter = ConnectionRateLimiter()
+        
         # Main message loop
+        # 上一条消息的处理耗时在下一轮开始时记录（处理分支中可能直接 continue）
+        message_labels = None
+        message_start = 0.0
         while True:
             try:
+                if message_labels is not None:
+                    WS_MESSAGE_SECONDS.observe(time.perf_counter() - message_start, *message_labels)
+                    message_labels = None
+                
                 # Check connection status
                 if websocket.client_state.value == 2:  # WebSocketState.DISCONNECTED
-                    print(f"WebSocket already disconnected, stopping message loop: {client_id}")
+                    logger.debug("WebSocket already disconnected, stopping message loop: %s", client_id)
                     break
                 
                 data = await websocket.receive_json()
+                message_start = time.perf_counter()
                 message_type = data.get("type")
+                message_labels = (room_id, message_type if message_type in WS_MESSAGE_TYPES else "other")
+                WS_MESSAGES_TOTAL.inc(*message_labels)
+                if logger.isEnabledFor(logging.DEBUG):
+                    # 采样键在级别启用时才构造
+                    log_sampled(logger, logging.DEBUG, f"ws_message:{message_type}", 100,
+                                "Received %s message from %s in room %s", message_type, client_id, room_id)
+                
+                verdict = rate_limiter.check(message_type)
+                if verdict != ConnectionRateLimiter.ALLOW:
+                    WS_RATE_LIMITED_TOTAL.inc(message_labels[1], verdict)
+                    if verdict == ConnectionRateLimiter.DISCONNECT:
+                        logger.warning("Client %s exceeded rate limits in room %s, disconnecting", client_id, room_id)
+                        await handle_game_disconnect(websocket, client_id, room_id, username)
+                        await websocket.close(code=1008, reason="Rate limit exceeded")
+                        break
+                    if rate_limiter.should_notify(message_type):
+                        await websocket.send_json({
+                            "type": "error",
+                            "data": {
+                                "message": "Too many messages, please slow down",
+                                "code": "rate_limited",
+                                "timestamp": time.time()
+                            }
+                        })
+                    continue
                 
                 # Process different message types
                 if message_type == "ping":
@@ -209,11 +435,7 @@ async def game_websocket_endpoint(
                     
                     try:
                         # 找到玩家位置索引
-                        player_position = None
-                        for position, player in room.game.players.items():
-                            if player.get('name') == username or player.get('username') == username:
-                                player_position = position
-                                break
+                        player_position = room.game.get_player_position(username)
                         
                         if player_position is None:
                             result = {"success": False, "message": "Player not found in game"}
@@ -265,6 +487,11 @@ async def game_websocket_endpoint(
                             # Get updated game state
                             updated_state = room.get_state()
                             
+                            # 弃掉的牌只发给本人（随下面的 player_hand 消息发送），
+                            # 房间广播同时发给观众并写入重连补发缓冲区
+                            public_result = {key: value for key, value in result.items()
+                                             if key not in PRIVATE_FIELDS}
+                            
                             # Broadcast game update to all players in the room
                             await ws_manager.broadcast_to_room(
                                 room_id,
@@ -274,7 +501,7 @@ async def game_websocket_endpoint(
                                         "action": action,
                                         "player": username,
                                         "amount": amount,
-                                        "result": result,
+                                        "result": public_result,
                                         "game_state": updated_state,
                                         "is_key_update": True,
                                         "timestamp": time.time(),
@@ -302,8 +529,7 @@ async def game_websocket_endpoint(
                             })
                     
                     except Exception as e:
-                        print(f"Error processing game action: {str(e)}")
-                        traceback.print_exc()
+                        logger.exception("Error processing game action: %s", str(e))
                         await websocket.send_json({
                             "type": "error",
                             "data": {
@@ -359,7 +585,7 @@ async def game_websocket_endpoint(
                             else:
                                 # Call the room's buy_in method
                                 result = room.player_buy_in(username, float(amount), int(seat_index))
-                                print(f"Buy-in result: {result}")
+                                logger.debug("Buy-in result: %s", result)
                         
                         elif action == "stand_up":
                             # Call the room's stand_up method
@@ -384,30 +610,32 @@ async def game_websocket_endpoint(
                         elif action == "get_game_history":
                             # Get game history from the room
                             try:
-                                # 检查游戏是否已开始
-                                if room.game:
-                                    history = room.game.get_game_history()
-                                else:
-                                    # 如果游戏尚未开始，返回空历史记录
-                                    history = []
+                                # 键集分页：before 为上一页最早一手牌的ID，不传时从最近一手牌开始
+                                limit = min(max(int(data.get("limit", HAND_HISTORY_PAGE_SIZE)), 1), HAND_HISTORY_MAX_PAGE_SIZE)
+                                before = data.get("before")
                                 
-                                result = {
-                                    "success": True,
-                                    "message": "Game history retrieved",
-                                    "history": history  # 现在history是一个包含更多详细信息的对象
-                                }
+                                # 多取一手牌判断是否还有更早的记录；最近的牌局在内存中，更早的从数据库读取
+                                history = room.game.get_game_history(limit + 1, before) if room.game else None
+                                if history is None:
+                                    history = await async_db.get_room_hands(target_room_id, limit + 1, before)
+                                    history.reverse()  # 数据库按时间倒序返回，统一为时间先后顺序
+                                has_more = len(history) > limit
+                                history = history[-limit:]
                                 
                                 # 直接发送给请求的玩家
                                 await websocket.send_json({
                                     "type": "game_history",
-                                    "data": history  # 直接发送历史数据对象
+                                    "data": history,
+                                    "limit": limit,
+                                    "before": before,
+                                    "next_before": history[0].get("game_id") if history else None,
+                                    "has_more": has_more
                                 })
                                 
                                 # 立即返回，避免后续的广播处理
                                 continue
                             except Exception as e:
-                                import traceback
-                                traceback.print_exc()
+                                logger.exception("Error retrieving game history: %s", str(e))
                                 result = {
                                     "success": False,
                                     "message": f"Error retrieving game history: {str(e)}"
@@ -448,6 +676,9 @@ async def game_websocket_endpoint(
                         
                         # If action was successful, broadcast the updated room state
                         if result.get("success"):
+                            # Seats, chips and status are visible in the lobby
+                            room_manager.room_changed(room.room_id)
+                            
                             # Get updated room state
                             updated_state = room.get_state()
                             
@@ -480,8 +711,7 @@ async def game_websocket_endpoint(
                             })
                     
                     except Exception as e:
-                        print(f"Error processing room action: {str(e)}")
-                        traceback.print_exc()
+                        logger.exception("Error processing room action: %s", str(e))
                         await websocket.send_json({
                             "type": "error",
                             "data": {
@@ -494,73 +724,25 @@ async def game_websocket_endpoint(
                     # Chat message
                     message = data.get("message")
                     
-                    # Broadcast chat message to room
-                    await ws_manager.broadcast_to_room(
-                        room_id,
-                        {
-                            "type": "chat",
-                            "data": {
-                                "player": username,
-                                "message": message,
-                                "timestamp": time.time()
-                            }
-                        }
-                    )
+                    # 合并同一时间段内的聊天消息，一次广播给房间
+                    ws_manager.queue_chat(room_id, {
+                        "player": username,
+                        "message": message,
+                        "timestamp": time.time()
+                    })
                 
             except WebSocketDisconnect:
-                print(f"WebSocket disconnected for client: {client_id}")
-                ws_manager.disconnect(client_id)
-                
-                # 更新玩家在线状态为false
-                if room_id:
-                    room = room_manager.get_room(room_id)
-                    if room:
-                        room.player_online_status(username, False)
-                        print(f"Game WebSocket: 更新玩家 {username} 的在线状态为False")
-                
-                # Notify others that player has disconnected
-                await ws_manager.broadcast_to_room(
-                    room_id,
-                    {
-                        "type": "player_disconnected",
-                        "data": {
-                            "player_id": username,
-                            "timestamp": time.time()
-                        }
-                    }
-                )
+                await handle_game_disconnect(websocket, client_id, room_id, username)
                 break
             except Exception as e:
-                print(f"Error in game websocket message processing: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error in game websocket message processing: %s", str(e))
     
     except WebSocketDisconnect:
         if client_id:
-            print(f"WebSocket disconnected for client: {client_id}")
-            ws_manager.disconnect(client_id)
-            
-            # 更新玩家在线状态为false
-            if room_id:
-                room = room_manager.get_room(room_id)
-                if room:
-                    room.player_online_status(username, False)
-                    print(f"Game WebSocket: 更新玩家 {username} 的在线状态为False")
-            
-                # Notify others that player has disconnected
-                await ws_manager.broadcast_to_room(
-                    room_id,
-                    {
-                        "type": "player_disconnected",
-                        "data": {
-                            "player_id": username,
-                            "timestamp": time.time()
-                        }
-                    }
-                )
+            await handle_game_disconnect(websocket, client_id, room_id, username)
     except Exception as e:
-        print(f"Unexpected error in game websocket handling: {str(e)}")
-        traceback.print_exc()
-        if client_id:
+        logger.exception("Unexpected error in game websocket handling: %s", str(e))
+        if client_id and ws_manager.owns_connection(client_id, websocket):
             try:
                 ws_manager.disconnect(client_id)
             except:
@@ -568,4 +750,5 @@ async def game_websocket_endpoint(
 
 # Start the server if running as main script
 if __name__ == "__main__":
-    uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True,
+                ws_ping_interval=WS_PING_INTERVAL, ws_ping_timeout=WS_PING_TIMEOUT)
\ No newline at end of file
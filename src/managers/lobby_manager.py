@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import traceback
+from typing import Dict, Set
+
+from fastapi import WebSocket
+
+from src.managers.room_manager import get_instance
+
+# 大厅更新的合并窗口（秒），窗口内同一房间的多次变更只推送一次
+LOBBY_FLUSH_INTERVAL = 0.25
+
+
+class LobbyManager:
+    """大厅WebSocket推送管理
+
+    客户端连接后先收到一次完整的房间列表快照，之后只接收
+    room_added / room_changed / room_removed 增量事件。
+    RoomManager 的变更可能来自后台线程（例如过期房间清理），
+    因此待推送事件用线程锁保护，真正的发送只在主事件循环中进行。
+    """
+
+    def __init__(self, room_manager):
+        self.room_manager = room_manager
+
+        # 已连接的大厅客户端
+        self.subscribers: Set[WebSocket] = set()
+
+        # 当前合并窗口内待推送的事件: room_id -> event
+        self.pending_events: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+        self.room_manager.add_listener(self.on_room_event)
+
+    def on_room_event(self, event: str, room_id: str):
+        """RoomManager 变更回调，合并同一窗口内同一房间的多次事件"""
+        with self.lock:
+            previous = self.pending_events.get(room_id)
+
+            if previous == "room_added":
+                if event == "room_removed":
+                    # 窗口内创建又删除的房间，客户端无需知道
+                    del self.pending_events[room_id]
+                # 新建房间的后续变更仍按 room_added 推送最新摘要
+                return
+
+            if previous == "room_removed" and event != "room_removed":
+                # 删除后又出现，按变更处理
+                self.pending_events[room_id] = "room_changed"
+                return
+
+            self.pending_events[room_id] = event
+
+    async def connect(self, websocket: WebSocket):
+        """接受大厅连接并发送当前房间列表快照"""
+        await websocket.accept()
+        self.subscribers.add(websocket)
+
+        rooms = [room.get_summary() for room in list(self.room_manager.get_all_rooms().values())]
+        await websocket.send_json({
+            "type": "lobby_snapshot",
+            "data": {
+                "rooms": rooms
+            }
+        })
+
+    def disconnect(self, websocket: WebSocket):
+        """移除大厅连接"""
+        self.subscribers.discard(websocket)
+
+    def _build_events(self, pending: Dict[str, str]):
+        """根据合并后的事件生成推送内容，房间摘要取发送时的最新状态"""
+        rooms = self.room_manager.get_all_rooms()
+        events = []
+
+        for room_id, event in pending.items():
+            room = rooms.get(room_id)
+
+            if event == "room_removed" or room is None:
+                # 房间已不存在，新建后即被删除的房间直接忽略
+                if event != "room_added":
+                    events.append({"type": "room_removed", "room_id": room_id})
+                continue
+
+            events.append({
+                "type": event,
+                "room_id": room_id,
+                "room": room.get_summary()
+            })
+
+        return events
+
+    async def flush(self):
+        """推送当前窗口内合并后的所有事件"""
+        with self.lock:
+            if not self.pending_events:
+                return
+            pending = self.pending_events
+            self.pending_events = {}
+
+        # 没有订阅者时直接丢弃，新连接会收到完整快照
+        if not self.subscribers:
+            return
+
+        events = self._build_events(pending)
+        if not events:
+            return
+
+        # 只编码一次，所有订阅者共享同一帧
+        frame = json.dumps({
+            "type": "lobby_update",
+            "data": {
+                "events": events
+            }
+        })
+
+        disconnected = []
+        for websocket in list(self.subscribers):
+            try:
+                await websocket.send_text(frame)
+            except Exception as e:
+                print(f"Error sending lobby update: {str(e)}")
+                disconnected.append(websocket)
+
+        for websocket in disconnected:
+            self.disconnect(websocket)
+
+    async def run(self):
+        """后台任务：每个合并窗口推送一次累积的变更"""
+        while True:
+            try:
+                await asyncio.sleep(LOBBY_FLUSH_INTERVAL)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error in lobby update task: {str(e)}")
+                traceback.print_exc()
+
+
+# Create a singleton instance
+lobby_manager = LobbyManager(get_instance())
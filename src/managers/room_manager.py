@@ -1,4 +1,4 @@
-from src.models.room import Room
+from src.models.room import Room, add_activity_listener
 from src.models.player import Player
 from src.models.game import Game
 import uuid
@@ -6,13 +6,20 @@ import pickle
 import os
 import time
 import threading
+import heapq
+import itertools
 from datetime import datetime, timedelta
+from src.utils.logging_config import get_logger
+
+logger = get_logger("poker.rooms")
 
 # 全局变量存储所有房间
 GLOBAL_ROOMS = {}
 STATE_FILE = "rooms_state.pickle"
 SAVE_INTERVAL = 30  # Save state every 30 seconds
-CLEANUP_INTERVAL = 300  # Check for expired rooms every 5 minutes
+CLEANUP_INTERVAL = 300  # Recheck rooms with a running game every 5 minutes
+EXPIRING_NOTICE_SECONDS = 300  # Notify players 5 minutes before a room expires
+EXPIRY_RECHECK_SECONDS = 1  # Recheck a due room that is not expired yet (boundary / clock differences)
 
 class RoomManager:
     _instance = None
@@ -30,9 +37,23 @@ class RoomManager:
         print("Initializing RoomManager")
         self.initialized = True
         
+        # 房间变更监听器（例如大厅推送），回调签名为 callback(event, room_id)
+        self.listeners = []
+        
+        # 房间过期截止时间的优先队列: (fire_at, seq, room_id, kind, deadline)
+        self.deadline_heap = []
+        self.deadline_seq = itertools.count()
+        self.room_deadlines = {}  # room_id -> 当前有效的过期时间戳
+        self.deadline_condition = threading.Condition()
+        
         # Load saved rooms state if exists
         self.load_state()
         
+        # 为已加载的房间安排过期检查，之后房间每次活动都会更新截止时间
+        for room in list(GLOBAL_ROOMS.values()):
+            self.schedule_room_deadline(room)
+        add_activity_listener(self.schedule_room_deadline)
+        
         # Start background save thread
         self.should_save = True
         self.save_thread = threading.Thread(target=self._background_save)
@@ -45,60 +66,153 @@ class RoomManager:
         self.cleanup_thread.start()
         print("Room manager cleanup thread started")
     
+    def add_listener(self, callback):
+        """注册房间变更监听器
+        
+        Args:
+            callback: 回调函数 callback(event, room_id)，event 为
+                "room_added" / "room_changed" / "room_removed"
+        """
+        if callback not in self.listeners:
+            self.listeners.append(callback)
+    
+    def _notify(self, event, room_id):
+        """通知所有监听器房间发生了变更，可能在后台线程中被调用"""
+        for callback in list(self.listeners):
+            try:
+                callback(event, room_id)
+            except Exception as e:
+                print(f"Error notifying room listener: {str(e)}")
+    
+    def room_changed(self, room_id):
+        """外部修改房间状态（入座、买入、开始游戏等）后调用，用于通知监听器"""
+        self._notify("room_changed", room_id)
+    
     def _background_save(self):
         """Background thread to periodically save state"""
         while self.should_save:
             time.sleep(SAVE_INTERVAL)
             self.save_state()
     
+    def _room_deadline(self, room):
+        """计算房间因闲置而过期的时间戳"""
+        return room.last_activity_time.timestamp() + room.max_idle_time_hours * 3600
+    
+    def schedule_room_deadline(self, room, recheck_at=None):
+        """根据房间最后活动时间，将即将过期和已过期两个截止时间放入优先队列
+        
+        旧的队列项不会被删除，出队时通过与 room_deadlines 中的最新截止时间比对来丢弃。
+        
+        Args:
+            room: 房间对象
+            recheck_at (float, optional): 游戏进行中的房间不会过期，指定时间戳后再次检查
+        """
+        deadline = self._room_deadline(room)
+        
+        with self.deadline_condition:
+            self.room_deadlines[room.room_id] = deadline
+            old_head = self.deadline_heap[0][0] if self.deadline_heap else None
+            
+            if recheck_at is not None:
+                heapq.heappush(self.deadline_heap, (recheck_at, next(self.deadline_seq), room.room_id, "expired", deadline))
+            else:
+                heapq.heappush(self.deadline_heap, (deadline - EXPIRING_NOTICE_SECONDS, next(self.deadline_seq), room.room_id, "expiring", deadline))
+                heapq.heappush(self.deadline_heap, (deadline, next(self.deadline_seq), room.room_id, "expired", deadline))
+            
+            # 过期的队列项太多时重建队列，避免频繁活动的房间让队列无限增长
+            if len(self.deadline_heap) > 4 * len(self.room_deadlines) + 64:
+                self._compact_deadline_heap()
+            
+            # 只有最早的截止时间提前时才需要唤醒清理线程
+            if old_head is None or self.deadline_heap[0][0] < old_head:
+                self.deadline_condition.notify()
+    
+    def _compact_deadline_heap(self):
+        """丢弃过期的队列项（调用方需持有 deadline_condition）"""
+        self.deadline_heap = [
+            entry for entry in self.deadline_heap
+            if self.room_deadlines.get(entry[2]) == entry[4]
+        ]
+        heapq.heapify(self.deadline_heap)
+    
     def _background_cleanup(self):
-        """Background thread to periodically check and remove expired rooms"""
+        """Background thread that sleeps until the next room deadline and then processes all due rooms"""
         while self.should_save:  # 使用相同的控制标志
-            time.sleep(CLEANUP_INTERVAL)
-            self.cleanup_expired_rooms()
+            due_entries = []
+            
+            with self.deadline_condition:
+                while not self.deadline_heap and self.should_save:
+                    self.deadline_condition.wait()
+                if not self.should_save:
+                    break
+                
+                wait_time = self.deadline_heap[0][0] - time.time()
+                if wait_time > 0:
+                    # 新的更早截止时间入队时会被提前唤醒
+                    self.deadline_condition.wait(wait_time)
+                    continue
+                
+                now = time.time()
+                while self.deadline_heap and self.deadline_heap[0][0] <= now:
+                    entry = heapq.heappop(self.deadline_heap)
+                    # 丢弃已被更新的截止时间
+                    if self.room_deadlines.get(entry[2]) == entry[4]:
+                        due_entries.append(entry)
+            
+            if due_entries:
+                self.cleanup_expired_rooms(due_entries)
     
-    def cleanup_expired_rooms(self):
-        """检查并清理过期的房间"""
+    def cleanup_expired_rooms(self, due_entries):
+        """处理到期的房间：删除已过期的房间，并批量通知即将过期和已过期房间中的玩家
+        
+        Args:
+            due_entries (list): 到期的队列项 (fire_at, seq, room_id, kind, deadline)
+        """
         global GLOBAL_ROOMS
         
         try:
-            print("Checking for expired rooms...")
             rooms_to_remove = []
             rooms_expiring = []
+            notifications = []
             
-            # 遍历所有房间检查是否过期
-            for room_id, room in GLOBAL_ROOMS.items():
-                # 检查是否过期
-                if hasattr(room, 'is_expired') and room.is_expired():
-                    # 记录要删除的房间
-                    rooms_to_remove.append(room_id)
-                    
-                    # 检查过期的房间状态
-                    idle_time = datetime.now() - room.last_activity_time
-                    idle_minutes = idle_time.total_seconds() / 60
-                    print(f"Room {room_id} has been idle for {idle_minutes:.1f} minutes and will be removed")
-                    
-                    # 尝试发送通知给房间中的所有玩家
-                    try:
-                        self.notify_room_expiration(room, is_expired=True)
-                    except Exception as notify_error:
-                        print(f"Error sending expiration notification: {str(notify_error)}")
+            for _, _, room_id, kind, _ in due_entries:
+                room = GLOBAL_ROOMS.get(room_id)
+                if not room:
+                    continue
+                
+                if kind == "expired":
+                    if room.is_expired():
+                        # 记录要删除的房间
+                        rooms_to_remove.append(room_id)
+                        
+                        # 检查过期的房间状态
+                        idle_time = datetime.now() - room.last_activity_time
+                        idle_minutes = idle_time.total_seconds() / 60
+                        print(f"Room {room_id} has been idle for {idle_minutes:.1f} minutes and will be removed")
+                        
+                        notifications.extend(self.build_expiration_notifications(room, is_expired=True))
+                    elif room.game:
+                        # 游戏进行中的房间不会过期，稍后再检查
+                        self.schedule_room_deadline(room, recheck_at=time.time() + CLEANUP_INTERVAL)
+                    else:
+                        # 截止时间已到但 is_expired() 仍为 False（边界比较、time.time() 与 datetime.now()
+                        # 的差异），必须重新入队，否则房间永远不会过期
+                        self.schedule_room_deadline(
+                            room, recheck_at=max(self._room_deadline(room), time.time() + EXPIRY_RECHECK_SECONDS))
                 
                 # 检查房间是否即将过期（5分钟内）
-                elif hasattr(room, 'is_expiring') and room.is_expiring():
-                    # 记录即将过期的房间
+                elif kind == "expiring" and room.is_expiring():
                     rooms_expiring.append(room_id)
-                    
-                    # 向房间中的玩家发送即将过期的通知
-                    try:
-                        self.notify_room_expiration(room, is_expired=False)
-                    except Exception as notify_error:
-                        print(f"Error sending expiring notification: {str(notify_error)}")
+                    notifications.extend(self.build_expiration_notifications(room, is_expired=False))
+            
+            # 所有通知一次性交给主事件循环发送
+            if notifications:
+                self.send_notifications(notifications)
             
             # 从GLOBAL_ROOMS中删除过期房间
             for room_id in rooms_to_remove:
                 print(f"Removing expired room: {room_id}")
-                self.remove_room(room_id)
+                self.remove_room(room_id, save=False)
             
             if rooms_to_remove or rooms_expiring:
                 result_message = []
@@ -109,62 +223,58 @@ class RoomManager:
                 
                 print(f"{', '.join(result_message)}. Remaining rooms: {len(GLOBAL_ROOMS)}")
                 # 保存房间状态
-                self.save_state()
-            else:
-                print("No expired or expiring rooms found")
+                if rooms_to_remove:
+                    self.save_state()
                 
         except Exception as e:
             import traceback
             print(f"Error during room cleanup: {str(e)}")
             traceback.print_exc()
     
-    def notify_room_expiration(self, room, is_expired=False):
-        """通知房间中的所有玩家房间即将过期或已过期"""
+    def build_expiration_notifications(self, room, is_expired=False):
+        """构建房间即将过期或已过期的通知
+        
+        Returns:
+            list: [(username, notification), ...]
+        """
         if not room or not room.players:
-            return
+            return []
             
+        # 构建通知消息
+        message_type = "room_expired" if is_expired else "room_expiring"
+        idle_time = datetime.now() - room.last_activity_time
+        idle_minutes = idle_time.total_seconds() / 60
+        minutes_left = (room.max_idle_time_hours * 60) - idle_minutes if not is_expired else 0
+        
+        message = (
+            f"房间 '{room.name}' 因超过30分钟无活动已被关闭" 
+            if is_expired else 
+            f"房间 '{room.name}' 将在 {minutes_left:.1f} 分钟后因无活动而关闭"
+        )
+        
+        notification = {
+            "type": message_type,
+            "data": {
+                "room_id": room.room_id,
+                "room_name": room.name,
+                "message": message,
+                "is_expired": is_expired,
+                "time_left_minutes": minutes_left if not is_expired else 0
+            }
+        }
+        
+        return [(username, notification) for username in room.players.keys()]
+    
+    def send_notifications(self, notifications):
+        """把一批通知提交到主事件循环发送，不在清理线程中创建事件循环"""
         try:
             # 导入ws_manager
             from src.websocket_manager import ws_manager
             
-            # 构建通知消息
-            message_type = "room_expired" if is_expired else "room_expiring"
-            idle_time = datetime.now() - room.last_activity_time
-            idle_minutes = idle_time.total_seconds() / 60
-            minutes_left = (room.max_idle_time_hours * 60) - idle_minutes if not is_expired else 0
-            
-            message = (
-                f"房间 '{room.name}' 因超过30分钟无活动已被关闭" 
-                if is_expired else 
-                f"房间 '{room.name}' 将在 {minutes_left:.1f} 分钟后因无活动而关闭"
-            )
-            
-            notification = {
-                "type": message_type,
-                "data": {
-                    "room_id": room.room_id,
-                    "room_name": room.name,
-                    "message": message,
-                    "is_expired": is_expired,
-                    "time_left_minutes": minutes_left if not is_expired else 0
-                }
-            }
-            
-            # 向房间中的每个玩家发送通知
-            for username in room.players.keys():
-                try:
-                    # 异步发送通知给每个玩家
-                    import asyncio
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(ws_manager.send_personal_message(notification, username))
-                    loop.close()
-                    print(f"Sent {message_type} notification to player: {username}")
-                except Exception as user_error:
-                    print(f"Failed to notify player {username}: {str(user_error)}")
-                    
+            if ws_manager.submit_personal_messages(notifications) is not None:
+                print(f"Queued {len(notifications)} room expiration notifications")
         except Exception as e:
-            print(f"Error in notify_room_expiration: {str(e)}")
+            print(f"Error sending room notifications: {str(e)}")
     
     def save_state(self):
         """Save rooms state to file"""
@@ -369,6 +479,8 @@ class RoomManager:
         
         GLOBAL_ROOMS[room_id] = room
         print(f"已创建房间 {room_id}，房主: {host_username}，当前房间总数: {len(GLOBAL_ROOMS)}")
+        self.schedule_room_deadline(room)
+        self._notify("room_added", room_id)
         
         # Save state after room creation
         self.save_state()
@@ -386,11 +498,11 @@ class RoomManager:
             
         # 尝试不同的字符串表示形式
         for key in GLOBAL_ROOMS.keys():
-            print(f"Comparing {key} with {room_id}")
+            logger.debug("Comparing %s with %s", key, room_id)
             if str(key).lower() == str(room_id).lower():
                 return GLOBAL_ROOMS[key]
                 
-        print(f"Room not found with any method")
+        logger.debug("Room not found with any method")
         return None
         
     def get_all_rooms(self):
@@ -425,6 +537,8 @@ class RoomManager:
         player.position = None
         print(f"Player {username} joined room {room_id} with no seat assigned")
         room.players[username] = player
+        room.mark_dirty()
+        self._notify("room_changed", room.room_id)
         return True
         
     def remove_player_from_room(self, room_id, username):
@@ -436,15 +550,23 @@ class RoomManager:
             return False
             
         # 如果游戏正在进行，玩家弃牌
-        if room.game and username in room.game.active_players:
-            room.game.active_players.remove(username)
+        if room.game:
+            position = room.game.get_player_position(username)
+            if position is not None and position in room.game.active_players:
+                room.game.active_players.remove(position)
             
         # 从房间移除玩家
         del room.players[username]
+        room.mark_dirty()
         
         # 如果房间没有玩家了，删除房间
         if not room.players:
             del GLOBAL_ROOMS[room_id]
+            with self.deadline_condition:
+                self.room_deadlines.pop(room.room_id, None)
+            self._notify("room_removed", room.room_id)
+        else:
+            self._notify("room_changed", room.room_id)
             
         return True
         
@@ -471,16 +593,20 @@ class RoomManager:
                 return room
         return None
 
-    def remove_room(self, room_id):
+    def remove_room(self, room_id, save=True):
         """删除指定ID的房间"""
         global GLOBAL_ROOMS
         
         if room_id in GLOBAL_ROOMS:
             del GLOBAL_ROOMS[room_id]
+            with self.deadline_condition:
+                self.room_deadlines.pop(room_id, None)
             print(f"已删除房间 {room_id}，当前房间总数: {len(GLOBAL_ROOMS)}")
+            self._notify("room_removed", room_id)
             
             # Save state after room removal
-            self.save_state()
+            if save:
+                self.save_state()
             
             return True
         return False
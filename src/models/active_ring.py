@@ -0,0 +1,96 @@
+class ActiveRing(list):
+    """按行动顺序排列的活跃座位环
+
+    仍然是一个 list（序列化、JSON 输出和已有的下标访问都保持不变），
+    额外维护 座位号 -> 列表下标 的映射：
+        position in ring   O(1)
+        ring.index(pos)    O(1)
+        ring.next_after(pos, predicate)  按环形顺序查找下一个满足条件的座位
+    所有修改列表的方法都会重建映射，活跃玩家最多 8 人，重建代价可以忽略。
+    """
+
+    def __init__(self, positions=()):
+        super().__init__(positions)
+        self._reindex()
+
+    def _reindex(self):
+        self._positions = {position: i for i, position in enumerate(self)}
+
+    def __reduce__(self):
+        # pickle 时只保存座位列表，加载时重新建立映射
+        return (self.__class__, (list(self),))
+
+    def __contains__(self, position):
+        try:
+            return position in self._positions
+        except TypeError:
+            # 不可哈希的值不可能是座位号
+            return False
+
+    def index(self, position, *args):
+        if args:
+            return super().index(position, *args)
+        try:
+            return self._positions[position]
+        except (KeyError, TypeError):
+            raise ValueError(f"{position!r} is not in active ring") from None
+
+    def next_after(self, position, predicate=None):
+        """返回 position 之后（环形）第一个满足 predicate 的座位
+
+        绕行一圈后最后检查 position 本身；没有满足条件的座位时返回 None。
+        """
+        start = self.index(position)
+        count = len(self)
+        for step in range(1, count + 1):
+            candidate = self[(start + step) % count]
+            if predicate is None or predicate(candidate):
+                return candidate
+        return None
+
+    # 以下方法修改列表内容，修改后重建映射
+    def append(self, position):
+        super().append(position)
+        self._reindex()
+
+    def extend(self, positions):
+        super().extend(positions)
+        self._reindex()
+
+    def insert(self, i, position):
+        super().insert(i, position)
+        self._reindex()
+
+    def remove(self, position):
+        super().remove(position)
+        self._reindex()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._reindex()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._reindex()
+
+    def pop(self, *args):
+        position = super().pop(*args)
+        self._reindex()
+        return position
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+
+    def __iadd__(self, positions):
+        super().__iadd__(positions)
+        self._reindex()
+        return self
@@ -6,59 +6,54 @@ import datetime
 import logging
 import asyncio
 import traceback
-from concurrent.futures import ThreadPoolExecutor
-from asyncio import get_event_loop_policy, run_coroutine_threadsafe
+import os
+import functools
+from collections import deque
 
 from src.models.deck import Deck
 from src.models.player import Player
+from src.models.active_ring import ActiveRing
+from src.models.seat_state import SeatState
 from src.utils.hand_evaluator import HandEvaluator
 # 导入WebSocket管理器
 from src.websocket_manager import ws_manager
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,  # 默认日志级别，生产环境可设为WARNING
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("poker_server.log"),
-        logging.StreamHandler()
-    ]
-)
+from src.utils.logging_config import get_logger, log_sampled
+from src.utils.metrics import GAME_ACTION_SECONDS
+from src.database import db_manager
 
-logger = logging.getLogger("poker")
+logger = get_logger("poker.game")
 
-# 辅助函数：在新的事件循环中执行异步任务
-def run_async_in_new_loop(coro):
-    """在新的事件循环中执行异步协程任务
-    
-    Args:
-        coro: 要执行的异步协程
-        
-    Returns:
-        协程执行的结果
-    """
-    try:
-        # 创建新的事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 在新事件循环中执行协程
-        result = loop.run_until_complete(coro)
-        
-        # 关闭事件循环
-        loop.close()
-        
-        return result
-    except Exception as e:
-        print(f"Error executing async task in new loop: {str(e)}")
-        traceback.print_exc()
-        return None
+# 指标中使用的动作标签，其余动作统一记为 other，避免标签无限增长
+KNOWN_ACTIONS = ("fold", "check", "call", "raise", "all-in")
+
+# 内存中只保留最近的牌局历史，更早的牌局从数据库 hands 表分页读取
+HAND_HISTORY_BUFFER = int(os.getenv("HAND_HISTORY_BUFFER", "20"))
+HAND_HISTORY_PAGE_SIZE = 20
+HAND_HISTORY_MAX_PAGE_SIZE = 100
+
+def mutates_state(method):
+    """标记会修改牌局状态的方法，执行结束后（包括异常）使缓存的状态快照失效"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.mark_dirty()
+    return wrapper
 
 class Game:
-    def __init__(self, players_info, small_blind=None, big_blind=None, player_turn_time=30):
+    def __init__(self, players_info, small_blind=None, big_blind=None, player_turn_time=30, room_id=None):
         """初始化游戏对象，但不开始游戏"""
         try:
-            print(f"Initializing Game with players_info: {players_info}")
+            logger.debug("Initializing Game with players_info: %s", players_info)
+            
+            # 所属房间ID，用于保存牌局历史
+            self.room_id = room_id
+            
+            # 状态版本号，每次修改后递增；get_state 的快照按版本号缓存
+            self.version = 0
+            self._state_cache = None
             
             # 定义最大支持的玩家数量
             self.MAX_PLAYERS = 8
@@ -74,7 +69,7 @@ class Game:
             self.players = {}
             for player_info in players_info:
                 position = player_info["position"]
-                self.players[position] = player_info
+                self.players[position] = SeatState.from_dict(player_info)
                 # 初始化玩家弃牌状态
                 self.players[position]["has_discarded"] = False
                 self.players[position]["discarded_card"] = None
@@ -82,11 +77,15 @@ class Game:
                 self.players[position]["initial_chips"] = player_info["chips"]
                 self.players[position]["avatar"] = player_info["avatar"]
             
+            # 用户名 -> 座位号，见 get_player_position
+            self.player_positions = {}
+            self._index_players()
+            
             # 按照位置从小到大排序active_players
-            self.active_players = sorted([position for position, player in self.players.items() if player["chips"] > 0 and player["online"]])
+            self.active_players = ActiveRing(sorted([position for position, player in self.players.items() if player["chips"] > 0 and player["online"]]))
             # 记录游戏开始时的玩家数量，用于决定行动顺序规则
             self.initial_player_count = len(self.active_players)
-            print(f"游戏开始时的玩家数量: {self.initial_player_count}")
+            logger.debug("游戏开始时的玩家数量: %s", self.initial_player_count)
             self.pot = 0
             self.current_bet = 0
             self.community_cards = []
@@ -101,7 +100,7 @@ class Game:
             # 初始化评估器和历史记录
             self.hand_evaluator = HandEvaluator()
             self.action_history = []
-            self.game_history = []  # 存储已完成的游戏历史记录
+            self.game_history = deque(maxlen=HAND_HISTORY_BUFFER)  # 最近完成的牌局历史（环形缓冲区）
             
             # 初始化计时器相关字段
             self.turn_timer = None
@@ -117,23 +116,70 @@ class Game:
             self.main_pot = 0    # 主池金额
             self.all_in_players = {}  # 记录全压玩家的情况，键为玩家位置，值为全压金额
             
-            print("Game object initialized, ready to start round")
+            logger.debug("Game object initialized, ready to start round")
         except Exception as e:
-            print(f"Error in Game.__init__: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in Game.__init__: %s", str(e))
             raise
             
     def __getstate__(self):
         """Support for pickle serialization"""
-        return self.__dict__
+        state = self.__dict__.copy()
+        state["_state_cache"] = None
+        return state
     
     def __setstate__(self, state):
         """Support for pickle deserialization"""
         self.__dict__.update(state)
+        # 兼容旧版本保存的状态：历史记录是无限增长的列表，且没有房间ID
+        if not isinstance(self.game_history, deque):
+            self.game_history = deque(self.game_history, maxlen=HAND_HISTORY_BUFFER)
+        if "room_id" not in state:
+            self.room_id = None
+        if not isinstance(self.active_players, ActiveRing):
+            self.active_players = ActiveRing(self.active_players)
+        # 旧版本保存的座位状态是普通字典
+        for position, player in self.players.items():
+            if not isinstance(player, SeatState):
+                self.players[position] = SeatState(player)
+        if "player_positions" not in state:
+            self.player_positions = {}
+            self._index_players()
+        if "version" not in state:
+            self.version = 0
+            self._state_cache = None
+
+    def mark_dirty(self):
+        """牌局状态已改变，下次 get_state 重新生成快照
+
+        Game 内部修改状态的方法由 mutates_state 自动调用；
+        外部直接修改 players / active_players 后需要手动调用。
+        """
+        self.version += 1
+
+    def _index_players(self):
+        """重建 用户名 -> 座位号 的映射"""
+        self.player_positions = {
+            player.get("name"): position for position, player in self.players.items()
+        }
+
+    def get_player_position(self, username):
+        """返回玩家的座位号，不在游戏中时返回 None
+
+        房间会直接修改 self.players（换座、中途加入），所以命中时校验映射是否仍然有效，
+        不一致时重建一次映射。
+        """
+        position = self.player_positions.get(username)
+        player = self.players.get(position) if position is not None else None
+        if player is not None and player.get("name") == username:
+            return position
+
+        self._index_players()
+        return self.player_positions.get(username)
     
+    @mutates_state
     def deal_cards(self):
         """Deal cards to all players"""
-        print("Dealing cards to players")
+        logger.debug("Dealing cards to players")
         self.deck.shuffle()
         
         # 定义排序函数，用于对牌进行排序
@@ -162,7 +208,7 @@ class Game:
             card1 = self.deck.deal()
             card2 = self.deck.deal()
             card3 = self.deck.deal()
-            print(f"Dealt cards to player position {position}: {card1}, {card2}, {card3}")
+            logger.debug("Dealt cards to player position %s: %s, %s, %s", position, card1, card2, card3)
             
             # 对牌进行排序
             sorted_cards = sort_cards([card1, card2, card3])
@@ -172,13 +218,15 @@ class Game:
                 card.to_dict() for card in sorted_cards
             ]
     
+    @mutates_state
     def post_blinds(self):
         """Post small and big blinds"""
-        print(f"\n=== POSTING BLINDS ===")
+        logger.debug("=== POSTING BLINDS ===")
         
         # Show chips before blinds
-        for position, player in self.players.items():
-            print(f"Before blinds: {player['name']} has {player['chips']} chips")
+        if logger.isEnabledFor(logging.DEBUG):
+            for position, player in self.players.items():
+                logger.debug("Before blinds: %s has %s chips", player['name'], player['chips'])
         
         # 设置庄家位置 - 不下注
         button_idx = self.dealer_idx
@@ -187,24 +235,22 @@ class Game:
         if len(self.players) == 2:
             # 在两人游戏中，庄家是小盲，另一位是大盲
             small_blind_idx = button_idx
-            big_blind_idx = [pos for pos in self.active_players if pos != button_idx][0]  # 另一个活跃玩家
+            big_blind_idx = self.active_players.next_after(button_idx)  # 另一个活跃玩家
             
-            print(f"两人游戏 - Button/SB位置: {button_idx} ({self.players[button_idx]['name']})")
-            print(f"两人游戏 - BB位置: {big_blind_idx} ({self.players[big_blind_idx]['name']})")
+            logger.debug("两人游戏 - Button/SB位置: %s (%s)", button_idx, self.players[button_idx]['name'])
+            logger.debug("两人游戏 - BB位置: %s (%s)", big_blind_idx, self.players[big_blind_idx]['name'])
         else:
             # 三人或更多玩家时使用正常规则
-            active_positions = self.active_players
-            button_position_index = active_positions.index(button_idx)
-            small_blind_idx = active_positions[(button_position_index + 1) % len(active_positions)]
-            big_blind_idx = active_positions[(button_position_index + 2) % len(active_positions)]
-            print(f"Button position: {button_idx} ({self.players[button_idx]['name']}) - No blind posted")
+            small_blind_idx = self.active_players.next_after(button_idx)
+            big_blind_idx = self.active_players.next_after(small_blind_idx)
+            logger.debug("Button position: %s (%s) - No blind posted", button_idx, self.players[button_idx]['name'])
         
         # 小盲下注
         if small_blind_idx in self.active_players:
             small_blind_amount = min(self.small_blind, self.players[small_blind_idx]["chips"])
             self.players[small_blind_idx]['bet_amount'] = small_blind_amount
             self.players[small_blind_idx]["chips"] -= small_blind_amount
-            print(f"Small Blind: Player {small_blind_idx} ({self.players[small_blind_idx]['name']}) posts {small_blind_amount}, remaining chips: {self.players[small_blind_idx]['chips']}")
+            logger.debug("Small Blind: Player %s (%s) posts %s, remaining chips: %s", small_blind_idx, self.players[small_blind_idx]['name'], small_blind_amount, self.players[small_blind_idx]['chips'])
             
             # 记录小盲动作
             self.action_history.append({
@@ -223,7 +269,7 @@ class Game:
             self.players[big_blind_idx]["chips"] -= big_blind_amount
             self.current_bet = big_blind_amount
             self.last_player_to_raise = big_blind_idx
-            print(f"Big Blind: Player {big_blind_idx} ({self.players[big_blind_idx]['name']}) posts {big_blind_amount}, remaining chips: {self.players[big_blind_idx]['chips']}")
+            logger.debug("Big Blind: Player %s (%s) posts %s, remaining chips: %s", big_blind_idx, self.players[big_blind_idx]['name'], big_blind_amount, self.players[big_blind_idx]['chips'])
             
             # 记录大盲动作
             self.action_history.append({
@@ -235,22 +281,22 @@ class Game:
             })
         
         # Log player chips after blinds
-        print("\n=== CHIPS AFTER BLINDS ===")
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        
+        logger.debug("=== CHIPS AFTER BLINDS ===")
         for position, player in self.players.items():
             position_type = "BUTTON" if position == self.dealer_idx else \
                             "SMALL BLIND" if position == small_blind_idx else \
                             "BIG BLIND" if position == big_blind_idx else f"POSITION {position}"
-            if isinstance(player, dict):
-                print(f"{player['name']} has {player['chips']} chips, bet: {player.get('bet_amount', 0)}, position: {position_type}")
-            else:
-                print(f"{player.name} has {player.chips} chips, bet: {getattr(player, 'bet_amount', 0)}, position: {position_type}")
-        print(f"Total bets on table: {self.get_total_bets()}")
+            logger.debug("%s has %s chips, bet: %s, position: %s", player.name, player.chips, player.bet_amount, position_type)
+        logger.debug("Total bets on table: %s", self.get_total_bets())
     
     def to_dict(self):
         return {
             "handid": self.handid,
             "deck": self.deck.to_dict(),
-            "players": self.players,
+            "players": {position: player.to_dict() for position, player in self.players.items()},
             "active_players": self.active_players,
             "pot": self.pot,
             "small_blind": self.small_blind,
@@ -263,6 +309,7 @@ class Game:
             "player_acted": self.player_acted
         }
         
+    @mutates_state
     def start_round(self):
         """开始一轮新游戏"""
         try:
@@ -274,6 +321,10 @@ class Game:
             self.community_cards = []
             self.betting_round = 0
             
+            # 每手牌单独记录行动历史，并记下开始时的筹码用于牌局历史
+            self.action_history = []
+            self.hand_start_chips = {position: player["chips"] for position, player in self.players.items()}
+            
             # 重置玩家行动状态为字典，只包含活跃玩家（还在游戏中的玩家）
             self.player_acted = {position: False for position in self.active_players}
             
@@ -292,45 +343,53 @@ class Game:
             if len(self.players) == 2:
                 # 两人游戏中，由小盲注位置(庄家位置)开始行动
                 self.current_player_idx = self.dealer_idx
-                print(f"两人游戏: 由小盲注位置(庄家位置)开始行动 (玩家索引: {self.current_player_idx})")
+                logger.debug("两人游戏: 由小盲注位置(庄家位置)开始行动 (玩家索引: %s)", self.current_player_idx)
             else:
                 # 多人游戏中，由大盲注后面的玩家开始行动
-                dealer_index_in_list = self.active_players.index(self.dealer_idx) 
-                next_player_index = (dealer_index_in_list + 3) % len(self.active_players)
-                self.current_player_idx = self.active_players[next_player_index]
-                print(f"多人游戏: 由大盲注后面的玩家开始行动 (玩家索引: {self.current_player_idx})")
+                small_blind_idx = self.active_players.next_after(self.dealer_idx)
+                big_blind_idx = self.active_players.next_after(small_blind_idx)
+                self.current_player_idx = self.active_players.next_after(big_blind_idx)
+                logger.debug("多人游戏: 由大盲注后面的玩家开始行动 (玩家索引: %s)", self.current_player_idx)
             
             # 设置当前玩家名称和启动计时器
             if self.current_player_idx in self.players:
                 self.current_player = self.players[self.current_player_idx]["name"]
-                print(f"设置当前玩家为: {self.current_player}，索引: {self.current_player_idx}")
+                logger.debug("设置当前玩家为: %s，索引: %s", self.current_player, self.current_player_idx)
                 
                 # 尝试启动计时器
                 self.start_turn_timer()
             else:
-                print(f"警告: 无法找到有效的当前玩家")
+                logger.warning("警告: 无法找到有效的当前玩家")
             
-            print(f"回合成功开始。当前玩家: {self.current_player if hasattr(self, 'current_player') else 'None'}")
+            logger.debug("回合成功开始。当前玩家: %s", self.current_player if hasattr(self, 'current_player') else 'None')
             return True
         except Exception as e:
-            print(f"Error in start_round: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in start_round: %s", str(e))
             return False
             
+    @mutates_state
     def handle_action(self, action, amount=0):
+        """处理玩家动作，并记录处理耗时"""
+        start = time.perf_counter()
+        try:
+            return self._handle_action(action, amount)
+        finally:
+            GAME_ACTION_SECONDS.observe(time.perf_counter() - start, action if action in KNOWN_ACTIONS else "other")
+    
+    def _handle_action(self, action, amount=0):
         """处理玩家动作"""
         try:
             # 确保玩家仍在游戏中
             if self.current_player_idx not in self.active_players:
-                print(f"玩家 {self.current_player_idx} 不在活跃玩家列表中")
+                logger.debug("玩家 %s 不在活跃玩家列表中", self.current_player_idx)
                 return {"success": False, "message": f"玩家不在活跃玩家列表中"}
             
             # 检查玩家是否已经行动过
             if self.player_acted.get(self.current_player_idx, False):
-                print(f"玩家 {self.current_player_idx} 已经行动过")
+                logger.debug("玩家 %s 已经行动过", self.current_player_idx)
                 return {"success": False, "message": f"玩家已经行动过"}
         
-            print(f"处理玩家 {self.current_player_idx} 动作: {action}, 金额: {amount}")
+            logger.debug("处理玩家 %s 动作: %s, 金额: %s", self.current_player_idx, action, amount)
         
             # 获取当前玩家
             current_player = self.players[self.current_player_idx]
@@ -340,12 +399,12 @@ class Game:
             try:
                 amount = float(amount) if amount else 0
             except (TypeError, ValueError):
-                print(f"无效的金额值: {amount}")
+                logger.debug("无效的金额值: %s", amount)
                 return {"success": False, "message": f"无效的金额值: {amount}"}
             
             # 检查玩家是否需要先弃牌
             if len(current_player["hand"]) == 3 and not current_player.get("has_discarded", False):
-                print(f"玩家 {player_name} 必须先弃掉一张牌")
+                logger.debug("玩家 %s 必须先弃掉一张牌", player_name)
                 return {"success": False, "message": "玩家必须先弃掉一张牌"}
             
             # 记录动作到历史记录
@@ -362,7 +421,7 @@ class Game:
                 # 弃牌操作
                 # 先获取当前玩家在活跃玩家列表中的索引，以便稍后使用
                 current_idx = self.active_players.index(self.current_player_idx)
-                print(f"玩家 {player_name} 选择弃牌，当前索引: {current_idx}")
+                logger.debug("玩家 %s 选择弃牌，当前索引: %s", player_name, current_idx)
                 
                 # 现在从活跃玩家列表中移除当前玩家
                 self.active_players.remove(self.current_player_idx)
@@ -376,46 +435,46 @@ class Game:
             elif action == "check":
                 # 让牌操作，只有在没有人下注时才能让牌
                 if self.current_bet > 0 and current_player.get("bet_amount", 0) < self.current_bet:
-                    print(f"当前有玩家已下注 {self.current_bet}，不能让牌")
+                    logger.debug("当前有玩家已下注 %s，不能让牌", self.current_bet)
                     return {"success": False, "message": f"当前有玩家已下注 {self.current_bet}，不能让牌"}
                 
                 self.player_acted[self.current_player_idx] = True
-                print(f"玩家 {player_name} 选择check")
+                logger.debug("玩家 %s 选择check", player_name)
             
             elif action == "call":
                 # 跟注操作
                 call_amount = self.current_bet - current_player.get("bet_amount", 0)
                 
                 if call_amount <= 0:
-                    print("不需要跟注，使用过牌操作")
-                    return self.handle_action("check")
+                    logger.debug("不需要跟注，使用过牌操作")
+                    return self._handle_action("check")
                 
                 if call_amount >= current_player["chips"]:
-                    print(f"玩家筹码不足，自动改为全下")
-                    return self.handle_action("all-in")
+                    logger.debug("玩家筹码不足，自动改为全下")
+                    return self._handle_action("all-in")
                 
                 # 更新玩家筹码和下注金额
                 current_player["chips"] -= call_amount
                 current_player["bet_amount"] += call_amount
                 self.player_acted[self.current_player_idx] = True
-                print(f"玩家 {player_name} 跟注 {call_amount}")
+                logger.debug("玩家 %s 跟注 %s", player_name, call_amount)
             elif action == "raise":
                 # 加注操作
                 # 计算玩家当前下注后的总下注金额
                 total_bet_amount = current_player["bet_amount"] + amount
                 
                 if total_bet_amount <= self.current_bet:
-                    print(f"加注总金额 {total_bet_amount} 必须大于当前最大下注 {self.current_bet}")
+                    logger.debug("加注总金额 %s 必须大于当前最大下注 %s", total_bet_amount, self.current_bet)
                     return {"success": False, "message": f"加注总金额必须大于当前最大下注 {self.current_bet}"}
                 
                 # 检查最小加注规则
                 min_raise = self.current_bet * 2 if self.current_bet > 0 else self.big_blind
                 if total_bet_amount < min_raise and amount < current_player["chips"]:
-                    print(f"加注总金额 {total_bet_amount} 必须至少为 {min_raise}")
+                    logger.debug("加注总金额 %s 必须至少为 %s", total_bet_amount, min_raise)
                     return {"success": False, "message": f"加注总金额必须至少为 {min_raise}"}
                 
                 if amount > current_player["chips"]:
-                    print(f"玩家筹码不足，最多能新增下注 {current_player['chips']}")
+                    logger.debug("玩家筹码不足，最多能新增下注 %s", current_player['chips'])
                     return {"success": False, "message": f"玩家筹码不足，最多能新增下注 {current_player['chips']}"}
                 
                 # 更新玩家筹码和下注金额
@@ -428,7 +487,7 @@ class Game:
                     current_player["is_all_in"] = True
                     # 记录全压金额
                     self.all_in_players[self.current_player_idx] = current_player["bet_amount"]
-                    print(f"玩家 {player_name} 已全下")
+                    logger.debug("玩家 %s 已全下", player_name)
                 
                 # 重置其他玩家的行动状态
                 for position in self.active_players:
@@ -436,7 +495,7 @@ class Game:
                         self.player_acted[position] = False
                         
                 self.player_acted[self.current_player_idx] = True
-                print(f"玩家 {player_name} 加注到 {self.current_bet}")
+                logger.debug("玩家 %s 加注到 %s", player_name, self.current_bet)
             
             elif action == "all-in":
                 # 全下操作
@@ -450,7 +509,7 @@ class Game:
                 
                 # 记录全压金额到all_in_players字典
                 self.all_in_players[self.current_player_idx] = total_bet
-                print(f"玩家 {player_name} 已全下，总下注: {total_bet}")
+                logger.debug("玩家 %s 已全下，总下注: %s", player_name, total_bet)
                 
                 if total_bet > self.current_bet:
                     self.current_bet = total_bet
@@ -460,20 +519,22 @@ class Game:
                             self.player_acted[position] = False
                 
                 self.player_acted[self.current_player_idx] = True
-                print(f"玩家 {player_name} 全下 {all_in_amount}")
+                logger.debug("玩家 %s 全下 %s", player_name, all_in_amount)
             
             else:
-                print(f"未知动作: {action}")
+                logger.debug("未知动作: %s", action)
                 return {"success": False, "message": f"未知动作: {action}"}
             
             # 检查是否所有剩余活跃玩家都已全下
             if self.check_all_in_situation():
-                print("所有剩余玩家都已全下且都已经行动过，直接进入摊牌阶段")
+                logger.debug("所有剩余玩家都已全下且都已经行动过，直接进入摊牌阶段")
                 # 打印详细信息帮助调试
-                for pos in self.active_players:
-                    player = self.players[pos]
-                    print(f"  玩家 {player['name']} (位置 {pos}): 已行动={self.player_acted.get(pos, False)}, " +
-                          f"全下状态={player.get('is_all_in', False)}, 剩余筹码={player.get('chips', 0)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    for pos in self.active_players:
+                        player = self.players[pos]
+                        logger.debug("  玩家 %s (位置 %s): 已行动=%s, 全下状态=%s, 剩余筹码=%s",
+                                     player['name'], pos, self.player_acted.get(pos, False),
+                                     player.get('is_all_in', False), player.get('chips', 0))
                 
                 # 发放剩余公共牌并结束游戏
                 self.betting_round = 4
@@ -482,19 +543,20 @@ class Game:
             
             # 检查当前玩家是否是最后一个需要行动的玩家
             # 在加注后，只有一位玩家需要行动的情况下
-            print(f"\n当前活跃玩家: {self.active_players}")
-            print(f"当前下注金额: {self.current_bet}")
-            print(f"已经行动玩家: {[pos for pos in self.active_players if self.player_acted.get(pos, False)]}")
-            print(f"未行动玩家: {[pos for pos in self.active_players if not self.player_acted.get(pos, False)]}")
+            logger.debug("当前活跃玩家: %s", self.active_players)
+            logger.debug("当前下注金额: %s", self.current_bet)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("已经行动玩家: %s", [pos for pos in self.active_players if self.player_acted.get(pos, False)])
+                logger.debug("未行动玩家: %s", [pos for pos in self.active_players if not self.player_acted.get(pos, False)])
             
             # 检查是否所有玩家都行动过了
             if self.check_all_players_acted():
-                print("所有玩家都已经行动过，准备进入下一轮")
+                logger.debug("所有玩家都已经行动过，准备进入下一轮")
                 # 所有玩家都行动过，进入下一轮
                 self.advance_betting_round()
             else:
                 need_action_players = [pos for pos in self.active_players if not self.player_acted.get(pos, False) and not self.players[pos].get("is_all_in", False)]
-                print(f"需要行动的玩家: {need_action_players}")
+                logger.debug("需要行动的玩家: %s", need_action_players)
                 
                 # 移动到下一个玩家
                 if action == "fold":
@@ -506,10 +568,10 @@ class Game:
             
             return {"success": True, "message": f"成功执行{action}操作"}
         except Exception as e:
-            print(f"Error in Game.handle_action: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in Game.handle_action: %s", str(e))
             return {"success": False, "message": f"处理动作时发生错误: {str(e)}"}
     
+    @mutates_state
     def deal_flop(self):
         """发放翻牌圈三张公共牌"""
         try:
@@ -523,13 +585,13 @@ class Game:
                     card = self.deck.deal()
                     # 将Card对象转换为字典再添加到community_cards
                     self.community_cards.append(card.to_dict())
-                    print(f"发放公共牌: {card}")
+                    logger.debug("发放公共牌: %s", card)
                 else:
-                    print("牌组已空，无法发放更多公共牌")
+                    logger.debug("牌组已空，无法发放更多公共牌")
         except Exception as e:
-            print(f"Deal flop error: {e}")
-            traceback.print_exc()
+            logger.exception("Deal flop error: %s", e)
             
+    @mutates_state
     def deal_turn(self):
         """发放转牌圈一张公共牌"""
         try:
@@ -542,13 +604,13 @@ class Game:
                 card = self.deck.deal()
                 # 将Card对象转换为字典再添加到community_cards
                 self.community_cards.append(card.to_dict())
-                print(f"发放转牌: {card}")
+                logger.debug("发放转牌: %s", card)
             else:
-                print("牌组已空，无法发放转牌")
+                logger.debug("牌组已空，无法发放转牌")
         except Exception as e:
-            print(f"Deal turn error: {e}")
-            traceback.print_exc()
+            logger.exception("Deal turn error: %s", e)
             
+    @mutates_state
     def deal_river(self):
         """发放河牌圈一张公共牌"""
         try:
@@ -561,73 +623,51 @@ class Game:
                 card = self.deck.deal()
                 # 将Card对象转换为字典再添加到community_cards
                 self.community_cards.append(card.to_dict())
-                print(f"发放河牌: {card}")
+                logger.debug("发放河牌: %s", card)
             else:
-                print("牌组已空，无法发放河牌")
+                logger.debug("牌组已空，无法发放河牌")
         except Exception as e:
-            print(f"Deal river error: {e}")
-            traceback.print_exc()
+            logger.exception("Deal river error: %s", e)
         
+    @mutates_state
     def advance_player(self, current_idx=None):
         try:
             # 如果没有活跃玩家，返回
             if not self.active_players:
-                print("没有玩家可以行动")
+                logger.debug("没有玩家可以行动")
                 return
             
-            print(f"准备移动到下一个玩家 - 当前活跃玩家: {self.active_players}")    
+            logger.debug("准备移动到下一个玩家 - 当前活跃玩家: %s", self.active_players)
+            def can_act(position):
+                return not self.players[position].get("is_all_in", False)
+
             # 当前玩家弃牌后，当前玩家在active_players里的index已经指向了下一个活跃玩家
             if current_idx is not None:
-                # 检查current_idx是否超出了活跃玩家列表范围（当最后一个玩家弃牌时会发生）
-                if current_idx < len(self.active_players):
-                    self.current_player_idx = self.active_players[current_idx]
-                    # 检查该玩家是否全下，如果是则继续递归查找下一个可行动玩家
-                    if self.players[self.current_player_idx].get("is_all_in", False):
-                        print(f"玩家 {self.current_player_idx} 已全下，继续查找下一个玩家")
-                        self.advance_player(current_idx + 1 if current_idx + 1 < len(self.active_players) else 0)
-                    else:
-                        print(f"设置当前玩家为 {self.current_player_idx} (弃牌后)")
-                else:
-                    # 如果超出范围，则设置为第一个活跃玩家（循环到列表开头）
-                    next_player_idx = self.active_players[0]
-                    self.current_player_idx = next_player_idx
-                    print(f"current_idx {current_idx} 超出了活跃玩家列表范围，设置为第一个活跃玩家: {next_player_idx}")
-                    
-                    # 检查该玩家是否全下，如果是则继续递归查找下一个可行动玩家
-                    if self.players[next_player_idx].get("is_all_in", False):
-                        print(f"玩家 {next_player_idx} 已全下，继续查找下一个玩家")
-                        self.advance_player(1)
+                # 超出范围时（最后一个玩家弃牌）循环到列表开头
+                candidate = self.active_players[current_idx % len(self.active_players)]
+                if not can_act(candidate):
+                    # 该玩家已全下，继续查找下一个可行动玩家
+                    logger.debug("玩家 %s 已全下，继续查找下一个玩家", candidate)
+                    candidate = self.active_players.next_after(candidate, can_act) or candidate
+                self.current_player_idx = candidate
+                logger.debug("设置当前玩家为 %s (弃牌后)", self.current_player_idx)
             else:
-                current_idx = self.active_players.index(self.current_player_idx)
-                print(f"当前玩家在活跃列表中的索引: {current_idx}")
-                
-                # 找到下一个非全下的活跃玩家
-                for _ in range(len(self.active_players)):
-                    next_idx = (current_idx + 1) % len(self.active_players)
-                    candidate_player_idx = self.active_players[next_idx]
-                    
-                    # 如果玩家已经全下，继续找下一个
-                    if self.players[candidate_player_idx].get("is_all_in", False):
-                        print(f"玩家 {candidate_player_idx} 已全下，继续查找")
-                        current_idx = next_idx
-                        continue
-                    
-                    # 找到了非全下的玩家
-                    self.current_player_idx = candidate_player_idx
-                    break
+                # 找到下一个非全下的活跃玩家，都已全下时保持不变
+                candidate = self.active_players.next_after(self.current_player_idx, can_act)
+                if candidate is not None:
+                    self.current_player_idx = candidate
             
             # 更新当前玩家属性
             if self.current_player_idx in self.players:
                 self.current_player = self.players[self.current_player_idx]["name"]
-                print(f"轮到玩家 {self.current_player} (位置 {self.current_player_idx})")
+                logger.debug("轮到玩家 %s (位置 %s)", self.current_player, self.current_player_idx)
                 # 启动新玩家的计时器
                 self.start_turn_timer()
             else:
                 self.current_player = None
-                print(f"警告: 当前玩家位置 {self.current_player_idx} 不存在于玩家字典中")
+                logger.warning("警告: 当前玩家位置 %s 不存在于玩家字典中", self.current_player_idx)
         except Exception as e:
-            print(f"Error in advance_player: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in advance_player: %s", str(e))
             # 出错时不改变任何状态
         
     def check_all_players_acted(self):
@@ -636,28 +676,29 @@ class Game:
         Returns:
             bool: 如果所有玩家都已行动过，则返回True
         """
-        print("检查是否所有活跃玩家都已行动：")
+        logger.debug("检查是否所有活跃玩家都已行动：")
         for player_idx in self.active_players:
             # 跳过已经全下的玩家
             if self.players[player_idx].get("is_all_in", False):
-                print(f"  玩家 {player_idx} 已全下，跳过检查")
+                logger.debug("  玩家 %s 已全下，跳过检查", player_idx)
                 continue
                 
             if not self.player_acted.get(player_idx, False):
-                print(f"  玩家 {player_idx} 尚未行动，返回False")
+                logger.debug("  玩家 %s 尚未行动，返回False", player_idx)
                 return False
             else:
-                print(f"  玩家 {player_idx} 已经行动过")
+                logger.debug("  玩家 %s 已经行动过", player_idx)
         
         # 如果遍历完所有活跃玩家都已行动，或者被跳过(全下)，则返回True
-        print("  所有玩家都已行动，返回True")
+        logger.debug("  所有玩家都已行动，返回True")
         return True
         
+    @mutates_state
     def advance_betting_round(self):
         """
         进入下一个下注轮，将当前下注轮的筹码移入底池，并根据轮次发牌
         """
-        print(f"\n==== 进入下一轮，当前轮： {self.betting_round} ====")
+        logger.debug("==== 进入下一轮，当前轮： %s ====", self.betting_round)
         
         # 将所有玩家的当前下注加到底池
         self.pot += self.get_total_bets()
@@ -677,37 +718,38 @@ class Game:
             # 根据当前轮次发放公共牌
             if self.betting_round == 0:  # preflop
                 self.betting_round = 1  # flop
-                print("发放翻牌圈 (flop)")
+                logger.debug("发放翻牌圈 (flop)")
                 self.deal_flop()
             elif self.betting_round == 1:  # flop
                 self.betting_round = 2  # turn
-                print("发放转牌圈 (turn)")
+                logger.debug("发放转牌圈 (turn)")
                 self.deal_turn()
             elif self.betting_round == 2:  # turn
                 self.betting_round = 3  # river
-                print("发放河牌圈 (river)")
+                logger.debug("发放河牌圈 (river)")
                 self.deal_river()
             elif self.betting_round == 3:  # river
-                print("本手牌结束")
+                logger.debug("本手牌结束")
                 self.finish_hand()
                 return
             
             # 设置下一个行动的玩家
             if self.betting_round >= 1:  # flop及之后的轮次
-                print("\n---- 设置翻牌圈及之后轮次的第一个行动玩家 ----")
+                logger.debug("---- 设置翻牌圈及之后轮次的第一个行动玩家 ----")
                 # 获取所有活跃玩家，按位置排序
                 sorted_active_players = sorted(self.active_players)
-                print(f"当前活跃玩家列表(按位置排序): {sorted_active_players}")
-                print(f"当前庄家位置: {self.dealer_idx}")
-                print(f"游戏开始时的玩家数量: {self.initial_player_count}")
+                logger.debug("当前活跃玩家列表(按位置排序): %s", sorted_active_players)
+                logger.debug("当前庄家位置: %s", self.dealer_idx)
+                logger.debug("游戏开始时的玩家数量: %s", self.initial_player_count)
                 
                 # 打印所有玩家的信息，便于调试
-                print("\n当前所有玩家信息:")
-                for pos, player in self.players.items():
-                    player_name = player.get('name', f'Player_{pos}')
-                    is_active = pos in self.active_players
-                    is_dealer = pos == self.dealer_idx
-                    print(f"  位置:{pos}, 玩家:{player_name}, 是否活跃:{is_active}, 是否庄家:{is_dealer}, 筹码:{player.get('chips', 0)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("当前所有玩家信息:")
+                    for pos, player in self.players.items():
+                        player_name = player.get('name', f'Player_{pos}')
+                        is_active = pos in self.active_players
+                        is_dealer = pos == self.dealer_idx
+                        logger.debug("  位置:%s, 玩家:%s, 是否活跃:%s, 是否庄家:%s, 筹码:%s", pos, player_name, is_active, is_dealer, player.get('chips', 0))
                 
                 # 如果有活跃玩家
                 if sorted_active_players:
@@ -723,67 +765,92 @@ class Game:
                         for pos in sorted_active_players:
                             if pos != self.dealer_idx:
                                 small_blind_idx = pos  # 翻牌后第一个行动的是大盲位
-                                print(f"两人游戏(翻牌后): 大盲位置先行动 = {small_blind_idx}")
+                                logger.debug("两人游戏(翻牌后): 大盲位置先行动 = %s", small_blind_idx)
                                 break
                     else:
                         # 三人或更多玩家时，小盲是庄家后一位
-                        print(f"三人或更多玩家游戏(初始)，准备寻找庄家后的第一个活跃玩家作为小盲位置")
+                        logger.debug("三人或更多玩家游戏(初始)，准备寻找庄家后的第一个活跃玩家作为小盲位置")
                         
                         # 获取所有位置，不仅仅是活跃的
                         all_positions = sorted(self.players.keys())
-                        print(f"所有座位位置(按顺序): {all_positions}")
+                        logger.debug("所有座位位置(按顺序): %s", all_positions)
                         
                         if self.dealer_idx in all_positions:
                             # 找到庄家在所有位置中的索引
                             dealer_pos_in_all = all_positions.index(self.dealer_idx)
-                            print(f"庄家位置 {self.dealer_idx} 在所有位置中的索引: {dealer_pos_in_all}")
+                            logger.debug("庄家位置 %s 在所有位置中的索引: %s", self.dealer_idx, dealer_pos_in_all)
                             
                             # 从庄家位置之后开始循环查找第一个活跃玩家
-                            print(f"开始从庄家位置之后查找第一个活跃玩家...")
+                            logger.debug("开始从庄家位置之后查找第一个活跃玩家...")
                             for i in range(1, len(all_positions) + 1):
                                 next_pos = (dealer_pos_in_all + i) % len(all_positions)
                                 candidate = all_positions[next_pos]
-                                print(f"  检查位置: {candidate} (索引 {next_pos})")
+                                logger.debug("  检查位置: %s (索引 %s)", candidate, next_pos)
                                 if candidate in sorted_active_players:
                                     small_blind_idx = candidate
-                                    print(f"  找到小盲位置: {small_blind_idx}, 玩家: {self.players[small_blind_idx]['name']}")
+                                    logger.debug("  找到小盲位置: %s, 玩家: %s", small_blind_idx, self.players[small_blind_idx]['name'])
                                     break
                             else:
-                                print(f"警告: 无法找到庄家之后的活跃玩家作为小盲")
+                                logger.warning("警告: 无法找到庄家之后的活跃玩家作为小盲")
                         else:
-                            print(f"警告: 庄家位置 {self.dealer_idx} 不存在于所有位置列表中")
+                            logger.warning("警告: 庄家位置 %s 不存在于所有位置列表中", self.dealer_idx)
                     
                     # 设置第一个行动的玩家
                     self.current_player_idx = small_blind_idx
                     
                     if small_blind_idx is not None:
                         player_name = self.players[small_blind_idx].get('name', f'Player_{small_blind_idx}')
-                        print(f"小盲位置或之后的第一个活跃玩家 {player_name} (位置 {small_blind_idx}) 将首先行动")
+                        logger.debug("小盲位置或之后的第一个活跃玩家 %s (位置 %s) 将首先行动", player_name, small_blind_idx)
                     else:
-                        print("警告: small_blind_idx 是 None，无法设置第一个行动的玩家")
+                        logger.warning("警告: small_blind_idx 是 None，无法设置第一个行动的玩家")
                 else:
-                    print("警告: 没有活跃玩家可以行动")
+                    logger.warning("警告: 没有活跃玩家可以行动")
             
             # 如果设置了current_player_idx，同时更新current_player
             if self.current_player_idx in self.players:
                 self.current_player = self.players[self.current_player_idx]["name"]
-                print(f"已设置当前玩家为: {self.current_player} (位置 {self.current_player_idx})")
+                logger.debug("已设置当前玩家为: %s (位置 %s)", self.current_player, self.current_player_idx)
                 # 启动新玩家的计时器
                 self.start_turn_timer()
             else:
-                print(f"警告: 当前玩家索引 {self.current_player_idx} 不存在于玩家字典中")
+                logger.warning("警告: 当前玩家索引 %s 不存在于玩家字典中", self.current_player_idx)
                 
             # 打印当前状态
-            print(f"\n进入{self.betting_round}轮, 当前玩家索引: {self.current_player_idx}, 底池: {self.pot}")
-            print(f"公共牌: {[str(card) for card in self.community_cards]}")
-            print("==== advance_betting_round 完成 ====\n")
+            logger.debug("进入%s轮, 当前玩家索引: %s, 底池: %s", self.betting_round, self.current_player_idx, self.pot)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("公共牌: %s", [str(card) for card in self.community_cards])
+            logger.debug("==== advance_betting_round 完成 ====")
             
         except Exception as e:
-            print(f"Advance betting round error: {e}")
-            traceback.print_exc()
+            logger.exception("Advance betting round error: %s", e)
 
     def get_state(self):
-        """获取游戏状态"""
+        """获取游戏状态
+
+        除计时器剩余时间外的部分按 version 缓存，同一次操作中多次调用（广播、
+        计时器更新、重连）只复制顶层字典。返回的字典及其子结构与缓存共享，调用方不能修改。
+        """
+        cache = self._state_cache
+        if cache is not None and cache[0] == self.version:
+            base = cache[1]
+        else:
+            version = self.version
+            base = self._build_state()
+            # 生成过程中出错时不缓存
+            if "error" not in base:
+                self._state_cache = (version, base)
+
+        state = dict(base)
+        # 添加计时器信息
+        if self.turn_start_time:
+            time_elapsed = time.time() - self.turn_start_time
+            remaining_time = max(0, self.player_turn_time - time_elapsed)
+            state["turn_remaining_time"] = remaining_time
+            state["turn_time_limit"] = self.player_turn_time
+        return state
+
+    def _build_state(self):
+        """生成不含计时器信息的状态快照"""
         try:
             # 创建游戏状态字典
             state = {
@@ -796,7 +863,7 @@ class Game:
                 "community_cards": self.community_cards,
                 "dealer_idx": self.dealer_idx,
                 "current_player_idx": self.current_player_idx,
-                "current_player": self.players[self.current_player_idx],
+                "current_player": self.players[self.current_player_idx].public_dict(),
                 "betting_round": self.betting_round,
                 "game_phase": self.get_game_phase(),
                 "active_players": self.active_players,
@@ -812,13 +879,6 @@ class Game:
             else:
                 state["current_player_id"] = ""
             
-            # 添加计时器信息
-            if self.turn_start_time:
-                time_elapsed = time.time() - self.turn_start_time
-                remaining_time = max(0, self.player_turn_time - time_elapsed)
-                state["turn_remaining_time"] = remaining_time
-                state["turn_time_limit"] = self.player_turn_time
-                
             # 为每个玩家创建状态信息
             for position, player in self.players.items():
                 # 基本信息
@@ -828,22 +888,22 @@ class Game:
                     "position": position,
                     "seat": position,  # 确保返回seat信息
                     "is_active": position in self.active_players,
-                    "bet_amount": player.get("bet_amount", 0),
+                    "bet_amount": player.bet_amount,
                     "folded": position not in self.active_players,
                     "is_current_player": position == self.current_player_idx,
                     "total_buy_in": player.get("total_buy_in", player.get("chips", 0)),
-                    "pending_buy_in": player.get("pending_buy_in", 0),
-                    "online": player.get("online", True),
-                    "avatar": player["avatar"]
+                    "pending_buy_in": player.pending_buy_in,
+                    "online": player.online,
+                    "avatar": player.avatar
                 }
                 
                 # 直接从玩家对象获取弃牌状态
-                player_state["has_discarded"] = player.get("has_discarded", False)
+                player_state["has_discarded"] = player.has_discarded
                 
                 # 在游戏结束时 (hand_complete) 或者摊牌阶段 (betting_round >= 4) 显示所有活跃玩家的牌
                 if self.hand_complete or self.betting_round >= 4:
-                    if player.get("hand") and position in self.active_players:
-                        player_state["hand"] = player.get("hand", [])
+                    if player.hand and position in self.active_players:
+                        player_state["hand"] = player.hand
                         # 如果有赢家，添加牌型信息
                         if hasattr(self, 'hand_winners') and position in self.hand_winners:
                             # 在这里可以添加牌型信息，比如"两对"，"同花顺"等
@@ -862,8 +922,7 @@ class Game:
             
         except Exception as e:
             import traceback
-            print(f"Error in Game.get_state: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in Game.get_state: %s", str(e))
             # Return minimal state to prevent crashes
             return {
                 "error": str(e),
@@ -877,7 +936,7 @@ class Game:
         """Get the remaining time for the current player's turn"""
         # 如果没有启动计时器，强制启动
         if not hasattr(self, 'turn_start_time') or self.turn_start_time is None:
-            print(f"警告: 计时器未启动，现在强制启动")
+            logger.warning("警告: 计时器未启动，现在强制启动")
             self.turn_start_time = time.time()
         
         # 计算剩余时间
@@ -894,13 +953,14 @@ class Game:
         # 记录当前时间作为计时器开始时间，确保始终设置
         if not hasattr(self, 'turn_start_time') or self.turn_start_time is None:
             self.turn_start_time = time.time()
-            print(f"计时器初始化: 设置时间为 {self.turn_start_time}")
+            logger.debug("计时器初始化: 设置时间为 %s", self.turn_start_time)
         
         # 创建超时处理计时器
         self.turn_timer = threading.Timer(self.player_turn_time, self.handle_timeout)
         self.turn_timer.daemon = True
         self.turn_timer.start()
         
+    @mutates_state
     def handle_timeout(self):
         """Handle case when player's turn timer expires"""
         player_idx = self.current_player_idx
@@ -954,14 +1014,11 @@ class Game:
                     
                     # 广播弃牌操作
                     try:
-                        # 使用辅助函数在新事件循环中执行广播
-                        run_async_in_new_loop(
-                            ws_manager.broadcast_to_room(room.room_id, discard_broadcast)
-                        )
-                        print(f"[BROADCAST][game_update]: Timeout discard, Player={player_name}, Index={discard_index}")
+                        # 计时器线程中运行，交给主事件循环广播
+                        ws_manager.submit_broadcast(room.room_id, discard_broadcast)
+                        logger.debug("[BROADCAST][game_update]: Timeout discard, Player=%s, Index=%s", player_name, discard_index)
                     except Exception as e:
-                        print(f"Error broadcasting timeout discard: {str(e)}")
-                        traceback.print_exc()
+                        logger.exception("Error broadcasting timeout discard: %s", str(e))
             
             # Default action is to fold if bet is required, check if possible
             if self.current_bet > self.players[player_idx].get("bet_amount", 0):
@@ -1020,14 +1077,11 @@ class Game:
             
             # 使用异步方式广播消息
             try:
-                # 使用辅助函数在新事件循环中执行广播
-                run_async_in_new_loop(
-                    ws_manager.broadcast_to_room(room.room_id, broadcast_message)
-                )
-                print(f"[BROADCAST][game_update]: Timeout action={action_taken}, Player={player_name}")
+                # 计时器线程中运行，交给主事件循环广播
+                ws_manager.submit_broadcast(room.room_id, broadcast_message)
+                logger.debug("[BROADCAST][game_update]: Timeout action=%s, Player=%s", action_taken, player_name)
             except Exception as e:
-                print(f"Error broadcasting timeout action: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error broadcasting timeout action: %s", str(e))
     
     def cancel_turn_timer(self):
         """Cancel the current turn timer"""
@@ -1042,14 +1096,14 @@ class Game:
                 self.turn_timer.cancel()
                 self.turn_timer = None
         except Exception as e:
-            print(f"Error canceling turn timer: {e}")
+            logger.error("Error canceling turn timer: %s", e)
             
         try:
             if self.next_hand_timer:
                 self.next_hand_timer.cancel()
                 self.next_hand_timer = None
         except Exception as e:
-            print(f"Error canceling next hand timer: {e}")
+            logger.error("Error canceling next hand timer: %s", e)
             
     def schedule_next_hand(self):
         """Cancel existing timers and schedule the start of the next hand after 5 seconds"""
@@ -1061,7 +1115,7 @@ class Game:
         
         # Check if room exists and if game time is over
         if room and room.get_remaining_time() <= 0:
-            print(f"Game time is over. Ending game in room {room.room_id}")
+            logger.info("Game time is over. Ending game in room %s", room.room_id)
             # Cancel all timers to prevent memory leaks
             self.cancel_all_timers()
             
@@ -1080,22 +1134,20 @@ class Game:
             
             # Schedule the broadcast to avoid blocking
             try:
-                # 使用辅助函数在新事件循环中执行广播
-                run_async_in_new_loop(
-                    ws_manager.broadcast_to_room(room.room_id, game_end_message)
-                )
-                print(f"游戏结束广播已安排，原因：游戏时间已结束")
+                # 可能在计时器线程中运行，交给主事件循环广播
+                ws_manager.submit_broadcast(room.room_id, game_end_message)
+                logger.debug("游戏结束广播已安排，原因：游戏时间已结束")
             except Exception as e:
-                print(f"Error broadcasting game end: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error broadcasting game end: %s", str(e))
             
             return
         
-        print(f"Next hand will start in 5 seconds...")
+        logger.debug("Next hand will start in 5 seconds...")
         self.next_hand_timer = threading.Timer(5.0, self.start_next_hand)
         self.next_hand_timer.daemon = True
         self.next_hand_timer.start()
         
+    @mutates_state
     def start_next_hand(self):
         """Reset game state for next hand"""
         self.next_hand_timer = None
@@ -1113,24 +1165,24 @@ class Game:
         
         # 对离线但仍占座的玩家执行处理
         if offline_seated_players:
-            print(f"发现离线玩家，准备处理: {offline_seated_players}")
+            logger.debug("发现离线玩家，准备处理: %s", offline_seated_players)
             # 找到房间对象
             from src.models.room import get_room_by_game
             room = get_room_by_game(self)
             if room:
                 for position in offline_seated_players:
                     player_name = self.players[position].get("name")
-                    print(f"离线玩家 {player_name} (位置 {position}) 自动离座")
+                    logger.debug("离线玩家 %s (位置 %s) 自动离座", player_name, position)
                     
                     # 更新玩家在游戏中的状态
                     # 不能完全移除玩家数据，只是将状态更新为离线
                     if position in self.players:
                         self.players[position]["position"] = None
-                        print(f"已将离线玩家 {player_name} 的位置设置为None")
+                        logger.debug("已将离线玩家 %s 的位置设置为None", player_name)
         
         # 生成新的手牌ID
         self.handid = str(uuid.uuid4())
-        print(f"Starting next hand with handid: {self.handid}")
+        logger.debug("Starting next hand with handid: %s", self.handid)
         
         # 重置每个玩家的下注金额，allin状态，pending_buy_in结算，重置玩家弃牌状态。
         for position in self.players:
@@ -1145,26 +1197,27 @@ class Game:
             if self.players[position]['pending_buy_in'] > 0:
                 pending_amount = self.players[position]['pending_buy_in']
                 self.players[position]['chips'] += pending_amount
-                print(f"处理玩家 {self.players[position].get('name')} 在位置 {position} 的待处理买入: {pending_amount}，更新后筹码: {self.players[position]['chips']}")
+                logger.debug("处理玩家 %s 在位置 %s 的待处理买入: %s，更新后筹码: %s", self.players[position].get('name'), position, pending_amount, self.players[position]['chips'])
                 # 重置pending_buy_in为0
                 self.players[position]['pending_buy_in'] = 0
         
         # Check for active players with chips
-        self.active_players = sorted([position for position, player in self.players.items() if player["chips"] > 0 and player["online"]])
+        self.active_players = ActiveRing(sorted([position for position, player in self.players.items() if player["chips"] > 0 and player["online"]]))
+        self._index_players()
         
         # 更新初始玩家数量，确保新一手牌使用正确的行动顺序规则
         self.initial_player_count = len(self.active_players)
-        print(f"新一手牌的初始玩家数量: {self.initial_player_count}")
+        logger.debug("新一手牌的初始玩家数量: %s", self.initial_player_count)
         
         if len(self.active_players) <= 1:
-            print("Game paused: only one player with chips remaining")
+            logger.debug("Game paused: only one player with chips remaining")
             # 找到关联的房间对象
             from src.models.room import get_room_by_game
             room = get_room_by_game(self)
             if room:
                 # 将房间状态设置为 paused
                 room.status = "paused"
-                print(f"房间 {room.room_id} 状态设置为 paused - 等待更多玩家加入")
+                logger.debug("房间 %s 状态设置为 paused - 等待更多玩家加入", room.room_id)
             return
         
         current_dealer_index = self.dealer_idx
@@ -1172,25 +1225,26 @@ class Game:
         try:
             # 如果当前庄家位置不在活跃玩家列表中，则找一个新的庄家位置
             if self.dealer_idx not in self.active_players:
-                print(f"庄家位置 {self.dealer_idx} 不在活跃玩家列表中，寻找新的庄家位置")
+                logger.debug("庄家位置 %s 不在活跃玩家列表中，寻找新的庄家位置", self.dealer_idx)
                 # 从所有位置中找到一个最接近原庄家位置的活跃玩家作为新庄家
                 # 从庄家之后的位置开始找
                 for i in range(1, self.MAX_PLAYERS): # 使用类变量代替硬编码的8
                     next_pos = (self.dealer_idx + i) % self.MAX_PLAYERS
                     if next_pos in self.active_players:
                         self.dealer_idx = next_pos
-                        print(f"选择新的庄家位置: {self.dealer_idx}")
+                        logger.debug("选择新的庄家位置: %s", self.dealer_idx)
                         break
 
-            print(f"移动庄家按钮: {current_dealer_index} -> {self.dealer_idx} (位置 {self.dealer_idx})")
+            logger.debug("移动庄家按钮: %s -> %s (位置 %s)", current_dealer_index, self.dealer_idx, self.dealer_idx)
         except Exception as e:
             # 如果出错，选择第一个活跃玩家作为庄家
             self.dealer_idx = self.active_players[0]
-            print(f"ERROR 处理庄家按钮时出错: {str(e)}，选择第一个活跃玩家 {self.dealer_idx} 作为庄家")
+            logger.error("ERROR 处理庄家按钮时出错: %s，选择第一个活跃玩家 %s 作为庄家", str(e), self.dealer_idx)
         
         # 调用start_round方法来处理发牌、盲注和玩家设置
         self.start_round()
 
+    @mutates_state
     def finish_hand(self):
         """
         Finish the current hand, determine winners and distribute the pot.
@@ -1202,7 +1256,7 @@ class Game:
             
             # Add player bets to the pot at the end of the hand
             pot_total = self.get_total_bets()
-            print(f"计算总底池: {self.pot} + {pot_total} = {self.pot + pot_total}")
+            logger.debug("计算总底池: %s + %s = %s", self.pot, pot_total, self.pot + pot_total)
             
             # 检查是否只有一个玩家剩余（其他人都弃牌）
             if len(self.active_players) == 1:
@@ -1224,7 +1278,7 @@ class Game:
                     "timestamp": time.time()
                 })
                 
-                print(f"Player {winner_name} wins {self.pot} chips (all others folded)")
+                logger.debug("Player %s wins %s chips (all others folded)", winner_name, self.pot)
                 
                 # 保存游戏历史记录
                 self.save_game_history()
@@ -1240,20 +1294,20 @@ class Game:
             if len(self.community_cards) < 5:
                 # Check if flop hasn't been dealt yet
                 if len(self.community_cards) == 0:
-                    print("Dealing flop at showdown")
+                    logger.debug("Dealing flop at showdown")
                     self.deal_flop()  # Deal 3 cards
                     
                 # Check if turn hasn't been dealt yet
                 if len(self.community_cards) == 3:
-                    print("Dealing turn at showdown")
+                    logger.debug("Dealing turn at showdown")
                     self.deal_turn()  # Deal 1 more card
                     
                 # Check if river hasn't been dealt yet
                 if len(self.community_cards) == 4:
-                    print("Dealing river at showdown")
+                    logger.debug("Dealing river at showdown")
                     self.deal_river()  # Deal final card
                 
-                print(f"Community cards at showdown (total: {len(self.community_cards)}): {self.community_cards}")
+                logger.debug("Community cards at showdown (total: %s): %s", len(self.community_cards), self.community_cards)
             
             # 分配奖池
             winners_info = self.distribute_pots()
@@ -1268,8 +1322,7 @@ class Game:
             self.schedule_next_hand()
             
         except Exception as e:
-            print(f"Error in Game.finish_hand: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in Game.finish_hand: %s", str(e))
 
     def find_next_player_with_chips(self, start_idx):
         """Find the next player with chips, starting from the given index"""
@@ -1278,27 +1331,13 @@ class Game:
             
         # 如果start_idx不在active_players中，使用第一个活跃玩家
         if start_idx not in self.active_players:
-            print(f"警告: 起始位置 {start_idx} 不在活跃玩家列表中，使用第一个活跃玩家")
-            if self.active_players:
-                return self.active_players[0]
-            return -1
-            
-        # 找到起始位置在列表中的索引    
-        start_index = self.active_players.index(start_idx)
-        
-        # 从下一个位置开始搜索有筹码的玩家
-        for i in range(1, len(self.active_players) + 1):
-            next_idx = (start_index + i) % len(self.active_players)
-            position = self.active_players[next_idx]
-            if self.players[position]["chips"] > 0:
-                return position
-                
-        # 如果循环一圈没找到有筹码的玩家，检查起始玩家
-        if self.players[start_idx]["chips"] > 0:
-            return start_idx
+            logger.warning("警告: 起始位置 %s 不在活跃玩家列表中，使用第一个活跃玩家", start_idx)
+            return self.active_players[0]
             
+        # 从下一个位置开始搜索有筹码的玩家，最后检查起始玩家
+        position = self.active_players.next_after(start_idx, lambda pos: self.players[pos]["chips"] > 0)
         # 没有玩家有筹码
-        return -1
+        return position if position is not None else -1
 
     def create_deck(self):
         """Create a new deck of cards"""
@@ -1382,11 +1421,7 @@ class Game:
         """
         try:
             # 查找玩家的位置
-            player_position = None
-            for position, player in self.players.items():
-                if player.get('name') == username:
-                    player_position = position
-                    break
+            player_position = self.get_player_position(username)
                     
             # 检查玩家是否存在且在活跃玩家列表中
             if player_position is not None and player_position in self.active_players:
@@ -1394,7 +1429,7 @@ class Game:
                 
             return False
         except Exception as e:
-            print(f"Error in is_player_active: {str(e)}")
+            logger.error("Error in is_player_active: %s", str(e))
             return False
 
     def get_player_hand(self, player_id):
@@ -1409,37 +1444,36 @@ class Game:
                 - discarded_card (dict): 玩家弃掉的牌
         """
         try:
-            # 在玩家字典中查找匹配ID或名称的玩家
-            for position, player in self.players.items():
-                if player.get('name') == player_id:
-                    print(f"找到玩家 {player_id} 的信息:")
-                    hand = player.get('hand', [])
-                    discarded = player.get('discarded_card', None)
-                    hand_str = [card['display'] for card in hand] if hand else []
-                    print(f"- 手牌: {hand_str}")
-                    print(f"- 弃牌: {discarded['display'] if discarded else None}")
-                    return hand, discarded
+            # 按用户名查找玩家的座位
+            position = self.get_player_position(player_id)
+            if position is not None:
+                player = self.players[position]
+                hand = player.get('hand', [])
+                discarded = player.get('discarded_card', None)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("找到玩家 %s 的信息: 手牌=%s, 弃牌=%s", player_id,
+                                 [card['display'] for card in hand] if hand else [],
+                                 discarded['display'] if discarded else None)
+                return hand, discarded
             
             # 如果未找到玩家，记录并返回None
-            print(f"Player {player_id} not found in game")
+            logger.debug("Player %s not found in game", player_id)
             return None, None
         except Exception as e:
-            print(f"Error in get_player_hand: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in get_player_hand: %s", str(e))
             return None, None
 
     def get_total_bets(self):
         """计算所有玩家的当前下注总额"""
-        total = 0
-        for position, player in self.players.items():
-            total += player.get('bet_amount', 0)
-        return total
+        return sum(player.bet_amount for player in self.players.values())
         
+    @mutates_state
     def reset_all_bets(self):
         """重置所有玩家的当前下注"""
-        for position, player in self.players.items():
-            self.players[position]['bet_amount'] = 0
+        for player in self.players.values():
+            player.bet_amount = 0
 
+    @mutates_state
     def handle_discard(self, player_idx, discard_index):
         """
         处理弃牌操作 - 该操作可以在任何时候执行，不需要是当前玩家的回合
@@ -1454,7 +1488,7 @@ class Game:
         try:
             # 确保玩家在游戏中
             if player_idx not in self.players:
-                print(f"玩家 {player_idx} 不在玩家列表中")
+                logger.debug("玩家 %s 不在玩家列表中", player_idx)
                 return {"success": False, "message": "玩家不在游戏中"}
             
             # 获取玩家信息
@@ -1463,25 +1497,25 @@ class Game:
             
             # 检查是否已经弃牌
             if player.get("has_discarded", False):
-                print(f"玩家 {player_name} 已经弃过牌")
+                logger.debug("玩家 %s 已经弃过牌", player_name)
                 return {"success": False, "message": "玩家已经弃过牌"}
             
             # 检查弃牌索引是否有效
             try:
                 discard_index = int(discard_index)
             except (TypeError, ValueError):
-                print(f"无效的弃牌索引: {discard_index}")
+                logger.debug("无效的弃牌索引: %s", discard_index)
                 return {"success": False, "message": "无效的弃牌索引"}
             
             # 检查手牌
             hand = player.get("hand", [])
             if not hand:
-                print(f"玩家 {player_name} 没有手牌")
+                logger.debug("玩家 %s 没有手牌", player_name)
                 return {"success": False, "message": "玩家没有手牌"}
             
             # 检查索引是否在有效范围内
             if discard_index < 0 or discard_index >= len(hand):
-                print(f"弃牌索引超出范围: {discard_index}, 玩家手牌: {len(hand)}张")
+                logger.debug("弃牌索引超出范围: %s, 玩家手牌: %s张", discard_index, len(hand))
                 return {"success": False, "message": f"弃牌索引超出范围: {discard_index}"}
             
             # 移除选中的牌
@@ -1489,7 +1523,7 @@ class Game:
             player["discarded_card"] = discarded_card
             player["has_discarded"] = True
             
-            print(f"玩家 {player_name} 弃掉了第 {discard_index} 张牌: {discarded_card}")
+            logger.debug("玩家 %s 弃掉了第 %s 张牌: %s", player_name, discard_index, discarded_card)
             
             # 记录动作到历史记录
             self.action_history.append({
@@ -1505,7 +1539,7 @@ class Game:
             return {"success": True, "message": "成功弃牌", "discarded_card": discarded_card}
             
         except Exception as e:
-            print(f"处理弃牌操作时发生错误: {str(e)}")
+            logger.error("处理弃牌操作时发生错误: %s", str(e))
             import traceback
             traceback.print_exc()
             return {"success": False, "message": f"处理弃牌操作时发生错误: {str(e)}"}
@@ -1513,7 +1547,7 @@ class Game:
     def save_game_history(self):
         try:
             if not self.action_history:
-                print("没有行动历史记录可保存")
+                logger.debug("没有行动历史记录可保存")
                 return False
                 
             # 创建一个包含游戏关键信息的游戏记录
@@ -1553,15 +1587,14 @@ class Game:
             
             # 添加玩家信息，包括正确的筹码变化
             for position, player in self.players.items():
-                if isinstance(player, dict):
-                    initial_chips = player.get("initial_chips", 0)
-                    player_record = {
-                        "name": player.get("name", ""),
-                        "position": position,
-                        "chips_start": initial_chips,
-                        "chips_end": initial_chips + player_gains[position]  # 使用计算的净变化
-                    }
-                    game_record["players"].append(player_record)
+                start_chips = getattr(self, "hand_start_chips", {}).get(position, player.get("initial_chips", 0))
+                player_record = {
+                    "name": player.get("name", ""),
+                    "position": position,
+                    "chips_start": start_chips,
+                    "chips_end": start_chips + player_gains[position]  # 使用计算的净变化
+                }
+                game_record["players"].append(player_record)
             
             # 添加赢家信息
             if hasattr(self, 'hand_winners') and self.hand_winners:
@@ -1589,38 +1622,54 @@ class Game:
                 
                 if 'player_idx' in entry:
                     player_idx = entry['player_idx']
-                    player_info = self.players.get(player_idx, {})
-                    if isinstance(player_info, dict):
+                    player_info = self.players.get(player_idx)
+                    if player_info is not None:
                         formatted_entry['player_name'] = player_info.get('name', f"玩家{player_idx}")
                     else:
                         formatted_entry['player_name'] = f"玩家{player_idx}"
                 
                 game_record["actions"].append(formatted_entry)
             
-            # 将游戏记录添加到历史列表中
+            # 加入内存中的最近牌局，超出容量时自动丢弃最早的一局
             self.game_history.append(game_record)
             
-            print(f"已保存游戏历史记录，总共有 {len(self.game_history)} 局游戏历史")
+            # 完整历史写入数据库
+            if self.room_id:
+                db_manager.get_instance().record_hand(
+                    self.handid, self.room_id, game_record["end_time"], game_record)
+            
+            logger.debug("已保存游戏历史记录，内存中保留 %s 局", len(self.game_history))
             return True
         except Exception as e:
-            print(f"保存游戏历史记录时出错: {str(e)}")
-            traceback.print_exc()
+            logger.exception("保存游戏历史记录时出错: %s", str(e))
             return False
 
-    def get_game_history(self):
-        """获取游戏历史记录
+    def get_game_history(self, limit=HAND_HISTORY_PAGE_SIZE, before=None):
+        """从内存中的最近牌局获取一页历史记录
+        
+        Args:
+            limit (int): 每页牌局数
+            before (str): 可选，牌局ID，只返回该牌局之前的牌局（与数据库相同的键集分页）
         
         Returns:
-            dict: 包含当前游戏和历史游戏的历史记录
+            list: 按时间先后排列的牌局记录；内存缓冲区中不足 limit 手或找不到 before 时返回None，
+                  调用方应改为从数据库读取（DBManager.get_room_hands）
         """
         try:
-            print(f"获取游戏历史记录，包含当前游戏和 {len(self.game_history)} 局历史游戏")
-            
-            return self.game_history
+            end = len(self.game_history)
+            if before is not None:
+                end = next((i for i, record in enumerate(self.game_history)
+                            if record.get("game_id") == before), None)
+                if end is None:
+                    return None if self.room_id else []
+            if self.room_id and limit > end:
+                return None
+            
+            start = max(end - limit, 0)
+            logger.debug("获取游戏历史记录: %s-%s / %s", start, end, len(self.game_history))
+            return [self.game_history[i] for i in range(start, end)]
         except Exception as e:
-            import traceback
-            print(f"获取游戏历史记录错误: {str(e)}")
-            traceback.print_exc()
+            logger.exception("获取游戏历史记录错误: %s", str(e))
             return []
 
     def check_all_in_situation(self):
@@ -1633,13 +1682,13 @@ class Game:
         Returns:
             bool: 如果所有活跃玩家都已全下或者最多只有一个玩家有筹码，返回True
         """
-        print("\n检查是否满足提前摊牌条件:")
+        logger.debug("检查是否满足提前摊牌条件:")
         
         # 首先检查是否所有活跃玩家都已经行动过
         all_acted = self.check_all_players_acted()
-        print(f"条件1 - 所有玩家都已行动过: {all_acted}")
+        logger.debug("条件1 - 所有玩家都已行动过: %s", all_acted)
         if not all_acted:
-            print("  不满足提前摊牌条件：还有玩家未行动")
+            logger.debug("  不满足提前摊牌条件：还有玩家未行动")
             return False
             
         # 然后检查活跃玩家中有筹码的玩家数量
@@ -1649,21 +1698,20 @@ class Game:
         ]
         
         # 打印每个活跃玩家的状态
-        print(f"当前活跃玩家: {self.active_players}")
-        for pos in self.active_players:
-            player = self.players[pos]
-            has_chips = player.get("chips", 0) > 0
-            is_folded = player.get("folded", False)
-            is_all_in = player.get("is_all_in", False)
-            print(f"  玩家 {player.get('name', f'位置{pos}')} (位置 {pos}): " +
-                  f"筹码={player.get('chips', 0)}, 弃牌={is_folded}, 全下={is_all_in}")
+        logger.debug("当前活跃玩家: %s", self.active_players)
+        if logger.isEnabledFor(logging.DEBUG):
+            for pos in self.active_players:
+                player = self.players[pos]
+                logger.debug("  玩家 %s (位置 %s): 筹码=%s, 弃牌=%s, 全下=%s",
+                             player.get('name', f'位置{pos}'), pos, player.get('chips', 0),
+                             player.get("folded", False), player.get("is_all_in", False))
         
-        print(f"条件2 - 最多只有一名活跃玩家还有筹码: {len(active_players_with_chips) <= 1}")
+        logger.debug("条件2 - 最多只有一名活跃玩家还有筹码: %s", len(active_players_with_chips) <= 1)
         if len(active_players_with_chips) <= 1:
-            print(f"  满足提前摊牌条件: 有筹码的活跃玩家只有 {len(active_players_with_chips)} 名")
+            logger.debug("  满足提前摊牌条件: 有筹码的活跃玩家只有 %s 名", len(active_players_with_chips))
         else:
-            print(f"  不满足提前摊牌条件: 还有 {len(active_players_with_chips)} 名活跃玩家有筹码")
-            print(f"  有筹码的活跃玩家: {active_players_with_chips}")
+            logger.debug("  不满足提前摊牌条件: 还有 %s 名活跃玩家有筹码", len(active_players_with_chips))
+            logger.debug("  有筹码的活跃玩家: %s", active_players_with_chips)
         
         # 只有当所有玩家都行动过，且最多只有一个玩家还有筹码时，才进入摊牌
         return len(active_players_with_chips) <= 1
@@ -1672,10 +1720,10 @@ class Game:
     def create_side_pots(self):
         """创建主池和边池"""
         try:
-            print("\n=== 创建边池 ===")
+            logger.debug("=== 创建边池 ===")
             # 先计算所有下注总额作为验证
             total_bets = self.get_total_bets()
-            print(f"所有下注总额: {total_bets}")
+            logger.debug("所有下注总额: %s", total_bets)
             
             # 重置边池和主池
             self.side_pots = []
@@ -1695,7 +1743,7 @@ class Game:
             
             # 如果没有下注，直接返回
             if not bets:
-                print("没有玩家下注，不创建池")
+                logger.debug("没有玩家下注，不创建池")
                 return
                 
             # 按下注从小到大排序
@@ -1704,7 +1752,7 @@ class Game:
             # 创建主池 - 所有玩家共同贡献的部分
             min_bet = bets[0]["bet"]
             self.main_pot = min_bet * len(bets)
-            print(f"创建主池: {self.main_pot} (最小下注 {min_bet} × {len(bets)} 名玩家)")
+            logger.debug("创建主池: %s (最小下注 %s × %s 名玩家)", self.main_pot, min_bet, len(bets))
             
             # 创建边池 - 处理每个下注级别的差额部分
             prev_bet = min_bet  # 从最小下注开始，已经处理过了
@@ -1732,20 +1780,20 @@ class Game:
                 }
                 
                 self.side_pots.append(side_pot)
-                print(f"创建边池 {i}: 金额={pot_amount}, 下注级别={current_bet}, 有资格玩家={eligible_positions}")
+                logger.debug("创建边池 %s: 金额=%s, 下注级别=%s, 有资格玩家=%s", i, pot_amount, current_bet, eligible_positions)
                 
                 prev_bet = current_bet
             
             # 验证计算是否正确
             calculated_total = self.main_pot + sum(pot["amount"] for pot in self.side_pots)
-            print(f"计算后的总奖池: {calculated_total}, 实际下注总额: {total_bets}")
+            logger.debug("计算后的总奖池: %s, 实际下注总额: %s", calculated_total, total_bets)
             assert calculated_total == total_bets, "奖池计算错误!"
             
         except Exception as e:
-            print(f"创建边池出错: {str(e)}")
-            traceback.print_exc()
+            logger.exception("创建边池出错: %s", str(e))
 
     # 在合适的地方添加以下分配边池奖励的方法
+    @mutates_state
     def distribute_pots(self):
         """分配主池和边池奖励给胜利的玩家"""
         try:
@@ -1755,7 +1803,7 @@ class Game:
             active_players = self.active_players
             
             if active_players:
-                print(f"分配主池: {self.main_pot}")
+                logger.debug("分配主池: %s", self.main_pot)
                 # 评估并分配主池
                 self._evaluate_and_distribute(active_players, self.pot + self.main_pot, "主池", winners_info)
             
@@ -1768,9 +1816,9 @@ class Game:
                 # 只考虑有资格且仍在游戏中的玩家
                 active_eligible = [p for p in eligible_players if p in self.active_players]
                 
-                print(f"分配边池 {pot_idx}: 金额={pot_amount}, 下注级别={bet_level}")
-                print(f"- 有资格玩家: {eligible_players}")
-                print(f"- 活跃有资格玩家: {active_eligible}")
+                logger.debug("分配边池 %s: 金额=%s, 下注级别=%s", pot_idx, pot_amount, bet_level)
+                logger.debug("- 有资格玩家: %s", eligible_players)
+                logger.debug("- 活跃有资格玩家: %s", active_eligible)
                 
                 if not active_eligible:
                     # 如果没有活跃的有资格玩家，返还给下注最多的玩家
@@ -1783,7 +1831,7 @@ class Game:
                         "pot_type": f"side_pot_{pot_idx}_returned"
                     })
                     
-                    print(f"边池 {pot_idx} 没有活跃有资格玩家，{pot_amount} 返还给玩家 {self.players[highest_bettor]['name']}")
+                    logger.debug("边池 %s 没有活跃有资格玩家，%s 返还给玩家 %s", pot_idx, pot_amount, self.players[highest_bettor]['name'])
                     continue
                 
                 # 分配边池给活跃的有资格玩家
@@ -1792,8 +1840,7 @@ class Game:
             return winners_info
             
         except Exception as e:
-            print(f"分配奖池时出错: {str(e)}")
-            traceback.print_exc()
+            logger.exception("分配奖池时出错: %s", str(e))
             return []
 
     def _evaluate_and_distribute(self, players, pot_amount, pot_type, winners_info):
@@ -1845,11 +1892,10 @@ class Game:
                     "hand_type": best_score[3] if isinstance(best_score, tuple) and len(best_score) > 3 else "unknown"
                 })
                 
-                print(f"玩家 {self.players[winner_idx]['name']} 赢得边池 {pot_type} 的 {amount} 筹码")
+                logger.debug("玩家 %s 赢得边池 %s 的 %s 筹码", self.players[winner_idx]['name'], pot_type, amount)
             
         except Exception as e:
-            print(f"评估边池奖励时出错: {str(e)}")
-            traceback.print_exc()
+            logger.exception("评估边池奖励时出错: %s", str(e))
 
 async def timer_update_task():
     # 在函数内部导入以避免循环导入
@@ -1860,7 +1906,7 @@ async def timer_update_task():
     last_update_time = {}  # 存储每个房间上次更新时间
     update_count = 0  # 计数器，用于定期输出统计信息
     
-    print(f"[DEBUG] Timer update task started at {datetime.datetime.now()}")
+    logger.info("Timer update task started at %s", datetime.datetime.now())
     
     while True:
         try:
@@ -1899,6 +1945,8 @@ async def timer_update_task():
                         if current_state['status'] != prev_state['status']:
                             state_changed = True
                             change_reason = f"Room status changed: {prev_state['status']} -> {current_state['status']}"
+                            # 房间状态在大厅可见（例如 playing -> paused）
+                            room_manager.room_changed(room_id)
                         elif current_state['game_phase'] != prev_state['game_phase']:
                             state_changed = True
                             change_reason = f"Game phase changed: {prev_state['game_phase']} -> {current_state['game_phase']}"
@@ -1920,11 +1968,10 @@ async def timer_update_task():
                     # 决定是否需要发送更新 - 只在首次或状态变化时发送
                     should_update = is_first_update or state_changed
                     
-                    # 记录更详细的调试信息
-                    if update_count % 10 == 0:  # 限制日志输出频率
-                        elapsed_since_last = current_time - last_update_time.get(room_id, 0)
-                        if change_reason:
-                            print(f"[DEBUG] Room {room_id}: Change reason: {change_reason}")
+                    # 记录更详细的调试信息（按房间采样，限制日志输出频率）
+                    if change_reason and logger.isEnabledFor(logging.DEBUG):
+                        log_sampled(logger, logging.DEBUG, f"timer_update:{room_id}", 10,
+                                    "Room %s: Change reason: %s", room_id, change_reason)
                     
                     if should_update:
                         # 获取完整的游戏状态
@@ -1958,8 +2005,7 @@ async def timer_update_task():
                         last_update_time[room_id] = current_time
             
         except Exception as e:
-            print(f"[ERROR] Error in timer update task: {e}")
-            traceback.print_exc()
+            logger.exception("Error in timer update task: %s", e)
         
         # 检查频率仍然保持在每1-2秒一次，但实际更新会根据状态变化决定
         await asyncio.sleep(1)
\ No newline at end of file
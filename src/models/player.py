@@ -1,6 +1,14 @@
+from src.utils.logging_config import get_logger
+
+logger = get_logger("poker.player")
+
 class Player:
+    # 固定属性，不为每个玩家对象分配 __dict__
+    __slots__ = ("name", "chips", "total_buy_in", "pending_buy_in", "hole_cards", "discarded_card",
+                 "position", "seat", "current_bet", "total_bet", "status", "avatar")
+
     def __init__(self, name, chips, avatar):
-        print(f"Creating Player: name={name}, chips={chips}")
+        logger.debug("Creating Player: name=%s, chips=%s", name, chips)
         self.name = name
         self.chips = chips
         self.total_buy_in = chips  # 新增：记录总买入金额，初始为首次买入量
@@ -13,16 +21,18 @@ class Player:
         self.total_bet = 0    # 当前牌局总下注额
         self.status = "active"  # active, folded, all-in
         self.avatar = avatar
-        print(f"Player {name} created successfully with no assigned seat")
+        logger.debug("Player %s created successfully with no assigned seat", name)
         
     def __getstate__(self):
         """Support for pickle serialization"""
-        state = self.__dict__.copy()
-        return state
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
         
     def __setstate__(self, state):
         """Support for pickle deserialization"""
-        self.__dict__.update(state)
+        # 兼容旧版本保存的 __dict__ 状态，忽略已不存在的属性
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
         
     def receive_card(self, card):
         """收到一张新牌"""
@@ -1,16 +1,26 @@
-from src.models.game import Game
+from src.models.game import Game, mutates_state
 import time
 from datetime import datetime, timedelta
 from src.models.player import Player
+from src.models.seat_state import SeatState
+from src.utils.metrics import ROOM_STATE_SECONDS, timed
 
 # Dictionary to store all rooms with their game references
 _games_to_rooms = {}
 
+# 房间活动时间更新监听器（由 RoomManager 注册，用于维护房间过期截止时间）
+_activity_listeners = []
+
 def get_room_by_game(game_instance):
     """Helper function to get the room that contains a specific game instance"""
     global _games_to_rooms
     return _games_to_rooms.get(id(game_instance))
 
+def add_activity_listener(callback):
+    """注册房间活动时间更新监听器，回调签名为 callback(room)"""
+    if callback not in _activity_listeners:
+        _activity_listeners.append(callback)
+
 class Room:
     def __init__(self, room_id, name, max_players=8, small_blind=None, big_blind=None, buy_in_min=None, buy_in_max=None, game_duration_hours=1):
         print(f"Creating Room: id={room_id}, name={name}")
@@ -38,6 +48,10 @@ class Room:
         self.game_duration_hours = game_duration_hours  # 游戏持续时间（小时）
         self.game_start_time = None
         self.game_end_time = None
+        
+        # 状态版本号，get_state 的快照按版本号缓存
+        self.version = 0
+        self._state_cache = None
         print(f"Room created successfully: id={room_id}")
         
     @property
@@ -60,12 +74,26 @@ class Room:
     def __getstate__(self):
         """Support for pickle serialization"""
         state = self.__dict__.copy()
+        state["_state_cache"] = None
         return state
         
     def __setstate__(self, state):
         """Support for pickle deserialization"""
         self.__dict__.update(state)
+        if "version" not in state:
+            self.version = 0
+            self._state_cache = None
+
+    def mark_dirty(self):
+        """房间状态已改变，下次 get_state 重新生成快照
+
+        房间方法经常直接修改 game.players，所以同时使牌局的快照失效。
+        """
+        self.version += 1
+        if self.game:
+            self.game.mark_dirty()
         
+    @mutates_state
     def remove_player(self, username):
         """从房间移除玩家"""
         if username not in self.players:
@@ -75,8 +103,10 @@ class Room:
         chips = player.chips
         
         # 如果游戏正在进行，玩家弃牌
-        if self.game and username in self.game.active_players:
-            self.game.active_players.remove(username)
+        if self.game:
+            position = self.game.get_player_position(username)
+            if position is not None and position in self.game.active_players:
+                self.game.active_players.remove(position)
             
         # 从房间移除玩家
         del self.players[username]
@@ -107,6 +137,7 @@ class Room:
         """检查是否有足够玩家开始游戏"""
         return len(self.players) >= 2
         
+    @mutates_state
     def start_game(self):
         """开始游戏"""
         try:
@@ -184,7 +215,7 @@ class Room:
             
             # 创建游戏实例
             print(f"Creating Game instance with players_info: {players_info}")
-            self.game = Game(players_info, small_blind=self.small_blind, big_blind=self.big_blind)
+            self.game = Game(players_info, small_blind=self.small_blind, big_blind=self.big_blind, room_id=self.room_id)
             global _games_to_rooms
             _games_to_rooms[id(self.game)] = self
             self.game.start_round() 
@@ -202,6 +233,7 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"游戏开始失败: {str(e)}"}
         
+    @mutates_state
     def end_game(self):
         """结束游戏"""
         if not self.game:
@@ -239,6 +271,13 @@ class Room:
     def update_activity_time(self):
         """更新房间最后活动时间"""
         self.last_activity_time = datetime.now()
+        
+        # 通知监听器重新计算房间的过期截止时间
+        for callback in _activity_listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error notifying room activity listener: {str(e)}")
     
     def is_expiring(self):
         """检查房间是否即将过期（还有5分钟过期）
@@ -285,6 +324,7 @@ class Room:
             
         return False
         
+    @mutates_state
     def player_buy_in(self, username, amount, seat_index):
         """处理玩家买入操作
         
@@ -396,6 +436,7 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"处理买入请求时出错: {str(e)}"}
     
+    @mutates_state
     def sit_down(self, username, seat_index):
         """处理玩家入座操作
         
@@ -448,7 +489,7 @@ class Room:
                     print(f"设置游戏中座位 {seat_index} 的玩家 {username} 在线状态为true，位置为{seat_index}")
                 else:
                     # 游戏已经开始，但座位号在game.players中不存在，需要添加新玩家数据
-                    self.game.players[seat_index] = {
+                    self.game.players[seat_index] = SeatState({
                         'name': username,
                         'chips': player.chips,
                         'position': seat_index,
@@ -459,7 +500,7 @@ class Room:
                         'discarded_card': None,
                         'bet_amount': 0,
                         'avatar': player.avatar
-                    }
+                    })
                     print(f"游戏已开始，添加新玩家 {username} 到game.players，座位 {seat_index}，筹码 {player.chips}")
             
             # 更新最后活动时间
@@ -484,6 +525,7 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"处理入座请求时出错: {str(e)}"}
             
+    @mutates_state
     def stand_up(self, username):
         """处理玩家站起操作
         
@@ -547,6 +589,7 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"处理站起请求时出错: {str(e)}"}
             
+    @mutates_state
     def leave(self, username):
         """处理玩家离开房间操作
         
@@ -640,8 +683,34 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"处理离开房间请求时出错: {str(e)}"}
     
+    @timed(ROOM_STATE_SECONDS)
     def get_state(self):
-        """获取房间状态"""
+        """获取房间状态
+
+        房间信息和玩家列表按 (version, status, 牌局 version) 缓存，
+        每次只重新计算剩余时间和牌局的计时器字段。
+        """
+        key = (self.version, self.status, id(self.game), self.game.version if self.game else None)
+        cache = self._state_cache
+        if cache is not None and cache[0] == key:
+            base = cache[1]
+        else:
+            base = self._build_state()
+            if "error" not in base:
+                self._state_cache = (key, base)
+
+        state = dict(base)
+        state["remaining_time"] = self.get_remaining_time()
+        if self.game:
+            state["game"] = self.game.get_state()
+            if self.is_game_started and self.game_start_time and self.game_end_time:
+                # 计算游戏剩余时间
+                remaining_time = (self.game_end_time - datetime.now()).total_seconds()
+                state["remaining_time"] = max(0, remaining_time)
+        return state
+
+    def _build_state(self):
+        """生成不含剩余时间和牌局状态的房间快照"""
         try:
             state = {
                 "room_id": self.room_id,
@@ -655,9 +724,6 @@ class Room:
                 "gamePhase": self.game.get_game_phase() if self.game else None  #需保留用于开始游戏时room_update更新gamePhase
             }
             
-            # 计算并添加剩余时间
-            state["remaining_time"] = self.get_remaining_time()
-            
             # 如果游戏尚未开始，仍然提供玩家信息
             if not self.game or (self.status != "playing" and self.status != "paused"):
                 # 添加玩家信息
@@ -676,19 +742,11 @@ class Room:
                     
                     state["players"].append(player_state)
             
-            # 如果游戏已经开始，添加游戏状态
+            # 如果游戏已经开始，添加游戏状态标志（牌局状态由 get_state 添加）
             if self.game:
-                game_state = self.game.get_state()
-                state["game"] = game_state
-                
                 # 设置游戏状态标志 - 在playing和paused状态下都设置
-                if self.is_game_started:
-                    # 计算游戏剩余时间
-                    if hasattr(self, 'game_start_time') and self.game_start_time and hasattr(self, 'game_end_time') and self.game_end_time:
-                        import datetime
-                        remaining_time = (self.game_end_time - datetime.datetime.now()).total_seconds()
-                        state["remaining_time"] = max(0, remaining_time)
-                        state["game_end_time"] = self.game_end_time.isoformat()
+                if self.is_game_started and self.game_start_time and self.game_end_time:
+                    state["game_end_time"] = self.game_end_time.isoformat()
                 state["is_game_started"] = self.is_game_started
             
             return state
@@ -704,6 +762,39 @@ class Room:
                 "error": str(e)
             }
 
+    def get_summary(self):
+        """获取房间列表中使用的房间摘要信息（房间列表接口和大厅推送共用）"""
+        # 获取玩家完整信息，包括座位号
+        players_info = []
+        for username, player in self.players.items():
+            player_info = {
+                "name": username,
+                "chips": player.chips,
+            }
+            # 添加座位信息
+            if hasattr(player, 'seat') and player.seat is not None:
+                player_info["position"] = player.seat
+
+            players_info.append(player_info)
+
+        return {
+            "id": self.room_id,
+            "name": self.name,
+            "max_players": self.max_players,
+            "small_blind": self.small_blind,
+            "big_blind": self.big_blind,
+            "buy_in_min": self.buy_in_min,
+            "buy_in_max": self.buy_in_max,
+            "players": players_info,
+            "current_players": len(self.players),
+            "game_duration_hours": self.game_duration_hours,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "is_game_started": self.is_game_started,
+            "status": self.status,
+            "remaining_time": self.remaining_time
+        }
+
+    @mutates_state
     def change_seat(self, username, new_seat_index):
         """Allow a player to change seats
         
@@ -779,6 +870,7 @@ class Room:
             traceback.print_exc()
             return {"success": False, "message": f"Error changing seat: {str(e)}"}
 
+    @mutates_state
     def player_online_status(self, username, is_online):
         """更新玩家在线状态
         
@@ -798,11 +890,10 @@ class Room:
             # 如果游戏已经开始，更新游戏中的玩家在线状态
             if self.game:
                 # 查找玩家在游戏中的位置
-                for position, player in self.game.players.items():
-                    if player.get('name') == username:
-                        self.game.players[position]['online'] = is_online
-                        print(f"已更新游戏中玩家 {username} 在位置 {position} 的在线状态为 {is_online}")
-                        break
+                position = self.game.get_player_position(username)
+                if position is not None:
+                    self.game.players[position]['online'] = is_online
+                    print(f"已更新游戏中玩家 {username} 在位置 {position} 的在线状态为 {is_online}")
                 
             print(f"已更新玩家 {username} 的在线状态为 {is_online}")
             return True
@@ -812,6 +903,7 @@ class Room:
             traceback.print_exc()
             return False
 
+    @mutates_state
     def check_and_resume_game(self):
         """检查是否满足继续游戏的条件，如果满足则恢复游戏
         
@@ -0,0 +1,150 @@
+class SeatState:
+    """牌局中一个座位的玩家状态
+
+    使用 __slots__ 保存固定字段，每个座位不再带一个 __dict__，
+    常用字段可以直接按属性访问（seat.chips、seat.bet_amount）。
+    同时保留字典接口（seat["chips"]、seat.get("hand", [])、"online" in seat），
+    已有的按键访问代码不需要修改；不在固定字段中的键保存在 _extra 中。
+    """
+
+    __slots__ = (
+        "name", "chips", "position", "avatar", "online",
+        "total_buy_in", "pending_buy_in", "initial_chips",
+        "bet_amount", "hand", "has_discarded", "discarded_card", "is_all_in", "folded",
+        "_extra",
+    )
+
+    # 未设置时的默认值，与原来各处 .get(key, default) 使用的默认值一致；
+    # 其余字段未设置时视为键不存在
+    DEFAULTS = {
+        "online": True,
+        "pending_buy_in": 0,
+        "bet_amount": 0,
+        "has_discarded": False,
+        "discarded_card": None,
+        "is_all_in": False,
+        "folded": False,
+    }
+
+    def __init__(self, data=None, **kwargs):
+        self._extra = {}
+        for key, value in self.DEFAULTS.items():
+            setattr(self, key, value)
+        self.hand = []
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    @classmethod
+    def from_dict(cls, data):
+        """把玩家字典转换为 SeatState，已经是 SeatState 时原样返回"""
+        return data if isinstance(data, cls) else cls(data)
+
+    # 字典接口
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return key in self._extra
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        return self._extra.get(key, default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def update(self, data):
+        for key, value in data.items():
+            self[key] = value
+
+    def keys(self):
+        return [key for key in _FIELDS if hasattr(self, key)] + list(self._extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        """转换为普通字典（JSON 输出使用）"""
+        data = {key: getattr(self, key) for key in _FIELDS if hasattr(self, key)}
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    copy = to_dict
+
+    def public_dict(self):
+        """不含手牌和弃牌的字典，用于广播给房间内所有人（包括观众）的状态"""
+        data = self.to_dict()
+        for key in PRIVATE_FIELDS:
+            data.pop(key, None)
+        return data
+
+    def __eq__(self, other):
+        if isinstance(other, (SeatState, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SeatState({self.to_dict()!r})"
+
+    # pickle 支持：保存为普通字典，字段变化后旧的存档仍然可以加载
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+
+# 只能发送给玩家本人的字段
+PRIVATE_FIELDS = ("hand", "discarded_card")
+
+_FIELDS = tuple(name for name in SeatState.__slots__ if name != "_extra")
+_FIELD_SET = frozenset(_FIELDS)
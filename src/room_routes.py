@@ -4,7 +4,7 @@ from fastapi import APIRouter, HTTPException, Depends, Request, Body
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 import uuid
-from src.database.db_manager import DBManager
+from src.database.async_db import async_db
 from src.managers.room_manager import get_instance
 from datetime import datetime
 
@@ -14,7 +14,7 @@ router = APIRouter(
 )
 
 # 获取数据库实例
-db = DBManager()
+db = async_db
 
 # 由 main.py 注入的 room_manager 实例
 room_manager = get_instance()  # 默认值，将在 main.py 中被覆盖
@@ -114,40 +114,9 @@ async def create_room(room_data: RoomCreate, request: Request):
 @router.get("/rooms", response_model=List[RoomResponse], summary="获取所有房间")
 async def get_all_rooms():
     rooms = room_manager.get_all_rooms()
-    result = []
-    
-    for room_id, room in rooms.items():
-        # 获取玩家完整信息，包括座位号
-        players_info = []
-        for username, player in room.players.items():
-            player_info = {
-                "name": username,
-                "chips": player.chips,
-            }
-            # 添加座位信息
-            if hasattr(player, 'seat') and player.seat is not None:
-                player_info["position"] = player.seat
-            
-            players_info.append(player_info)
-        
-        result.append({
-            "id": room_id,
-            "name": room.name,
-            "max_players": room.max_players,
-            "small_blind": room.small_blind,
-            "big_blind": room.big_blind,
-            "buy_in_min": room.buy_in_min,
-            "buy_in_max": room.buy_in_max,
-            "players": players_info,  # 使用完整的玩家信息
-            "current_players": len(room.players),
-            "game_duration_hours": room.game_duration_hours,
-            "created_at": room.created_at.isoformat() if room.created_at else None,  # 确保created_at是ISO格式字符串
-            "is_game_started": room.is_game_started,  # 使用Room类的is_game_started属性
-            "status": room.status,  # 添加房间状态
-            "remaining_time": room.remaining_time
-        })
-        
-    return result
+
+    # 与大厅WebSocket推送使用同一份房间摘要格式
+    return [room.get_summary() for room in rooms.values()]
 
 @router.get("/rooms/{room_id}", response_model=RoomResponse, summary="获取房间详情")
 async def get_room(room_id: str):
@@ -260,14 +229,10 @@ async def leave_room(
     # 检查游戏是否进行中，并处理游戏状态
     if room.game and username in room.players:
         # 找到玩家在game.players中的索引
-        player_index = -1
-        for i, player in enumerate(room.game.players):
-            if player.get("name") == username:
-                player_index = i
-                break
+        player_index = room.game.get_player_position(username)
         
         # 如果玩家正在游戏中
-        if player_index >= 0 and player_index in room.game.active_players:
+        if player_index is not None and player_index in room.game.active_players:
             # 如果是当前玩家的回合，自动弃牌
             if player_index == room.game.current_player_idx:
                 # 如果需要弃牌（Pineapple规则）
@@ -285,6 +250,7 @@ async def leave_room(
                 # 不是当前回合，标记为弃牌
                 if player_index in room.game.active_players:
                     room.game.active_players.remove(player_index)
+                    room.game.mark_dirty()
                     
                     # 如果只剩一个玩家，结束当前手牌
                     if len(room.game.active_players) == 1:
@@ -300,15 +266,24 @@ async def leave_room(
     if room.owner == username and room.players:
         # 选择第一个玩家作为新房主
         room.owner = next(iter(room.players))
+        room.mark_dirty()
         
-    # 记录离开和盈亏
+    # 记录离开和盈亏，等待事务提交，写入失败时不能静默丢失结算记录
     buy_in = 0  # 这里应该从数据库查询之前的买入金额，简化为0
-    db.record_game(room_id, username, buy_in, player_chips)
+    record_error = None
+    try:
+        await db.record_game(room_id, username, buy_in, player_chips, durable=True)
+    except Exception as e:
+        print(f"错误: 保存结算记录失败 room={room_id} player={username} cash_out={player_chips}: {str(e)}")
+        record_error = e
     
     # 如果房间中没有玩家了，删除房间
     if not room.players:
         room_manager.remove_room(room_id)
     
+    if record_error is not None:
+        raise HTTPException(status_code=500, detail="已离开房间，但结算记录保存失败")
+    
     return {"message": "成功离开房间", "cash_out": player_chips}
 
 # 确保导出路由器
@@ -0,0 +1,546 @@
+"""WebSocket 压力测试 / 长时间稳定性测试工具
+
+在本机启动（或连接）一个服务器，为每张桌子注册用户、创建并加入房间，
+通过 /ws/game/{room_id} 入座、买入并由机器人自动打牌。
+运行期间按固定间隔输出:
+    actions/s        服务器确认的玩家操作（game_update 广播）数量
+    p50/p95/p99      从发送 game_action 到收到对应 game_update 广播的延迟
+    cpu / rss        服务器进程（以及压测进程本身）的 CPU 占用和内存，读取自 /proc
+
+用法:
+    # 启动一个临时服务器（独立的数据库和工作目录），10 张桌子每桌 4 人，运行 2 分钟
+    python -m src.tools.load_test --spawn --tables 10 --players 4 --duration 120
+
+    # 测试已经在运行的服务器，并采样其进程
+    python -m src.tools.load_test --url http://127.0.0.1:8000 --server-pid 12345
+
+只依赖标准库和 requirements.txt 中的 websockets。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import websockets
+
+from src.utils.rate_limit import WS_RATE_LIMITS, TokenBucket
+
+# 仓库根目录，--spawn 时作为服务器的 PYTHONPATH
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT_PASSWORD = "load_test_password"
+BOT_AVATAR = "gg_plankton.webp"
+
+# 注册用户（scrypt 哈希）和建房的并发数
+SETUP_CONCURRENCY = 8
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# 机器人策略: 各操作的权重 (fold, passive, raise)，passive 为 check 或 call
+POLICIES = {
+    "random": (0.15, 0.6, 0.25),
+    "passive": (0.0, 1.0, 0.0),
+    "aggressive": (0.05, 0.35, 0.6),
+}
+
+
+def percentile(values, q):
+    """最近秩百分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class HttpClient:
+    """基于 urllib 的最简 JSON 客户端，请求在线程中执行，不阻塞事件循环"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, method, path, body=None, token=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if token:
+            request.add_header("Authorization", f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.loads(e.read() or b"null")
+            except ValueError:
+                detail = None
+            return e.code, detail
+
+    async def request(self, method, path, body=None, token=None):
+        return await asyncio.to_thread(self._request, method, path, body, token)
+
+    async def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                status, _ = await self.request("GET", "/api/rooms")
+                if status == 200:
+                    return True
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            await asyncio.sleep(0.25)
+        return False
+
+
+class ProcessSampler:
+    """从 /proc 读取进程的累计 CPU 时间和常驻内存"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.last = None
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # 进程名可能包含空格，从最后一个 ')' 之后开始解析; utime/stime 是第 14、15 个字段
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def _rss_mb(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def sample(self):
+        """返回 (cpu 百分比, rss MB)，进程不存在或没有 /proc 时返回 None"""
+        try:
+            now, cpu = time.monotonic(), self._cpu_seconds()
+            rss = self._rss_mb()
+        except (OSError, IndexError, ValueError):
+            return None
+        percent = 0.0
+        if self.last is not None and now > self.last[0]:
+            percent = (cpu - self.last[1]) / (now - self.last[0]) * 100
+        self.last = (now, cpu)
+        return percent, rss
+
+
+class Stats:
+    """全部机器人共享的计数器"""
+
+    def __init__(self):
+        self.actions = 0
+        self.latencies = []
+        self.interval_actions = 0
+        self.interval_latencies = []
+        self.errors = 0
+        self.disconnects = 0
+        self.hands = set()
+        self.connected = 0
+
+    def record_action(self, latency):
+        self.actions += 1
+        self.interval_actions += 1
+        if latency is not None:
+            self.latencies.append(latency)
+            self.interval_latencies.append(latency)
+
+    def take_interval(self):
+        actions, latencies = self.interval_actions, sorted(self.interval_latencies)
+        self.interval_actions, self.interval_latencies = 0, []
+        return actions, latencies
+
+
+class Bot:
+    """一个玩家连接：入座、买入，轮到自己时按策略行动"""
+
+    def __init__(self, args, http, stats, username, seat, policy):
+        self.args = args
+        self.http = http
+        self.stats = stats
+        self.username = username
+        self.seat = seat
+        self.policy = POLICIES[policy]
+        self.token = None
+        self.room_id = None
+        self.ws = None
+
+        self.waiters = []
+        # 已经行动过的局面，避免同一个局面收到多次广播时重复操作
+        self.acted_on = None
+        # 等待广播确认的操作: (action, 发送时间)
+        self.pending = None
+        self.rebuying = False
+        # 按服务器的 game_action 预算控制发送速度，避免被限流或断开；
+        # 消息到达服务器时可能挤在一起，留出一些余量
+        rate, burst = WS_RATE_LIMITS["game_action"]
+        self.action_bucket = TokenBucket(rate * 0.8, max(1, burst // 2))
+
+    async def login(self):
+        credentials = {"username": self.username, "password": BOT_PASSWORD, "avatar": BOT_AVATAR}
+        status, body = await self.http.request("POST", "/api/auth/register", credentials)
+        if status not in (200, 400):
+            raise RuntimeError(f"register {self.username} failed: {status} {body}")
+        status, body = await self.http.request("POST", "/api/auth/login", credentials)
+        if status != 200:
+            raise RuntimeError(f"login {self.username} failed: {status} {body}")
+        self.token = body["access_token"]
+
+    async def join(self, room_id):
+        self.room_id = room_id
+        status, body = await self.http.request("POST", "/api/rooms/join", {
+            "room_id": room_id, "username": self.username, "avatar": BOT_AVATAR
+        }, self.token)
+        if status != 200:
+            raise RuntimeError(f"join {self.username} failed: {status} {body}")
+
+    async def connect(self):
+        ws_url = self.args.url.replace("http", "ws", 1)
+        self.ws = await websockets.connect(
+            f"{ws_url}/ws/game/{self.room_id}?token={self.token}", max_size=None)
+        self.stats.connected += 1
+
+    async def send(self, message):
+        await self.ws.send(json.dumps(message))
+
+    def wait_for(self, predicate, timeout=30):
+        """等待满足条件的消息（由接收循环匹配）"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((predicate, future))
+        return asyncio.wait_for(future, timeout)
+
+    async def room_action(self, action, **params):
+        """发送房间操作并等待结果（成功的 room_update 广播或错误）"""
+        reply = self.wait_for(lambda m: m.get("type") == "error" or (
+            m.get("type") == "room_update"
+            and m["data"].get("player") == self.username and m["data"].get("action") == action))
+        await self.send({"type": "room_action", "action": action, **params})
+        message = await reply
+        if message["type"] == "error":
+            raise RuntimeError(f"{action} by {self.username} failed: {message['data'].get('message')}")
+
+    async def take_seat(self):
+        await self.room_action("sit_down", seat_index=self.seat)
+        await self.room_action("buy_in", amount=self.args.buy_in, seat_index=self.seat)
+
+    async def run(self):
+        # 连接存活由协议层 ping/pong 判断（websockets 自动回复 pong），不需要发送应用层心跳
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                for waiter in list(self.waiters):
+                    predicate, future = waiter
+                    if future.done():
+                        self.waiters.remove(waiter)
+                    elif predicate(message):
+                        self.waiters.remove(waiter)
+                        future.set_result(message)
+                await self.handle(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.stats.connected -= 1
+            if not self.args.stopping:
+                self.stats.disconnects += 1
+                print(f"[{self.username}] connection closed: {self.ws.close_code} {self.ws.close_reason}")
+
+    async def handle(self, message):
+        message_type = message.get("type")
+        data = message.get("data") or {}
+
+        if message_type == "error":
+            self.stats.errors += 1
+            # 操作被拒绝，允许在下一次状态更新时重新行动
+            self.pending = None
+            self.acted_on = None
+            return
+        elif message_type != "game_update" and message_type != "game_state":
+            return
+
+        if message_type == "game_update" and self.pending and data.get("player") == self.username \
+                and data.get("action") == self.pending[0]:
+            self.stats.record_action(time.perf_counter() - self.pending[1])
+            self.pending = None
+
+        state = data.get("game_state") or data
+        game = state.get("game") if isinstance(state.get("game"), dict) else state
+        if "current_player_idx" not in game:
+            return
+        if game.get("handid"):
+            self.stats.hands.add((self.room_id, game["handid"]))
+        await self.maybe_act(game)
+
+    async def maybe_act(self, game):
+        me = next((p for p in game.get("players", []) if p.get("name") == self.username), None)
+        if me is None:
+            return
+
+        if me.get("chips", 0) <= 0 and not me.get("is_active") and not self.rebuying:
+            # 输光后重新买入，下一手牌生效
+            self.rebuying = True
+            await self.send({"type": "room_action", "action": "buy_in",
+                             "amount": self.args.buy_in, "seat_index": self.seat})
+            return
+        if me.get("chips", 0) > 0:
+            self.rebuying = False
+
+        if self.pending or game.get("game_phase") == "SHOWDOWN" or not me.get("is_active"):
+            return
+
+        # 每手牌先从三张手牌中弃掉一张，弃牌不需要等到自己的回合
+        if not me.get("has_discarded"):
+            await self._act("discard", card_index=random.randint(0, 2))
+            return
+
+        if game.get("current_player_idx") != self.seat:
+            return
+        key = (game.get("handid"), game.get("betting_round"), game.get("total_pot"), game.get("current_bet"))
+        if key == self.acted_on:
+            return
+        self.acted_on = key
+
+        if self.args.think_time:
+            await asyncio.sleep(random.uniform(0, self.args.think_time))
+
+        current_bet = game.get("current_bet", 0) or 0
+        my_bet = me.get("bet_amount", 0) or 0
+        chips = me.get("chips", 0)
+        fold, passive, _ = self.policy
+        roll = random.random()
+        if roll < fold and current_bet > my_bet:
+            await self._act("fold")
+        elif roll < fold + passive or chips <= current_bet - my_bet:
+            await self._act("call" if current_bet > my_bet else "check")
+        else:
+            big_blind = (game.get("blinds") or {}).get("big", 1)
+            target = max(current_bet * 2, big_blind * 2)
+            await self._act("raise", amount=min(chips, target - my_bet))
+
+    async def _act(self, action, **params):
+        while not self.action_bucket.take():
+            await asyncio.sleep(1 / self.action_bucket.rate)
+        self.pending = (action, time.perf_counter())
+        await self.send({"type": "game_action", "action": action, **params})
+
+
+async def setup_table(args, http, stats, table, semaphore):
+    """注册并登录一桌的机器人，创建房间，入座买入后开始游戏"""
+    policies = list(POLICIES) if args.policy == "mixed" else [args.policy]
+    bots = [Bot(args, http, stats, f"lt_{args.run_id}_{table}_{seat}", seat, policies[seat % len(policies)])
+            for seat in range(args.players)]
+
+    async with semaphore:
+        for bot in bots:
+            await bot.login()
+        owner = bots[0]
+        status, room = await http.request("POST", "/api/rooms", {
+            "name": f"load-{args.run_id}-{table}",
+            "creator": owner.username,
+            "max_players": max(args.players, 2),
+            "small_blind": args.small_blind,
+            "big_blind": args.small_blind * 2,
+            "buy_in_min": args.buy_in,
+            "buy_in_max": args.buy_in * 10,
+            "game_duration_hours": max(1.0, args.duration / 3600 + 1),
+        }, owner.token)
+        if status != 200:
+            raise RuntimeError(f"create room failed: {status} {room}")
+        for bot in bots:
+            await bot.join(room["id"])
+
+    tasks = []
+    for bot in bots:
+        await bot.connect()
+        tasks.append(asyncio.create_task(bot.run()))
+    for bot in bots:
+        await bot.take_seat()
+    await owner.room_action("start_game")
+    return bots, tasks
+
+
+def spawn_server(args):
+    """在临时目录中启动 uvicorn，使用独立的数据库和房间存档"""
+    workdir = tempfile.mkdtemp(prefix="poker_load_")
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "DB_PATH": os.path.join(workdir, "poker.db"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    print(f"Spawned server pid={process.pid}, workdir={workdir}")
+    return process, log
+
+
+async def report(args, stats, server, client, samples):
+    """按间隔输出吞吐、延迟和资源占用"""
+    start = time.monotonic()
+    last = start
+    while True:
+        await asyncio.sleep(args.interval)
+        now = time.monotonic()
+        actions, latencies = stats.take_interval()
+        server_usage = server.sample() if server else None
+        client_usage = client.sample()
+        sample = {
+            "elapsed": round(now - start, 1),
+            "actions_per_sec": round(actions / (now - last), 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "connected": stats.connected,
+            "errors": stats.errors,
+            "disconnects": stats.disconnects,
+            "server_cpu": round(server_usage[0], 1) if server_usage else None,
+            "server_rss_mb": round(server_usage[1], 1) if server_usage else None,
+            "client_cpu": round(client_usage[0], 1) if client_usage else None,
+        }
+        samples.append(sample)
+        last = now
+        server_text = (f"server cpu {sample['server_cpu']:5.1f}% rss {sample['server_rss_mb']:7.1f}MB"
+                       if server_usage else "server n/a")
+        client_text = f"client cpu {sample['client_cpu']:5.1f}%" if client_usage else ""
+        print(f"[{sample['elapsed']:7.1f}s] {sample['actions_per_sec']:7.1f} actions/s  "
+              f"p50 {sample['p50_ms']:6.1f}ms p95 {sample['p95_ms']:6.1f}ms p99 {sample['p99_ms']:6.1f}ms  "
+              f"conn {sample['connected']:4d} err {sample['errors']} drop {sample['disconnects']}  "
+              f"{server_text} {client_text}")
+
+
+def summarize(args, stats, samples, elapsed):
+    latencies = sorted(stats.latencies)
+    cpu = [s["server_cpu"] for s in samples[1:] if s["server_cpu"] is not None]
+    rss = [s["server_rss_mb"] for s in samples if s["server_rss_mb"] is not None]
+    summary = {
+        "tables": args.tables,
+        "players_per_table": args.players,
+        "duration": round(elapsed, 1),
+        "actions": stats.actions,
+        "actions_per_sec": round(stats.actions / elapsed, 1) if elapsed else 0,
+        "hands": len(stats.hands),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90": round(percentile(latencies, 0.90) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "errors": stats.errors,
+        "disconnects": stats.disconnects,
+        "server_cpu_avg": round(sum(cpu) / len(cpu), 1) if cpu else None,
+        "server_cpu_max": max(cpu) if cpu else None,
+        "server_rss_start_mb": rss[0] if rss else None,
+        "server_rss_max_mb": max(rss) if rss else None,
+        "server_rss_end_mb": rss[-1] if rss else None,
+    }
+
+    print("\n===== Load test summary =====")
+    print(f"Tables: {args.tables} x {args.players} players, duration {summary['duration']}s")
+    print(f"Actions: {summary['actions']} ({summary['actions_per_sec']}/s), hands started: {summary['hands']}")
+    lat = summary["latency_ms"]
+    print(f"Action->broadcast latency: p50 {lat['p50']}ms p90 {lat['p90']}ms "
+          f"p95 {lat['p95']}ms p99 {lat['p99']}ms max {lat['max']}ms")
+    print(f"Errors: {summary['errors']}, unexpected disconnects: {summary['disconnects']}")
+    if rss:
+        print(f"Server CPU avg {summary['server_cpu_avg']}% max {summary['server_cpu_max']}%, "
+              f"RSS {summary['server_rss_start_mb']}MB -> max {summary['server_rss_max_mb']}MB "
+              f"-> end {summary['server_rss_end_mb']}MB")
+    return summary
+
+
+async def run(args):
+    process = log = None
+    if args.spawn:
+        process, log = spawn_server(args)
+        args.url = f"http://127.0.0.1:{args.port}"
+        args.server_pid = process.pid
+
+    http = HttpClient(args.url)
+    tables = []
+    tasks = []
+    try:
+        if not await http.wait_ready(args.startup_timeout):
+            raise RuntimeError(f"Server at {args.url} is not responding")
+
+        stats = Stats()
+        server = ProcessSampler(args.server_pid) if args.server_pid else None
+        client = ProcessSampler(os.getpid())
+        samples = []
+
+        print(f"Setting up {args.tables} tables x {args.players} players (run id {args.run_id})...")
+        setup_start = time.monotonic()
+        semaphore = asyncio.Semaphore(SETUP_CONCURRENCY)
+        tables = await asyncio.gather(*[
+            setup_table(args, http, stats, table, semaphore) for table in range(args.tables)])
+        for _, bot_tasks in tables:
+            tasks.extend(bot_tasks)
+        print(f"Setup finished in {time.monotonic() - setup_start:.1f}s, running for {args.duration}s")
+
+        if server:
+            server.sample()
+        client.sample()
+        reporter = asyncio.create_task(report(args, stats, server, client, samples))
+        start = time.monotonic()
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - start
+        reporter.cancel()
+
+        summary = summarize(args, stats, samples, elapsed)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"summary": summary, "samples": samples}, f, indent=2)
+            print(f"Results written to {args.json}")
+    finally:
+        args.stopping = True
+        for bots, _ in tables:
+            for bot in bots:
+                if bot.ws is not None:
+                    await bot.ws.close()
+        for task in tasks:
+            task.cancel()
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="游戏 WebSocket 接口压力测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="服务器地址（默认: %(default)s）")
+    parser.add_argument("--spawn", action="store_true", help="在临时目录中启动一个本地 uvicorn 服务器")
+    parser.add_argument("--port", type=int, default=8765, help="--spawn 时服务器使用的端口")
+    parser.add_argument("--server-pid", type=int, default=None, help="采样 CPU 和内存的服务器进程 pid")
+    parser.add_argument("--tables", type=int, default=5, help="桌子数量")
+    parser.add_argument("--players", type=int, default=4, help="每桌玩家数量（2-8）")
+    parser.add_argument("--duration", type=float, default=60, help="运行时长（秒）")
+    parser.add_argument("--interval", type=float, default=5, help="报告间隔（秒）")
+    parser.add_argument("--policy", choices=list(POLICIES) + ["mixed"], default="mixed", help="机器人策略")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每次行动前的最大随机等待时间（秒）")
+    parser.add_argument("--buy-in", type=float, default=200, help="买入金额")
+    parser.add_argument("--small-blind", type=float, default=1, help="小盲注")
+    parser.add_argument("--startup-timeout", type=float, default=30, help="等待服务器就绪的时间（秒）")
+    parser.add_argument("--json", default=None, help="把汇总和每个间隔的采样写入 JSON 文件")
+    args = parser.parse_args()
+
+    if not 2 <= args.players <= 8:
+        parser.error("--players must be between 2 and 8")
+    args.run_id = uuid.uuid4().hex[:6]
+    args.stopping = False
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
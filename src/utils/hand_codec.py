@@ -0,0 +1,650 @@
+"""牌局历史的紧凑二进制编码
+
+Game.save_game_history 生成的牌局记录（字典）编码为一段字节：
+
+- 整数使用变长编码（varint），有符号数先做 zigzag 变换
+- 筹码金额按 0.01 的定点数存储，非整分的金额才用 8 字节浮点数
+- 牌编码为 0-51 的整数（点数序号 * 4 + 花色序号），每张牌 1 个字节
+- 玩家信息只在玩家表中出现一次，动作中只记录座位号
+- 时间戳以毫秒为单位，动作时间存储与上一个时间的差值
+- 字符串（动作名、原因、牌型等）进入字符串表，常用字符串使用内置表，不占空间
+
+解码结果与原始记录的字段一致（时间戳精确到毫秒）。
+
+文件格式为 FILE_MAGIC 后跟若干条 [varint 长度][记录]，
+HandWriter / HandReader 流式读写，export_text 把牌局逐行导出为文本格式的手牌历史。
+"""
+import json
+import struct
+import uuid
+from datetime import datetime, timezone
+
+FORMAT_VERSION = 1
+FILE_MAGIC = b"C32HH\x01"
+
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+SUITS = ('h', 'd', 'c', 's')
+_RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+_SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+# 无法编码为 0-51 的牌，后面跟一个通用值
+_RAW_CARD = 0xFF
+
+# 内置字符串表：只能在末尾追加，不能修改已有顺序
+COMMON_STRINGS = (
+    "small_blind", "big_blind", "fold", "check", "call", "raise", "bet", "all-in",
+    "discard", "timeout_discard", "timeout", "win", "win_side_pot",
+    "all_folded", "time_limit_reached", "unknown", "main",
+    "PRE_FLOP", "FLOP", "TURN", "RIVER", "SHOWDOWN",
+    "High Card", "One Pair", "Two Pair", "Three of a Kind", "Straight", "Flush",
+    "Full House", "Four of a Kind", "Straight Flush",
+    "round", "player_idx", "player", "player_name", "action", "amount", "timestamp",
+    "discard_index", "reason", "pot_index", "hand_type", "phase",
+)
+_COMMON_INDEX = {s: i for i, s in enumerate(COMMON_STRINGS)}
+
+# 通用值的类型标记
+_V_NONE, _V_TRUE, _V_FALSE, _V_INT, _V_CENTS, _V_FLOAT, _V_STR, _V_JSON = range(8)
+
+# 记录头标记
+_H_UUID = 1          # hand_id 是 UUID，存储 16 字节
+_H_START_TIME = 2    # 有 start_time
+
+# 动作标记
+_A_PLAYER = 1        # 有非负整数 player_idx
+_A_ROUND = 2         # 有非负整数 round
+_A_AMOUNT = 4        # 有 amount
+_A_TIMESTAMP = 8     # 有数值时间戳
+_A_NAME = 16         # 有 player 字段，值与玩家表一致
+_A_DISPLAY_NAME = 32 # 有 player_name 字段，值与玩家表一致
+
+# 动作中单独编码的字段，其余字段作为附加字段存储
+_ACTION_FIELDS = ("round", "player_idx", "player", "player_name", "action", "amount", "timestamp")
+_RECORD_FIELDS = ("game_id", "start_time", "end_time", "actions", "players", "winners",
+                  "pot", "community_cards", "small_blind", "big_blind")
+
+_DOUBLE = struct.Struct("<d")
+
+
+class HandCodecError(ValueError):
+    """二进制牌局数据格式错误"""
+
+
+# ---------------------------------------------------------------------------
+# 基础编码
+# ---------------------------------------------------------------------------
+
+def _write_uvarint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uvarint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[pos]
+        except IndexError:
+            raise HandCodecError("数据被截断")
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_svarint(out, value):
+    _write_uvarint(out, _zigzag(value))
+
+
+def _read_svarint(data, pos):
+    value, pos = _read_uvarint(data, pos)
+    return _unzigzag(value), pos
+
+
+def _write_bytes(out, raw):
+    _write_uvarint(out, len(raw))
+    out += raw
+
+
+def _read_bytes(data, pos):
+    length, pos = _read_uvarint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise HandCodecError("数据被截断")
+    return bytes(data[pos:end]), end
+
+
+def _is_uint(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _to_ms(seconds):
+    return int(round(seconds * 1000))
+
+
+class _Encoder:
+    """编码单条记录；字符串在编码时收集，最后写在记录开头"""
+
+    def __init__(self):
+        self.body = bytearray()
+        self.strings = []
+        self.string_index = {}
+
+    def string(self, value):
+        index = _COMMON_INDEX.get(value)
+        if index is None:
+            index = self.string_index.get(value)
+            if index is None:
+                index = len(COMMON_STRINGS) + len(self.strings)
+                self.string_index[value] = index
+                self.strings.append(value)
+        _write_uvarint(self.body, index)
+
+    def value(self, value):
+        out = self.body
+        if value is None:
+            out.append(_V_NONE)
+        elif value is True:
+            out.append(_V_TRUE)
+        elif value is False:
+            out.append(_V_FALSE)
+        elif isinstance(value, int):
+            out.append(_V_INT)
+            _write_svarint(out, value)
+        elif isinstance(value, float):
+            cents = round(value * 100)
+            if cents / 100 == value:
+                out.append(_V_CENTS)
+                _write_svarint(out, cents)
+            else:
+                out.append(_V_FLOAT)
+                out += _DOUBLE.pack(value)
+        elif isinstance(value, str):
+            out.append(_V_STR)
+            self.string(value)
+        else:
+            out.append(_V_JSON)
+            _write_bytes(out, json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode())
+
+    def extras(self, item, known):
+        keys = [key for key in item if key not in known]
+        _write_uvarint(self.body, len(keys))
+        for key in keys:
+            self.string(key)
+            self.value(item[key])
+
+    def card(self, card):
+        # Card.to_dict() 的格式: {'rank': 'A', 'suit': 's', 'display': 'As'}
+        if isinstance(card, dict) and len(card) == 3 and card.get('display') == f"{card.get('rank')}{card.get('suit')}":
+            rank = _RANK_INDEX.get(card['rank'])
+            suit = _SUIT_INDEX.get(card['suit'])
+            if rank is not None and suit is not None:
+                self.body.append(rank * 4 + suit)
+                return
+        self.body.append(_RAW_CARD)
+        self.value(card)
+
+    def finish(self):
+        out = bytearray([FORMAT_VERSION])
+        _write_uvarint(out, len(self.strings))
+        for s in self.strings:
+            _write_bytes(out, s.encode())
+        out += self.body
+        return bytes(out)
+
+
+class _Decoder:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = COMMON_STRINGS
+
+    def uvarint(self):
+        value, self.pos = _read_uvarint(self.data, self.pos)
+        return value
+
+    def svarint(self):
+        value, self.pos = _read_svarint(self.data, self.pos)
+        return value
+
+    def byte(self):
+        try:
+            value = self.data[self.pos]
+        except IndexError:
+            raise HandCodecError("数据被截断")
+        self.pos += 1
+        return value
+
+    def raw(self):
+        value, self.pos = _read_bytes(self.data, self.pos)
+        return value
+
+    def string(self):
+        index = self.uvarint()
+        try:
+            return self.strings[index]
+        except IndexError:
+            raise HandCodecError(f"无效的字符串索引: {index}")
+
+    def value(self):
+        tag = self.byte()
+        if tag == _V_NONE:
+            return None
+        if tag == _V_TRUE:
+            return True
+        if tag == _V_FALSE:
+            return False
+        if tag == _V_INT:
+            return self.svarint()
+        if tag == _V_CENTS:
+            return self.svarint() / 100
+        if tag == _V_FLOAT:
+            end = self.pos + 8
+            if end > len(self.data):
+                raise HandCodecError("数据被截断")
+            value = _DOUBLE.unpack_from(self.data, self.pos)[0]
+            self.pos = end
+            return value
+        if tag == _V_STR:
+            return self.string()
+        if tag == _V_JSON:
+            return json.loads(self.raw().decode())
+        raise HandCodecError(f"无效的值类型: {tag}")
+
+    def extras(self, item):
+        for _ in range(self.uvarint()):
+            key = self.string()
+            item[key] = self.value()
+
+    def card(self):
+        code = self.byte()
+        if code == _RAW_CARD:
+            return self.value()
+        if code >= len(RANKS) * 4:
+            raise HandCodecError(f"无效的牌编码: {code}")
+        rank = RANKS[code >> 2]
+        suit = SUITS[code & 3]
+        return {'rank': rank, 'suit': suit, 'display': f"{rank}{suit}"}
+
+
+# ---------------------------------------------------------------------------
+# 单条记录
+# ---------------------------------------------------------------------------
+
+def encode_hand(record):
+    """把一条牌局记录编码为字节"""
+    enc = _Encoder()
+    out = enc.body
+
+    # 记录头
+    hand_id = record.get("game_id")
+    hand_uuid = None
+    if isinstance(hand_id, str):
+        try:
+            hand_uuid = uuid.UUID(hand_id)
+            if str(hand_uuid) != hand_id:
+                hand_uuid = None
+        except ValueError:
+            pass
+    start_time = record.get("start_time")
+    flags = (_H_UUID if hand_uuid else 0) | (_H_START_TIME if start_time is not None else 0)
+    out.append(flags)
+    if hand_uuid:
+        out += hand_uuid.bytes
+    else:
+        enc.value(hand_id)
+
+    end_ms = _to_ms(record.get("end_time") or 0)
+    _write_uvarint(out, end_ms)
+    if start_time is not None:
+        _write_svarint(out, end_ms - _to_ms(start_time))
+
+    enc.value(record.get("small_blind"))
+    enc.value(record.get("big_blind"))
+    enc.value(record.get("pot"))
+
+    cards = record.get("community_cards") or []
+    _write_uvarint(out, len(cards))
+    for card in cards:
+        enc.card(card)
+
+    # 玩家表：座位号 -> 名字，动作和赢家中只记录座位号
+    names = {}
+    players = record.get("players") or []
+    _write_uvarint(out, len(players))
+    for player in players:
+        name = player.get("name", "")
+        position = player.get("position")
+        names.setdefault(position, name)
+        enc.string(name)
+        enc.value(position)
+        enc.value(player.get("chips_start"))
+        enc.value(player.get("chips_end"))
+        enc.extras(player, ("name", "position", "chips_start", "chips_end"))
+
+    winners = record.get("winners") or []
+    _write_uvarint(out, len(winners))
+    for winner in winners:
+        enc.value(winner.get("position"))
+        enc.value(winner.get("amount"))
+        # 名字与玩家表一致时不存储，否则作为附加字段保留
+        known = ("position", "amount", "name") if winner.get("name") == names.get(winner.get("position")) \
+            else ("position", "amount")
+        enc.extras(winner, known)
+
+    actions = record.get("actions") or []
+    _write_uvarint(out, len(actions))
+    last_ms = end_ms
+    for action in actions:
+        extras = [key for key in action if key not in _ACTION_FIELDS]
+        position = action.get("player_idx")
+        table_name = names.get(position)
+        timestamp = action.get("timestamp")
+
+        flags = 0
+        for key, flag in (("player_idx", _A_PLAYER), ("round", _A_ROUND)):
+            if key in action:
+                if _is_uint(action[key]):
+                    flags |= flag
+                else:
+                    extras.append(key)
+        if "amount" in action:
+            flags |= _A_AMOUNT
+        if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+            flags |= _A_TIMESTAMP
+        elif "timestamp" in action:
+            extras.append("timestamp")
+        for key, flag in (("player", _A_NAME), ("player_name", _A_DISPLAY_NAME)):
+            if key in action:
+                if action[key] == table_name:
+                    flags |= flag
+                else:
+                    extras.append(key)
+
+        out.append(flags)
+        enc.string(action.get("action", ""))
+        if flags & _A_PLAYER:
+            _write_uvarint(out, position)
+        if flags & _A_ROUND:
+            _write_uvarint(out, action["round"])
+        if flags & _A_AMOUNT:
+            enc.value(action["amount"])
+        if flags & _A_TIMESTAMP:
+            ms = _to_ms(timestamp)
+            _write_svarint(out, ms - last_ms)
+            last_ms = ms
+
+        _write_uvarint(out, len(extras))
+        for key in extras:
+            enc.string(key)
+            enc.value(action[key])
+
+    enc.extras(record, _RECORD_FIELDS)
+    return enc.finish()
+
+
+def decode_hand(data):
+    """把 encode_hand 生成的字节解码为牌局记录"""
+    dec = _Decoder(memoryview(data))
+    version = dec.byte()
+    if version != FORMAT_VERSION:
+        raise HandCodecError(f"不支持的格式版本: {version}")
+
+    strings = list(COMMON_STRINGS)
+    for _ in range(dec.uvarint()):
+        strings.append(dec.raw().decode())
+    dec.strings = strings
+
+    flags = dec.byte()
+    if flags & _H_UUID:
+        end = dec.pos + 16
+        if end > len(data):
+            raise HandCodecError("数据被截断")
+        hand_id = str(uuid.UUID(bytes=bytes(dec.data[dec.pos:end])))
+        dec.pos = end
+    else:
+        hand_id = dec.value()
+
+    end_ms = dec.uvarint()
+    start_time = (end_ms - dec.svarint()) / 1000 if flags & _H_START_TIME else None
+
+    record = {
+        "game_id": hand_id,
+        "start_time": start_time,
+        "end_time": end_ms / 1000,
+        "actions": [],
+        "players": [],
+        "winners": [],
+    }
+    record["small_blind"] = dec.value()
+    record["big_blind"] = dec.value()
+    record["pot"] = dec.value()
+    record["community_cards"] = [dec.card() for _ in range(dec.uvarint())]
+
+    names = {}
+    for _ in range(dec.uvarint()):
+        name = dec.string()
+        position = dec.value()
+        names.setdefault(position, name)
+        player = {
+            "name": name,
+            "position": position,
+            "chips_start": dec.value(),
+            "chips_end": dec.value(),
+        }
+        dec.extras(player)
+        record["players"].append(player)
+
+    for _ in range(dec.uvarint()):
+        position = dec.value()
+        winner = {"name": names.get(position, f"玩家{position}"), "position": position, "amount": dec.value()}
+        dec.extras(winner)
+        record["winners"].append(winner)
+
+    last_ms = end_ms
+    for _ in range(dec.uvarint()):
+        flags = dec.byte()
+        action = {}
+        name = dec.string()
+        if flags & _A_PLAYER:
+            action["player_idx"] = dec.uvarint()
+        if flags & _A_ROUND:
+            action["round"] = dec.uvarint()
+        if flags & _A_NAME:
+            action["player"] = names.get(action.get("player_idx"))
+        action["action"] = name
+        if flags & _A_AMOUNT:
+            action["amount"] = dec.value()
+        if flags & _A_TIMESTAMP:
+            last_ms += dec.svarint()
+            action["timestamp"] = last_ms / 1000
+        if flags & _A_DISPLAY_NAME:
+            action["player_name"] = names.get(action.get("player_idx"))
+        dec.extras(action)
+        record["actions"].append(action)
+
+    dec.extras(record)
+    return record
+
+
+def load_hand(payload):
+    """读取数据库中的牌局记录：二进制编码或旧版本的 JSON 文本"""
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return decode_hand(payload)
+    return json.loads(payload)
+
+
+# ---------------------------------------------------------------------------
+# 流式读写
+# ---------------------------------------------------------------------------
+
+class HandWriter:
+    """把牌局记录依次写入二进制文件
+
+    用法:
+        with open(path, "wb") as f:
+            writer = HandWriter(f)
+            for record in records:
+                writer.write(record)
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.count = 0
+        fileobj.write(FILE_MAGIC)
+
+    def write(self, record):
+        self.write_encoded(encode_hand(record))
+
+    def write_encoded(self, data):
+        """写入已经编码的记录（例如直接从数据库读出的 BLOB）"""
+        prefix = bytearray()
+        _write_uvarint(prefix, len(data))
+        self.fileobj.write(prefix)
+        self.fileobj.write(data)
+        self.count += 1
+
+
+class HandReader:
+    """逐条读取 HandWriter 写入的文件，不会一次性载入内存
+
+    迭代 HandReader 得到解码后的记录；iter_encoded() 只返回每条记录的字节，
+    适合只需要过滤或转存的任务。
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        magic = fileobj.read(len(FILE_MAGIC))
+        if magic != FILE_MAGIC:
+            raise HandCodecError("不是牌局历史文件")
+
+    def _read_length(self):
+        result = 0
+        shift = 0
+        while True:
+            byte = self.fileobj.read(1)
+            if not byte:
+                if shift:
+                    raise HandCodecError("数据被截断")
+                return None
+            result |= (byte[0] & 0x7F) << shift
+            if not byte[0] & 0x80:
+                return result
+            shift += 7
+
+    def iter_encoded(self):
+        while True:
+            length = self._read_length()
+            if length is None:
+                return
+            data = self.fileobj.read(length)
+            if len(data) != length:
+                raise HandCodecError("数据被截断")
+            yield data
+
+    def __iter__(self):
+        for data in self.iter_encoded():
+            yield decode_hand(data)
+
+
+# ---------------------------------------------------------------------------
+# 文本导出
+# ---------------------------------------------------------------------------
+
+_STREETS = ("PRE-FLOP", "FLOP", "TURN", "RIVER")
+# 每条街结束时公共牌的数量
+_BOARD_SIZE = (0, 3, 4, 5)
+
+
+def _format_amount(amount):
+    if isinstance(amount, float) and amount.is_integer():
+        amount = int(amount)
+    return str(amount)
+
+
+def _format_time(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y/%m/%d %H:%M:%S UTC")
+
+
+def _format_cards(cards):
+    return " ".join(card.get("display", f"{card.get('rank')}{card.get('suit')}") if isinstance(card, dict)
+                    else str(card) for card in cards)
+
+
+def _action_line(name, action):
+    kind = action.get("action", "")
+    amount = _format_amount(action.get("amount", 0))
+    if kind == "small_blind":
+        return f"{name}: posts small blind {amount}"
+    if kind == "big_blind":
+        return f"{name}: posts big blind {amount}"
+    if kind in ("fold", "check"):
+        return f"{name}: {kind}s"
+    if kind == "call":
+        return f"{name}: calls {amount}"
+    if kind == "bet":
+        return f"{name}: bets {amount}"
+    if kind == "raise":
+        return f"{name}: raises to {amount}"
+    if kind == "all-in":
+        return f"{name}: all-in {amount}"
+    if kind in ("discard", "timeout_discard"):
+        return f"{name}: discards card {action.get('discard_index', '?')}"
+    if kind == "timeout":
+        return f"{name}: times out"
+    if kind.startswith("win"):
+        return f"{name} collected {amount} from pot"
+    return f"{name}: {kind} {amount}".rstrip()
+
+
+def export_text(records, table_name=None):
+    """把牌局记录逐行导出为文本格式的手牌历史（生成器，逐手处理，不占用额外内存）
+
+    Args:
+        records: 牌局记录的可迭代对象，例如 HandReader
+        table_name: 桌名（房间名或房间ID）
+    """
+    for record in records:
+        big_blind = _format_amount(record.get("big_blind"))
+        small_blind = _format_amount(record.get("small_blind"))
+        started = record.get("start_time") or record.get("end_time") or 0
+        yield (f"Hand #{record.get('game_id')}: Hold'em No Limit ({small_blind}/{big_blind})"
+               f" - {_format_time(started)}")
+        if table_name:
+            yield f"Table '{table_name}'"
+
+        names = {}
+        for player in record.get("players", []):
+            names[player.get("position")] = player.get("name")
+            yield (f"Seat {player.get('position')}: {player.get('name')}"
+                   f" ({_format_amount(player.get('chips_start'))} in chips)")
+
+        board = record.get("community_cards") or []
+        street = 0
+        for action in record.get("actions", []):
+            round_index = action.get("round")
+            if isinstance(round_index, int) and street < round_index < len(_STREETS):
+                street = round_index
+                yield f"*** {_STREETS[street]} *** [{_format_cards(board[:_BOARD_SIZE[street]])}]"
+            position = action.get("player_idx")
+            name = names.get(position) or action.get("player") or f"Seat {position}"
+            yield _action_line(name, action)
+
+        yield "*** SUMMARY ***"
+        yield f"Total pot {_format_amount(record.get('pot'))}"
+        if board:
+            yield f"Board [{_format_cards(board)}]"
+        for winner in record.get("winners", []):
+            yield f"Seat {winner.get('position')}: {winner.get('name')} won ({_format_amount(winner.get('amount'))})"
+        yield ""
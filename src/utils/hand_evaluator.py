@@ -1,4 +1,5 @@
 from src.models.card import Card, Suit
+from src.utils.metrics import HAND_EVALUATION_SECONDS, timed
 
 class HandEvaluator:
     # Hand rankings
@@ -16,6 +17,7 @@ class HandEvaluator:
     RANKS = {'2':2, '3':3, '4':4, '5':5, '6':6, '7':7, '8':8, '9':9, '10':10, 'J':11, 'Q':12, 'K':13, 'A':14}
     
     @staticmethod
+    @timed(HAND_EVALUATION_SECONDS)
     def evaluate_hand(hole_cards, community_cards):
         all_cards = hole_cards + community_cards
         
@@ -0,0 +1,92 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# 日志级别配置：优先使用 LOG_LEVEL，其次根据 APP_ENV 判断（production 默认 WARNING）
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = os.environ.get("LOG_FILE", "poker_server.log")
+
+_setup_lock = threading.Lock()
+_listener = None
+
+# 采样计数器：key -> 已出现次数
+_sample_counters = {}
+_sample_lock = threading.Lock()
+
+
+def get_log_level():
+    """读取日志级别配置"""
+    level_name = os.environ.get("LOG_LEVEL")
+    if not level_name:
+        level_name = "WARNING" if os.environ.get("APP_ENV", "").lower() == "production" else "INFO"
+
+    level = logging.getLevelName(level_name.upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def setup_logging():
+    """初始化日志系统（只执行一次）
+
+    所有模块的日志先写入内存队列，由后台 QueueListener 线程统一写到
+    控制台和日志文件，调用方不会被 stdout / 磁盘 I/O 阻塞。
+    """
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        formatter = logging.Formatter(LOG_FORMAT)
+
+        handlers = [logging.StreamHandler()]
+        try:
+            handlers.append(logging.FileHandler(LOG_FILE))
+        except OSError as e:
+            print(f"Unable to open log file {LOG_FILE}: {str(e)}")
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(get_log_level())
+
+
+def get_logger(name):
+    """获取模块日志记录器，首次调用时初始化日志系统"""
+    setup_logging()
+    return logging.getLogger(name)
+
+
+def log_sampled(logger, level, key, every, msg, *args):
+    """对高频事件采样记录日志，每个 key 每 every 次只记录一次
+
+    级别未启用时直接返回，不做任何字符串格式化。
+
+    Args:
+        logger: 日志记录器
+        level: 日志级别，如 logging.DEBUG
+        key: 采样分组键，例如事件类型
+        every (int): 采样间隔
+        msg: 日志格式字符串（%-style）
+        *args: 格式化参数
+    """
+    if not logger.isEnabledFor(level):
+        return
+
+    with _sample_lock:
+        count = _sample_counters.get(key, 0)
+        _sample_counters[key] = count + 1
+
+    if count % every == 0:
+        if every > 1:
+            msg = f"{msg} (sampled 1/{every})"
+        logger.log(level, msg, *args)
@@ -0,0 +1,249 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认延迟分桶（秒），覆盖 0.5ms ~ 10s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# /metrics 中输出的分位数估计
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """生成 Prometheus 标签字符串，例如 {room="abc",type="ping"}"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def remove_label_value(self, label_name, value):
+        """删除包含指定标签值的序列（例如已删除房间）"""
+        if label_name not in self.label_names:
+            return
+        index = self.label_names.index(label_name)
+        with self.lock:
+            for key in [key for key in self.values if key[index] == value]:
+                del self.values[key]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """固定分桶的延迟直方图，可估算 p50/p95/p99
+
+    observe() 只做一次二分查找和几次加法，开销在微秒级以内。
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label_values -> [各分桶计数(最后一个为+Inf), 总和, 总数]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """计时上下文管理器"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def remove_label_value(self, label_name, value):
+        """删除包含指定标签值的序列（例如已删除房间）"""
+        if label_name not in self.label_names:
+            return
+        index = self.label_names.index(label_name)
+        with self.lock:
+            for key in [key for key in self.series if key[index] == value]:
+                del self.series[key]
+
+    def quantile(self, q, *label_values):
+        """根据分桶计数线性插值估算分位数，没有样本时返回None"""
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                return None
+            counts = list(series[0])
+            total = series[2]
+        return self._estimate(self.buckets, counts, total, q)
+
+    @staticmethod
+    def _estimate(buckets, counts, total, q):
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                lower = buckets[i - 1] if i > 0 else 0.0
+                if i >= len(buckets):
+                    # 落在 +Inf 桶中，只能返回最大的有限边界
+                    return buckets[-1]
+                upper = buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return buckets[-1]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile Estimated quantiles of {self.name} from histogram buckets",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+
+        with self.lock:
+            snapshot = [(key, list(series[0]), series[1], series[2]) for key, series in self.series.items()]
+
+        for label_values, counts, total_sum, total in snapshot:
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, [("le", _format_value(float(upper)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {total}")
+
+            for q in QUANTILES:
+                estimate = self._estimate(self.buckets, counts, total, q)
+                if estimate is not None:
+                    labels = _format_labels(self.label_names, label_values, [("quantile", q)])
+                    quantile_lines.append(f"{self.name}_quantile{labels} {_format_value(estimate)}")
+
+        return lines + quantile_lines
+
+
+class MetricsRegistry:
+    """指标注册表，负责统一输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def remove_label_value(self, label_name, value):
+        """从所有指标中删除包含指定标签值的序列"""
+        for metric in list(self.metrics):
+            metric.remove_label_value(label_name, value)
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram, *label_values):
+    """函数计时装饰器，标签值固定"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *label_values)
+        return wrapper
+    return decorator
+
+
+# 全局注册表
+registry = MetricsRegistry()
+
+# WebSocket 消息处理（从 receive_json 返回到处理完成，包括所有广播）
+WS_MESSAGE_SECONDS = registry.histogram(
+    "poker_ws_message_seconds", "Time to handle one inbound WebSocket message", ("room", "type"))
+WS_MESSAGES_TOTAL = registry.counter(
+    "poker_ws_messages_total", "Inbound WebSocket messages", ("room", "type"))
+WS_BROADCAST_SECONDS = registry.histogram(
+    "poker_ws_broadcast_seconds", "Time to send one message to every client in a room", ("type",))
+WS_SEND_ERRORS_TOTAL = registry.counter(
+    "poker_ws_send_errors_total", "Failed WebSocket sends", ("type",))
+WS_RATE_LIMITED_TOTAL = registry.counter(
+    "poker_ws_rate_limited_total", "Inbound WebSocket messages rejected by the rate limiter", ("type", "result"))
+
+# 游戏逻辑
+GAME_ACTION_SECONDS = registry.histogram(
+    "poker_game_action_seconds", "Time spent in Game.handle_action", ("action",))
+ROOM_STATE_SECONDS = registry.histogram(
+    "poker_room_state_seconds", "Time spent building Room.get_state")
+HAND_EVALUATION_SECONDS = registry.histogram(
+    "poker_hand_evaluation_seconds", "Time spent in HandEvaluator.evaluate_hand")
+
+# 数据库
+DB_OPERATION_SECONDS = registry.histogram(
+    "poker_db_operation_seconds", "Time spent in a DBManager operation including retries", ("operation",))
+DB_ERRORS_TOTAL = registry.counter(
+    "poker_db_errors_total", "DBManager operations that failed after all retries", ("operation",))
+
+# 进程内缓存
+CACHE_REQUESTS_TOTAL = registry.counter(
+    "poker_cache_requests_total", "In-process cache lookups", ("cache", "result"))
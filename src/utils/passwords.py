@@ -0,0 +1,195 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.utils.logging_config import get_logger
+
+logger = get_logger("poker.auth")
+
+# scrypt 参数：N=2^14, r=8 约占用 16MB 内存，单次哈希几十毫秒
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_SALT_BYTES = 16
+SCRYPT_KEY_BYTES = 32
+
+# 哈希字符串格式: <算法>$<N>$<r>$<p>$<salt>$<hash>，salt 和 hash 为 base64
+SCHEME_SCRYPT = "scrypt"
+# 旧的无盐 sha256 十六进制摘要再经 scrypt 包装，用于在不知道明文密码时批量迁移
+SCHEME_SCRYPT_SHA256 = "scrypt-sha256"
+
+# 密码哈希进程数，避免大量登录请求占满 CPU
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(secret, salt, n, r, p):
+    return hashlib.scrypt(secret.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n * 2, dklen=SCRYPT_KEY_BYTES)
+
+
+def _legacy_digest(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def _format(scheme, salt, key, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    return f"{scheme}${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def hash_password(password):
+    """生成密码哈希字符串（scrypt，随机盐）"""
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    return _format(SCHEME_SCRYPT, salt, _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P))
+
+
+def wrap_legacy_hash(legacy_hash):
+    """把旧的 sha256 摘要包装为 scrypt-sha256 哈希，不需要明文密码"""
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    return _format(SCHEME_SCRYPT_SHA256, salt, _scrypt(legacy_hash, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P))
+
+
+def is_legacy_hash(stored):
+    """是否是旧版本的无盐 sha256 十六进制摘要"""
+    return len(stored) == 64 and "$" not in stored
+
+
+def needs_rehash(stored):
+    """哈希是否需要在下次登录时用当前算法和参数重新生成"""
+    if is_legacy_hash(stored):
+        return True
+    parts = stored.split("$")
+    if parts[0] != SCHEME_SCRYPT:
+        return True
+    try:
+        return (int(parts[1]), int(parts[2]), int(parts[3])) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    except (IndexError, ValueError):
+        return True
+
+
+def verify_password(password, stored):
+    """验证密码
+
+    Returns:
+        tuple: (是否匹配, 是否需要重新哈希)
+    """
+    if not stored:
+        return False, False
+
+    if is_legacy_hash(stored):
+        ok = hmac.compare_digest(_legacy_digest(password), stored)
+        return ok, ok
+
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] not in (SCHEME_SCRYPT, SCHEME_SCRYPT_SHA256):
+        logger.warning("Unknown password hash format")
+        return False, False
+
+    scheme, n, r, p, salt, key = parts
+    secret = _legacy_digest(password) if scheme == SCHEME_SCRYPT_SHA256 else password
+    try:
+        derived = _scrypt(secret, _b64decode(salt), int(n), int(r), int(p))
+        ok = hmac.compare_digest(derived, _b64decode(key))
+    except (ValueError, TypeError) as e:
+        logger.warning("Invalid password hash: %s", str(e))
+        return False, False
+    return ok, ok and needs_rehash(stored)
+
+
+# 用户不存在时也执行一次同样代价的验证，避免通过响应时间判断用户名是否存在
+_DUMMY_HASH = _format(SCHEME_SCRYPT, b"\0" * SCRYPT_SALT_BYTES, b"\0" * SCRYPT_KEY_BYTES)
+
+
+def verify_missing_user(password):
+    verify_password(password, _DUMMY_HASH)
+    return False, False
+
+
+class PasswordService:
+    """在有界进程池中执行密码哈希
+
+    scrypt 是 CPU 和内存密集型操作，放在独立进程中执行，
+    大量登录请求时不会占用事件循环和数据库线程，也不受 GIL 影响。
+    异步代码使用 hash / verify，同步代码（DBManager、脚本）使用 hash_sync / verify_sync。
+    """
+
+    def __init__(self, max_workers=PASSWORD_HASH_WORKERS):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        # 首次使用时才创建进程池，导入模块的脚本不会启动子进程；
+        # 服务器进程中已经运行着数据库、日志等线程，使用 spawn 启动子进程，不 fork 这些线程的状态。
+        # spawn 子进程会重新导入以脚本方式运行的 __main__，服务器应通过 uvicorn / gunicorn 命令启动
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def _discard_executor(self, executor):
+        """子进程异常退出后进程池不再可用，丢弃后下次使用时重新创建"""
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            logger.error("Password hashing pool is broken, recreating it")
+            self._discard_executor(executor)
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    def run_sync(self, func, *args):
+        """在进程池中执行并阻塞等待结果，供同步代码使用"""
+        executor = self._get_executor()
+        try:
+            return executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            logger.error("Password hashing pool is broken, recreating it")
+            self._discard_executor(executor)
+            return self._get_executor().submit(func, *args).result()
+
+    async def hash(self, password):
+        return await self.run(hash_password, password)
+
+    async def verify(self, password, stored):
+        """返回 (是否匹配, 是否需要重新哈希)；stored 为 None 表示用户不存在"""
+        if stored is None:
+            return await self.run(verify_missing_user, password)
+        return await self.run(verify_password, password, stored)
+
+    def hash_sync(self, password):
+        return self.run_sync(hash_password, password)
+
+    def verify_sync(self, password, stored):
+        if stored is None:
+            return self.run_sync(verify_missing_user, password)
+        return self.run_sync(verify_password, password, stored)
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            if self.executor is not None:
+                logger.info("Shutting down password hashing pool")
+                self.executor.shutdown(wait=wait)
+                self.executor = None
+
+
+password_service = PasswordService()
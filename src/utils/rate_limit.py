@@ -0,0 +1,99 @@
+import os
+import time
+
+from src.utils.logging_config import get_logger
+
+logger = get_logger("poker.ws")
+
+
+def _budget(message_type, rate, burst):
+    """读取消息类型的预算，环境变量格式为 "<每秒条数>/<突发上限>"，例如 WS_RATE_LIMIT_CHAT=2/5"""
+    value = os.getenv(f"WS_RATE_LIMIT_{message_type.upper()}")
+    if not value:
+        return rate, burst
+    try:
+        rate, burst = value.split("/")
+        return float(rate), float(burst)
+    except ValueError:
+        logger.warning("Invalid rate limit for %s: %s", message_type, value)
+        return rate, burst
+
+
+# 每个连接每种消息类型的预算: (每秒补充的令牌数, 桶容量)，未列出的类型使用 other
+WS_RATE_LIMITS = {
+    "ping": _budget("ping", 1, 5),
+    "game_action": _budget("game_action", 5, 10),
+    "room_action": _budget("room_action", 2, 5),
+    "chat": _budget("chat", 2, 5),
+    "other": _budget("other", 5, 10),
+}
+
+# 被拒绝的消息累计超过该数量（每秒恢复 WS_RATE_VIOLATION_DECAY 条）时断开连接
+WS_RATE_MAX_VIOLATIONS = float(os.getenv("WS_RATE_MAX_VIOLATIONS", "20"))
+WS_RATE_VIOLATION_DECAY = float(os.getenv("WS_RATE_VIOLATION_DECAY", "1"))
+
+
+class TokenBucket:
+    """令牌桶：以 rate 条/秒补充，最多积累 capacity 条"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """取出一个令牌，桶为空时返回 False"""
+        now = time.monotonic() if now is None else now
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ConnectionRateLimiter:
+    """单个 WebSocket 连接的限流器
+
+    每种消息类型一个令牌桶；被拒绝的消息计入违规桶，违规桶耗尽说明客户端持续超限，应断开连接。
+    """
+
+    # check() 的返回值
+    ALLOW = "allow"
+    REJECT = "reject"
+    DISCONNECT = "disconnect"
+
+    def __init__(self, limits=None, max_violations=WS_RATE_MAX_VIOLATIONS,
+                 violation_decay=WS_RATE_VIOLATION_DECAY):
+        self.limits = limits or WS_RATE_LIMITS
+        self.buckets = {}
+        self.violations = TokenBucket(violation_decay, max_violations)
+        # 连续被拒绝期间只通知客户端一次
+        self.throttled = set()
+
+    def check(self, message_type, now=None):
+        """返回 ALLOW、REJECT 或 DISCONNECT"""
+        key = message_type if message_type in self.limits else "other"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits[key]
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+
+        if bucket.take(now):
+            self.throttled.discard(key)
+            return self.ALLOW
+        if not self.violations.take(now):
+            return self.DISCONNECT
+        return self.REJECT
+
+    def should_notify(self, message_type):
+        """该类型本轮超限是否是第一次被拒绝（需要通知客户端）"""
+        key = message_type if message_type in self.limits else "other"
+        if key in self.throttled:
+            return False
+        self.throttled.add(key)
+        return True
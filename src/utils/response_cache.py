@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+from src.utils.logging_config import get_logger
+from src.utils.metrics import CACHE_REQUESTS_TOTAL
+
+logger = get_logger("poker.cache")
+
+
+class ResponseCache:
+    """进程内的 TTL 响应缓存
+
+    - 每个键缓存一次查询结果，超过 ttl 秒后重新加载
+    - 单飞（single-flight）：同一个键同时只有一个加载在执行，
+      其余并发请求等待同一个结果，避免缓存失效瞬间的请求洪峰压到数据库
+    - invalidate() 可以从任意线程调用（例如数据库写入线程），
+      通过代数（generation）保证失效前开始的加载结果不会再写回缓存
+
+    用法:
+        leaderboard = await cache.get_or_load(("win_rate", limit), loader)
+    其中 loader 是返回可等待对象的无参函数。
+    """
+
+    def __init__(self, name, ttl=5.0, max_entries=256):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # key -> (expires_at, value)
+        self.entries = {}
+        # key -> asyncio.Future，正在加载的键
+        self.inflight = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    async def get_or_load(self, key, loader):
+        """返回缓存的值，不存在或已过期时调用 loader 加载"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            CACHE_REQUESTS_TOTAL.inc(self.name, "hit")
+            return entry[1]
+
+        future = self.inflight.get(key)
+        if future is not None:
+            # 已有请求在加载同一个键，等待它的结果
+            CACHE_REQUESTS_TOTAL.inc(self.name, "wait")
+            return await asyncio.shield(future)
+
+        CACHE_REQUESTS_TOTAL.inc(self.name, "miss")
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        generation = self.generation
+        try:
+            value = await loader()
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # 没有其他等待者时也要取走异常，避免 "exception was never retrieved"
+                future.exception()
+            raise
+        else:
+            future.set_result(value)
+            self._store(key, value, generation)
+            return value
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def _store(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                # 加载期间数据已变化，结果可能是旧的，不写入缓存
+                return
+            if len(self.entries) >= self.max_entries and key not in self.entries:
+                self._evict_expired()
+                if len(self.entries) >= self.max_entries:
+                    # 仍然已满时丢弃最早加入的条目
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self.entries.items() if expires_at <= now]:
+            del self.entries[key]
+
+    def invalidate(self):
+        """清空缓存，可在任意线程调用"""
+        with self.lock:
+            self.generation += 1
+            # 替换而不是 clear()，读取方不加锁也只会看到完整的字典
+            self.entries = {}
+        logger.debug("Cache %s invalidated", self.name)
@@ -0,0 +1,132 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from src.utils.logging_config import get_logger
+from src.utils.metrics import CACHE_REQUESTS_TOTAL
+
+logger = get_logger("poker.auth")
+
+# 缓存的已验证令牌数量上限
+TOKEN_CACHE_SIZE = 10000
+# 单独撤销的令牌记录上限，超出时最旧的记录转为按用户撤销
+REVOKED_TOKENS_SIZE = 10000
+
+
+class TokenCache:
+    """已验证 JWT 的 LRU 缓存
+
+    以令牌的 sha256 摘要为键，缓存验证通过的声明（claims），直到令牌的 exp。
+    命中时只需要一次哈希和字典查找，不再重复解码和 HMAC 验证。
+
+    撤销:
+        revoke_token(token)  单个令牌失效（退出登录），记录保留到令牌过期
+        revoke_user(username)  该用户此前签发的所有令牌失效（修改密码），按 iat 判断
+    单独撤销的记录最多保留 max_revoked 条，超出时最旧的一条转换为对该用户的
+    revoke_user(iat 之后)，该用户在此之前签发的其他令牌也随之失效（宁可多撤销，不会让令牌重新生效）。
+
+    限制: 撤销记录只保存在当前进程内存中，服务器重启后丢失，
+    gunicorn 多个 worker 之间也不共享；多 worker 部署时退出登录只在处理该请求的 worker 中生效。
+    """
+
+    def __init__(self, secret_key, algorithm, max_entries=TOKEN_CACHE_SIZE, max_revoked=REVOKED_TOKENS_SIZE):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self.max_revoked = max_revoked
+
+        # 摘要 -> (claims, exp)
+        self.entries = OrderedDict()
+        # 已撤销的令牌，按撤销顺序: 摘要 -> (exp, 用户名, iat)
+        self.revoked_tokens = OrderedDict()
+        # 用户名 -> 时间戳，iat 早于该时间的令牌无效
+        self.revoked_before = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def verify(self, token):
+        """验证令牌并返回声明
+
+        Raises:
+            jwt.PyJWTError: 令牌无效、过期或已被撤销
+        """
+        digest = self._digest(token)
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                claims, exp = entry
+                if exp is not None and exp <= now:
+                    del self.entries[digest]
+                elif self._is_revoked(digest, claims):
+                    del self.entries[digest]
+                    CACHE_REQUESTS_TOTAL.inc("token", "revoked")
+                    raise jwt.InvalidTokenError("Token has been revoked")
+                else:
+                    self.entries.move_to_end(digest)
+                    CACHE_REQUESTS_TOTAL.inc("token", "hit")
+                    return claims
+
+        CACHE_REQUESTS_TOTAL.inc("token", "miss")
+        # 解码和签名验证在锁外进行
+        claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+
+        with self.lock:
+            if self._is_revoked(digest, claims):
+                CACHE_REQUESTS_TOTAL.inc("token", "revoked")
+                raise jwt.InvalidTokenError("Token has been revoked")
+            self.entries[digest] = (claims, claims.get("exp"))
+            self.entries.move_to_end(digest)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return claims
+
+    def _is_revoked(self, digest, claims):
+        if digest in self.revoked_tokens:
+            return True
+        revoked_before = self.revoked_before.get(claims.get("sub"))
+        # 旧令牌没有 iat，视为在撤销之前签发
+        return revoked_before is not None and claims.get("iat", 0) < revoked_before
+
+    def revoke_token(self, token):
+        """撤销单个令牌"""
+        digest = self._digest(token)
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except jwt.PyJWTError:
+            # 无效令牌本来就无法通过验证
+            return
+        with self.lock:
+            self.entries.pop(digest, None)
+            self.revoked_tokens[digest] = (claims.get("exp"), claims.get("sub"), claims.get("iat", 0))
+            self.revoked_tokens.move_to_end(digest)
+            self._purge_revoked()
+
+    def revoke_user(self, username, before=None):
+        """撤销用户在 before（默认当前时间）之前签发的所有令牌"""
+        with self.lock:
+            self.revoked_before[username] = before if before is not None else time.time()
+        logger.info("Revoked tokens issued to %s", username)
+
+    def _purge_revoked(self):
+        # 过期的令牌无论如何都无法通过验证，不需要继续保留撤销记录；
+        # 令牌有效期相同，按撤销顺序只检查最旧的记录
+        now = time.time()
+        while self.revoked_tokens:
+            digest, (exp, username, iat) = next(iter(self.revoked_tokens.items()))
+            if exp is not None and exp <= now:
+                del self.revoked_tokens[digest]
+            elif len(self.revoked_tokens) > self.max_revoked:
+                # 超出上限：改为撤销该用户在这个令牌及之前签发的所有令牌
+                del self.revoked_tokens[digest]
+                before = self.revoked_before.get(username, 0)
+                self.revoked_before[username] = max(before, iat + 1e-6)
+            else:
+                break
@@ -0,0 +1,16 @@
+from uvicorn.workers import UvicornWorker
+
+from src.websocket_manager import WS_PING_INTERVAL, WS_PING_TIMEOUT
+
+
+class PokerUvicornWorker(UvicornWorker):
+    """gunicorn 使用的 uvicorn worker，带上 WebSocket 协议层 ping/pong 配置
+
+    gunicorn 无法直接把 ws_ping_interval/ws_ping_timeout 传给 uvicorn，只能通过 worker 类设置。
+    """
+
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "ws_ping_interval": WS_PING_INTERVAL,
+        "ws_ping_timeout": WS_PING_TIMEOUT,
+    }
@@ -1,10 +1,161 @@
 import asyncio
+import os
+import uuid
+from collections import deque
 from fastapi import WebSocket
 from typing import Dict, List, Any, Optional, Set
 import time
 import traceback
 import json
 
+from src.utils.metrics import WS_BROADCAST_SECONDS, WS_SEND_ERRORS_TOTAL
+
+# 观众看到的画面延迟（秒），0 表示实时
+SPECTATOR_DELAY = float(os.getenv("SPECTATOR_DELAY", "0"))
+# 每个房间最多允许的观众数
+MAX_SPECTATORS_PER_ROOM = int(os.getenv("MAX_SPECTATORS_PER_ROOM", "500"))
+# 单个观众的发送超时（秒），超时的连接被移除，不拖慢其他观众
+SPECTATOR_SEND_TIMEOUT = float(os.getenv("SPECTATOR_SEND_TIMEOUT", "2"))
+# 每个房间待发送给观众的消息上限，超出时丢弃最旧的消息（每条 game_update 都带完整状态）
+SPECTATOR_QUEUE_SIZE = int(os.getenv("SPECTATOR_QUEUE_SIZE", "1024"))
+
+# 每个房间保留的最近广播帧数量，断线重连时用于补发错过的消息
+REPLAY_BUFFER_SIZE = int(os.getenv("REPLAY_BUFFER_SIZE", "256"))
+
+# 协议层 ping/pong（由 uvicorn 处理）的间隔和超时（秒）：
+# 超过 WS_PING_TIMEOUT 没有收到 pong 的连接由 uvicorn 关闭，消息循环随即收到断开事件。
+# 连接是否存活只由协议层判断，客户端不需要发送应用层心跳
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
+# 批量更新离线状态的间隔（秒）
+WS_REAPER_INTERVAL = float(os.getenv("WS_REAPER_INTERVAL", "5"))
+
+# 同一房间在该时间（秒）内的聊天消息合并为一条 chat_batch 广播
+CHAT_COALESCE_INTERVAL = float(os.getenv("CHAT_COALESCE_INTERVAL", "0.25"))
+# 单条聊天消息的最大长度，超出部分在入队前截断
+CHAT_MAX_LENGTH = int(os.getenv("CHAT_MAX_LENGTH", "500"))
+
+# 只发给玩家本人的消息类型，不会转发给观众
+PRIVATE_MESSAGE_TYPES = {"player_hand", "error"}
+
+
+def encode_message(message: dict) -> str:
+    """把消息编码为文本帧，与 WebSocket.send_json 的编码方式一致"""
+    return json.dumps(message, separators=(",", ":"))
+
+
+class ReplayBuffer:
+    """
+    一个房间最近广播帧的环形缓冲区
+
+    每条广播分配递增的 seq，并保存编码后的文本帧。
+    stream_id 在缓冲区创建时随机生成，服务器重启或房间重建后会变化，
+    客户端据此判断自己保存的 seq 是否还有效。
+    """
+
+    def __init__(self, size: int = REPLAY_BUFFER_SIZE):
+        self.stream_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.frames: deque = deque(maxlen=size)  # (seq, text)
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def append(self, seq: int, text: str):
+        self.frames.append((seq, text))
+
+    def since(self, last_seq: int) -> Optional[List[tuple]]:
+        """
+        返回 seq 大于 last_seq 的所有帧；缺口已超出缓冲区范围时返回None
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.frames or self.frames[0][0] > last_seq + 1:
+            return None
+        # 帧的 seq 连续，可以直接计算起始下标
+        start = last_seq + 1 - self.frames[0][0]
+        return [self.frames[i] for i in range(start, len(self.frames))]
+
+
+class SpectatorGroup:
+    """
+    一个房间的观众连接
+
+    观众不在 room_players 中，只接收房间广播的公开消息。
+    每条广播只编码一次，由后台任务按顺序发送给所有观众，
+    不占用玩家广播的时间；设置了延迟时在到期后才发送。
+    """
+
+    def __init__(self, room_id: str, delay: float = SPECTATOR_DELAY):
+        self.room_id = room_id
+        self.delay = delay
+        self.connections: Set[WebSocket] = set()
+        # (发送时间, 编码后的文本帧, 目标连接)，目标为None表示所有观众
+        self.pending: deque = deque(maxlen=SPECTATOR_QUEUE_SIZE)
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def push(self, text: str, target: Optional[WebSocket] = None):
+        self.pending.append((time.monotonic() + self.delay, text, target))
+        self.wakeup.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def send_now(self, text: str, target: Optional[WebSocket] = None):
+        """并发发送给所有观众（或指定的观众），发送失败或超时的连接直接移除"""
+        if target is not None:
+            connections = [target] if target in self.connections else []
+        else:
+            connections = list(self.connections)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(websocket.send_text(text), SPECTATOR_SEND_TIMEOUT) for websocket in connections),
+            return_exceptions=True)
+        for websocket, result in zip(connections, results):
+            if isinstance(result, Exception):
+                WS_SEND_ERRORS_TOTAL.inc("spectator")
+                self.connections.discard(websocket)
+                if isinstance(result, asyncio.TimeoutError):
+                    print(f"Spectator in room {self.room_id} is not reading, dropping connection")
+                    asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1008, reason="Too slow"), SPECTATOR_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _run(self):
+        try:
+            while self.connections:
+                if not self.pending:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                due, text, target = self.pending[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.pending.popleft()
+                await self.send_now(text, target)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error in spectator sender for room {self.room_id}: {str(e)}")
+            traceback.print_exc()
+        finally:
+            if not self.connections:
+                self.pending.clear()
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.pending.clear()
+
+
 class ConnectionManager:
     def __init__(self):
         # Map of client_id to WebSocket connection
@@ -16,6 +167,24 @@ class ConnectionManager:
         # Map of room_id to list of client_ids
         self.room_players: Dict[str, List[str]] = {}
         
+        # 观众连接，与玩家分开广播: room_id -> SpectatorGroup
+        self.room_spectators: Dict[str, SpectatorGroup] = {}
+        
+        # 最近广播帧: room_id -> ReplayBuffer
+        self.replay_buffers: Dict[str, ReplayBuffer] = {}
+        
+        # 正在补发错过消息的客户端，广播时跳过，由补发循环负责发送
+        self.resuming: Set[str] = set()
+        
+        # 已判定断开、等待批量更新在线状态的客户端: room_id -> client_ids
+        self.pending_offline: Dict[str, Set[str]] = {}
+        
+        # 批量处理离线客户端的回调 async handler(room_id, client_ids)，由应用注册
+        self.offline_handler = None
+        
+        # 等待合并广播的聊天消息: room_id -> [消息数据]
+        self.pending_chat: Dict[str, List[dict]] = {}
+        
         # Message queue for room broadcasts
         self.message_queues: Dict[str, asyncio.Queue] = {}
         
@@ -24,6 +193,66 @@ class ConnectionManager:
         
         # 跟踪每个玩家当前活跃的房间
         self.player_active_room: Dict[str, str] = {}  # username -> active_room_id
+        
+        # 主事件循环，后台线程通过它提交发送任务
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """
+        绑定主事件循环（在应用启动时调用）
+        """
+        self.loop = loop
+
+    def submit(self, coro_func, *args):
+        """
+        线程安全地把协程提交到主事件循环执行，不阻塞调用方
+
+        可以在计时器线程等后台线程中调用，也可以在主事件循环中调用。
+        协程在确认主循环可用后才创建，避免产生未被等待的协程。
+
+        Returns:
+            concurrent.futures.Future / asyncio.Task，主循环不可用时返回None
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            print(f"Main event loop not available, dropping {getattr(coro_func, '__name__', coro_func)}")
+            return None
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is loop:
+            # 已在主循环线程中，直接创建任务
+            task = loop.create_task(coro_func(*args))
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
+            return task
+
+        future = asyncio.run_coroutine_threadsafe(coro_func(*args), loop)
+        future.add_done_callback(self._log_submit_error)
+        return future
+
+    def _log_submit_error(self, future):
+        """记录后台线程提交的协程中出现的异常"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"Error in submitted websocket task: {str(error)}")
+
+    def submit_broadcast(self, room_id: str, message: dict):
+        """
+        线程安全的房间广播（供计时器等后台线程使用）
+        """
+        return self.submit(self.broadcast_to_room, room_id, message)
+
+    def submit_personal_messages(self, messages: List[tuple]):
+        """
+        线程安全的批量个人消息发送（供后台线程使用）
+        """
+        return self.submit(self.send_personal_messages, messages)
 
     async def _handle_connection(self, websocket: WebSocket, client_id: str, room_id: str) -> bool:
         """
@@ -108,6 +337,61 @@ class ConnectionManager:
             finally:
                 self.disconnect(client_id)
                 
+    def owns_connection(self, client_id: str, websocket: WebSocket) -> bool:
+        """
+        websocket 是否仍是该客户端的当前连接（已被清理或被新连接替换时返回False）
+        """
+        return self.active_connections.get(client_id) is websocket
+
+    def mark_dead(self, client_id: str, reason: str = "Connection lost"):
+        """
+        立即把客户端从广播目标中移除，在线状态由清理任务批量更新
+        """
+        websocket = self.active_connections.get(client_id)
+        room_id = self.player_active_room.get(client_id)
+        self.disconnect(client_id)
+        if room_id:
+            self.pending_offline.setdefault(room_id, set()).add(client_id)
+        if websocket is not None:
+            self.submit(self._close_quietly, websocket, reason)
+
+    async def _close_quietly(self, websocket: WebSocket, reason: str):
+        try:
+            await websocket.close(code=1001, reason=reason)
+        except Exception:
+            # 连接可能已经关闭
+            pass
+
+    async def flush_offline(self):
+        """
+        按房间批量处理已断开的客户端
+        """
+        if not self.pending_offline:
+            return
+        batch, self.pending_offline = self.pending_offline, {}
+        for room_id, client_ids in batch.items():
+            # 期间重新连上的客户端不算离线
+            client_ids = sorted(c for c in client_ids if not self.is_client_connected(c))
+            if not client_ids or self.offline_handler is None:
+                continue
+            try:
+                await self.offline_handler(room_id, client_ids)
+            except Exception as e:
+                print(f"Error handling offline clients in room {room_id}: {str(e)}")
+                traceback.print_exc()
+
+    async def run_reaper(self):
+        """
+        后台任务：定期批量更新已断开连接（发送失败、协议层 ping 超时等）的离线状态
+        """
+        while True:
+            await asyncio.sleep(WS_REAPER_INTERVAL)
+            try:
+                await self.flush_offline()
+            except Exception as e:
+                print(f"Error in connection reaper: {str(e)}")
+                traceback.print_exc()
+
     def get_client_room(self, client_id: str) -> Optional[str]:
         """
         获取客户端当前所在的活跃房间
@@ -124,11 +408,22 @@ class ConnectionManager:
                 return True
             except Exception as e:
                 print(f"Error sending message to {client_id}: {str(e)}")
+                self.mark_dead(client_id)
                 return False
         else:
             # 客户端不在线，消息无法发送
             return False
 
+    async def send_personal_messages(self, messages: List[tuple]):
+        """
+        Send a batch of (client_id, message) pairs, skipping offline clients
+        """
+        sent = 0
+        for client_id, message in messages:
+            if await self.send_personal_message(message, client_id):
+                sent += 1
+        return sent
+
     async def broadcast(self, message: dict):
         """
         Broadcast a message to all connected clients
@@ -149,25 +444,179 @@ class ConnectionManager:
     async def broadcast_to_room(self, room_id: str, message: dict):
         """
         Broadcast a message to all clients in a specific room
+
+        消息只编码一次，玩家和观众共用同一个文本帧；观众由后台任务发送。
         """
-        if room_id not in self.room_players:
+        spectators = self.room_spectators.get(room_id)
+        if room_id not in self.room_players and not spectators:
             print(f"No players in room {room_id}")
             return []
         
+        message_type = message.get("type", "unknown")
+        start = time.perf_counter()
+        
+        # 分配序号并保存编码后的帧，断线重连的客户端可以从缓冲区补发
+        replay = self.get_replay_buffer(room_id)
+        seq = replay.next_seq()
+        text = encode_message({**message, "seq": seq})
+        replay.append(seq, text)
+        
         disconnected_clients = []
         for client_id in list(self.room_players.get(room_id, [])):
+            if client_id in self.resuming:
+                continue
             # Check if client is connected
             if client_id in self.active_connections and self.connection_status.get(client_id) == "connected":
                 try:
-                    await self.active_connections[client_id].send_json(message)
+                    await self.active_connections[client_id].send_text(text)
                 except Exception as e:
                     print(f"Error broadcasting to room member {client_id}: {str(e)}")
+                    WS_SEND_ERRORS_TOTAL.inc(message_type)
+                    # 发送失败后立即移出广播列表，后续广播不再尝试
+                    self.mark_dead(client_id)
                     disconnected_clients.append(client_id)
             else:
+                self.remove_client_from_room(room_id, client_id)
                 disconnected_clients.append(client_id)
         
+        if spectators and message_type not in PRIVATE_MESSAGE_TYPES:
+            spectators.push(text)
+        
+        WS_BROADCAST_SECONDS.observe(time.perf_counter() - start, message_type)
         return disconnected_clients
 
+    def get_replay_buffer(self, room_id: str) -> ReplayBuffer:
+        replay = self.replay_buffers.get(room_id)
+        if replay is None:
+            replay = self.replay_buffers[room_id] = ReplayBuffer()
+        return replay
+
+    def stream_position(self, room_id: str) -> dict:
+        """
+        当前的广播位置，随完整状态一起发给客户端，客户端从这里开始计数
+        """
+        replay = self.get_replay_buffer(room_id)
+        return {"stream_id": replay.stream_id, "seq": replay.seq}
+
+    async def resume(self, room_id: str, client_id: str, stream_id: Optional[str], last_seq: Optional[int]) -> bool:
+        """
+        断线重连时补发客户端错过的广播帧
+
+        补发期间广播会跳过该客户端，补发循环直到追上最新的 seq 为止。
+        追上后发送 resumed 标记（带最后补发的 seq），发送标记期间产生的广播也在循环中补发，
+        之后不再有 await，后续广播直接发给客户端，不会重复也不会乱序。
+
+        Returns:
+            bool: 是否补发成功；缺口过大或 stream_id 不匹配时返回False，调用方应发送完整状态
+        """
+        replay = self.replay_buffers.get(room_id)
+        if replay is None or last_seq is None or stream_id != replay.stream_id:
+            return False
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return False
+
+        self.resuming.add(client_id)
+        try:
+            replayed = 0
+            marker_sent = False
+            while True:
+                frames = replay.since(last_seq)
+                if frames is None:
+                    return False
+                if not frames:
+                    if marker_sent:
+                        break
+                    await websocket.send_text(encode_message({
+                        "type": "resumed",
+                        "data": {"stream_id": replay.stream_id, "seq": last_seq}
+                    }))
+                    marker_sent = True
+                    continue
+                for seq, text in frames:
+                    await websocket.send_text(text)
+                    last_seq = seq
+                replayed += len(frames)
+            print(f"Resumed {client_id} in room {room_id}: replayed {replayed} frames")
+            return True
+        except Exception as e:
+            print(f"Error resuming client {client_id}: {str(e)}")
+            return False
+        finally:
+            self.resuming.discard(client_id)
+
+    def drop_replay_buffer(self, room_id: str):
+        """
+        房间删除后释放缓冲区
+        """
+        self.replay_buffers.pop(room_id, None)
+
+    def queue_chat(self, room_id: str, chat: dict):
+        """
+        加入待广播的聊天消息，每个房间每 CHAT_COALESCE_INTERVAL 秒最多广播一次 chat_batch
+        """
+        message = chat.get("message")
+        if not isinstance(message, str):
+            message = "" if message is None else str(message)
+        chat["message"] = message[:CHAT_MAX_LENGTH]
+
+        pending = self.pending_chat.get(room_id)
+        if pending is not None:
+            pending.append(chat)
+            return
+        self.pending_chat[room_id] = [chat]
+        # 主循环不可用时不会有 _flush_chat 来清空队列，不能让房间一直处于待广播状态
+        if self.submit(self._flush_chat, room_id) is None:
+            self.pending_chat.pop(room_id, None)
+
+    async def _flush_chat(self, room_id: str):
+        await asyncio.sleep(CHAT_COALESCE_INTERVAL)
+        messages = self.pending_chat.pop(room_id, None)
+        if messages:
+            await self.broadcast_to_room(room_id, {
+                "type": "chat_batch",
+                "data": {
+                    "messages": messages,
+                    "timestamp": time.time()
+                }
+            })
+
+    def add_spectator(self, room_id: str, websocket: WebSocket) -> bool:
+        """
+        把已接受的观众连接加入房间的观众组，人数已满时返回False
+        """
+        group = self.room_spectators.get(room_id)
+        if group is None:
+            group = self.room_spectators[room_id] = SpectatorGroup(room_id)
+        if len(group.connections) >= MAX_SPECTATORS_PER_ROOM:
+            return False
+        group.connections.add(websocket)
+        return True
+
+    def remove_spectator(self, room_id: str, websocket: WebSocket):
+        """
+        移除观众连接，房间没有观众时释放观众组
+        """
+        group = self.room_spectators.get(room_id)
+        if group is None:
+            return
+        group.connections.discard(websocket)
+        if not group.connections:
+            group.close()
+            del self.room_spectators[room_id]
+
+    def send_to_spectator(self, room_id: str, websocket: WebSocket, message: dict):
+        """
+        发送给单个观众（例如加入时的初始状态），与广播使用同一个延迟队列，保证顺序和延迟一致
+        """
+        group = self.room_spectators.get(room_id)
+        if group:
+            group.push(encode_message(message), websocket)
+
+    def get_spectator_count(self, room_id: str) -> int:
+        group = self.room_spectators.get(room_id)
+        return len(group.connections) if group else 0
+
     def add_client_to_room(self, room_id: str, client_id: str):
         """
         Add a client to a room for broadcasting
@@ -201,7 +650,7 @@ class ConnectionManager:
             # Create a new task for this room
             task = asyncio.create_task(self._room_broadcaster(room_id))
             self.background_tasks.add(task)
-            task.add_done_callback(lambda t: self.background_tasks.remove(t))
+            task.add_done_callback(self.background_tasks.discard)
             
             print(f"Started room broadcaster for room {room_id}")
             return True
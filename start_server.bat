@@ -1,6 +1,6 @@
 @echo off
 echo Starting server with logs redirected to server_log.txt...
-python -m uvicorn src.main:app --reload --host 127.0.0.1 --port 8000 --log-level info
+python -m uvicorn src.main:app --reload --host 127.0.0.1 --port 8000 --log-level info --ws-ping-interval 20 --ws-ping-timeout 20
 echo Server is running. Logs are being written to server_log.txt
 echo.
 echo To view logs in real-time, open another PowerShell window and run:
@@ -0,0 +1,55 @@
+import pickle
+
+import pytest
+
+from src.models.active_ring import ActiveRing
+
+
+def test_next_after_wraps_around():
+    ring = ActiveRing([0, 2, 5, 7])
+    assert ring.next_after(0) == 2
+    assert ring.next_after(5) == 7
+    assert ring.next_after(7) == 0
+
+
+def test_next_after_skips_to_matching_seat():
+    ring = ActiveRing([0, 2, 5, 7])
+    assert ring.next_after(5, lambda seat: seat < 5) == 0
+    assert ring.next_after(7, lambda seat: seat == 5) == 5
+
+
+def test_next_after_checks_self_last():
+    ring = ActiveRing([1, 3, 4])
+    assert ring.next_after(3, lambda seat: seat == 3) == 3
+    assert ring.next_after(3, lambda seat: False) is None
+    assert ActiveRing([6]).next_after(6) == 6
+
+
+def test_next_after_unknown_seat_raises():
+    with pytest.raises(ValueError):
+        ActiveRing([0, 1]).next_after(4)
+
+
+def test_index_follows_mutations():
+    ring = ActiveRing([0, 2, 5])
+    ring.remove(2)
+    assert 2 not in ring
+    assert ring.index(5) == 1
+    assert ring.next_after(5) == 0
+
+    ring.insert(1, 3)
+    ring.append(8)
+    assert ring == [0, 3, 5, 8]
+    assert ring.index(8) == 3
+    assert ring.next_after(8) == 0
+
+    del ring[0]
+    assert ring.next_after(8) == 3
+    assert [] not in ring
+
+
+def test_pickle_round_trip():
+    ring = pickle.loads(pickle.dumps(ActiveRing([4, 1, 6])))
+    assert isinstance(ring, ActiveRing)
+    assert ring.index(6) == 2
+    assert ring.next_after(6) == 4
@@ -0,0 +1,169 @@
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+from src.database.db_manager import DBManager, encode_record_cursor
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # DBManager 是单例，每个测试在临时目录中创建新的实例（归档目录使用相对路径）
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "poker.db"))
+    monkeypatch.setattr(DBManager, "_instance", None)
+    manager = DBManager()
+    yield manager
+    manager._cleanup_resources()
+
+
+def _record(n, ended_at):
+    return {
+        "game_id": str(uuid.UUID(int=n + 1)),
+        "start_time": ended_at - 30,
+        "end_time": ended_at,
+        "small_blind": 0.5,
+        "big_blind": 1,
+        "pot": 2,
+        "community_cards": [],
+        "players": [{"name": "alice", "position": 0, "chips_start": 100, "chips_end": 100}],
+        "winners": [],
+        "actions": [],
+    }
+
+
+def _record_hands(db, count, room_id="room-a", base=None, first=0):
+    base = time.time() - 3600 if base is None else base
+    records = [_record(first + n, base + n) for n in range(count)]
+    for record in records:
+        db.record_hand(record["game_id"], room_id, record["end_time"], record)
+    return records
+
+
+def _page_ids(db, room_id, limit):
+    ids = []
+    before = None
+    while True:
+        page = db.get_room_hands(room_id, limit, before)
+        if not page:
+            return ids
+        ids.extend(record["game_id"] for record in page)
+        before = page[-1]["game_id"]
+
+
+def test_room_hands_include_pending_writes(db):
+    # 写入缓冲区中尚未提交的牌局也能查到
+    records = _record_hands(db, 3)
+    assert [record["game_id"] for record in db.get_room_hands("room-a", 10)] == \
+        [record["game_id"] for record in reversed(records)]
+
+
+def test_room_hands_keyset_pages_across_archive(db):
+    records = _record_hands(db, 7)
+    _record_hands(db, 2, room_id="room-b", first=100)
+    db.write_batcher.flush()
+    # 较早的 4 手牌移入归档，其余仍在 hands 表中
+    assert db.roll_hand_archive(older_than=time.time() - records[3]["end_time"] - 0.5) == 6
+
+    expected = [record["game_id"] for record in reversed(records)]
+    assert _page_ids(db, "room-a", 3) == expected
+    assert _page_ids(db, "room-a", 2) == expected
+
+
+def test_room_hands_cursor_from_other_room_returns_nothing(db):
+    _record_hands(db, 2)
+    other = _record_hands(db, 1, room_id="room-b", base=time.time(), first=100)
+    assert db.get_room_hands("room-a", 10, before=other[0]["game_id"]) == []
+
+
+def _stats_table(db):
+    conn = db.read_pool.get_connection()
+    try:
+        return {row[0]: row[1:] for row in conn.execute('''
+        SELECT player, games, wins, losses, draws, total_buy_in, total_cash_out, profit, win_rate
+        FROM player_stats
+        ''')}
+    finally:
+        db.read_pool.release_connection(conn)
+
+
+def _stats_from_records(db):
+    """按 game_records 重新计算的统计，与迁移回填使用相同的聚合"""
+    conn = db.read_pool.get_connection()
+    try:
+        return {row[0]: row[1:] for row in conn.execute('''
+        SELECT
+            player,
+            COUNT(*),
+            SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END),
+            SUM(CASE WHEN cash_out < buy_in THEN 1 ELSE 0 END),
+            SUM(CASE WHEN cash_out = buy_in THEN 1 ELSE 0 END),
+            SUM(buy_in),
+            SUM(cash_out),
+            SUM(cash_out - buy_in),
+            SUM(CASE WHEN cash_out > buy_in THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
+        FROM game_records
+        GROUP BY player
+        ''')}
+    finally:
+        db.read_pool.release_connection(conn)
+
+
+def test_player_stats_upsert_matches_game_records(db):
+    # 同一批中同一玩家多次出现，以及跨批次累加
+    for buy_in, cash_out in ((100, 150), (100, 40), (50, 50)):
+        db.record_game("r1", "alice", buy_in, cash_out)
+    db.record_game("r1", "bob", 100, 0)
+    db.write_batcher.flush()
+    db.record_game("r2", "alice", 200, 260, durable=True)
+
+    stats = _stats_table(db)
+    assert stats == _stats_from_records(db)
+    assert stats["alice"] == (4, 2, 1, 1, 450, 500, 50, 50.0)
+    assert stats["bob"] == (1, 0, 1, 0, 100, 0, -100, 0.0)
+
+    assert db.get_user_statistics("alice")["win_rate"] == 50.0
+    assert db.get_user_statistics("carol")["total_games"] == 0
+    assert [row["username"] for row in db.get_profit_leaderboard()] == ["alice", "bob"]
+    assert db.get_win_rate_leaderboard(1) == [
+        {"username": "alice", "total_games": 4, "wins": 2, "win_rate": 50.0}]
+
+
+def test_failed_record_batch_leaves_stats_untouched(db, monkeypatch):
+    db.record_game("r1", "alice", 100, 150, durable=True)
+
+    def fail(conn, rows):
+        db._write_game_records(conn, rows)
+        raise sqlite3.IntegrityError("forced")
+
+    # 记录与统计在同一个保存点中，处理函数失败时两者都回滚
+    monkeypatch.setitem(db.write_batcher.handlers, "game_record", fail)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.record_game("r1", "alice", 100, 0, durable=True)
+
+    assert _stats_table(db)["alice"] == (1, 1, 0, 0, 100, 150, 50, 100.0)
+    assert _stats_table(db) == _stats_from_records(db)
+
+
+def test_game_records_cursor_pages_match_offset_pages(db):
+    for i in range(7):
+        db.record_game("r1", "alice" if i % 2 else "bob", 100, 100 + i)
+    db.write_batcher.flush()
+
+    expected = [record["id"] for record in db.get_game_records(limit=100)]
+    pages = []
+    cursor = None
+    while True:
+        page = db.get_game_records(limit=3, cursor=cursor)
+        if not page:
+            break
+        pages.extend(record["id"] for record in page)
+        cursor = encode_record_cursor(page[-1])
+    assert pages == expected
+
+    alice = db.get_user_game_records("alice", limit=2)
+    rest = db.get_user_game_records("alice", limit=10, cursor=encode_record_cursor(alice[-1]))
+    assert [record["id"] for record in alice + rest] == \
+        [record["id"] for record in db.get_user_game_records("alice", limit=10)]
+    assert db.count_user_game_records("alice") == 3
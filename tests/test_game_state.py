@@ -0,0 +1,80 @@
+import pytest
+
+from src.models.game import Game
+from src.utils.metrics import GAME_ACTION_SECONDS
+
+
+def _players(count=3):
+    return [{"name": f"p{i}", "chips": 100, "position": i, "total_buy_in": 100, "pending_buy_in": 0,
+             "online": True, "bet_amount": 0, "avatar": ""} for i in range(count)]
+
+
+@pytest.fixture
+def game():
+    game = Game(_players(), small_blind=0.5, big_blind=1, room_id="r1")
+    game.start_round()
+    yield game
+    game.cancel_all_timers()
+
+
+def _to_big_blind(game):
+    """前两名玩家弃牌并跟注，轮到大盲且不需要再跟注"""
+    for _ in range(2):
+        assert game.handle_discard(game.current_player_idx, 0)["success"]
+        assert game.handle_action("call")["success"]
+    assert game.handle_discard(game.current_player_idx, 0)["success"]
+
+
+def _observations(action):
+    series = GAME_ACTION_SECONDS.series.get((action,))
+    return series[2] if series else 0
+
+
+def test_get_state_is_cached_until_mutation(game):
+    first = game.get_state()
+    second = game.get_state()
+    assert second["players"] is first["players"]
+
+    player_idx = game.current_player_idx
+    assert game.handle_discard(player_idx, 0)["success"]
+    third = game.get_state()
+    assert third["players"] is not first["players"]
+    player = next(p for p in third["players"] if p["position"] == player_idx)
+    assert player["has_discarded"] is True
+
+
+def test_failed_action_still_invalidates(game):
+    version = game.version
+    # 还没有弃牌，动作被拒绝
+    assert not game.handle_action("call")["success"]
+    assert game.version > version
+
+
+def test_external_changes_need_mark_dirty(game):
+    game.get_state()
+    game.players[0]["online"] = False
+    assert game.get_state()["players"][0]["online"] is True
+    game.mark_dirty()
+    assert game.get_state()["players"][0]["online"] is False
+
+
+def _big_blind_acts(action):
+    """大盲在不需要跟注时执行 action，返回 (状态版本的变化, call 的耗时记录数, check 的耗时记录数)"""
+    game = Game(_players(), small_blind=0.5, big_blind=1, room_id="r1")
+    game.start_round()
+    try:
+        _to_big_blind(game)
+        version, calls, checks = game.version, _observations("call"), _observations("check")
+        assert game.handle_action(action)["success"]
+        return game.version - version, _observations("call") - calls, _observations("check") - checks
+    finally:
+        game.cancel_all_timers()
+
+
+def test_redirected_call_is_one_action():
+    # call 在不需要跟注时改为 check：只记录一次耗时，状态版本的变化与直接 check 相同
+    call_version, call_calls, call_checks = _big_blind_acts("call")
+    check_version, check_calls, check_checks = _big_blind_acts("check")
+    assert (call_calls, call_checks) == (1, 0)
+    assert (check_calls, check_checks) == (0, 1)
+    assert call_version == check_version
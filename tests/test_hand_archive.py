@@ -0,0 +1,148 @@
+import uuid
+
+from src.database.hand_archive import SEGMENT_SUFFIX, HandArchive
+from src.utils.hand_codec import encode_hand
+
+BASE_TIME = 1700000000.0
+
+
+def _hand(n, room_id="room-a", players=("alice", "bob")):
+    hand_id = str(uuid.UUID(int=n + 1))
+    ended_at = BASE_TIME + n
+    record = {
+        "game_id": hand_id,
+        "start_time": ended_at - 30,
+        "end_time": ended_at,
+        "small_blind": 0.5,
+        "big_blind": 1,
+        "pot": 2,
+        "community_cards": [],
+        "players": [{"name": name, "position": i, "chips_start": 100, "chips_end": 100}
+                    for i, name in enumerate(players)],
+        "winners": [],
+        "actions": [],
+    }
+    return hand_id, room_id, ended_at, list(players), encode_hand(record)
+
+
+def _append_batches(archive, batches, batch_size=5):
+    hands = []
+    for b in range(batches):
+        batch = [_hand(b * batch_size + i, room_id="room-a" if i % 2 == 0 else "room-b")
+                 for i in range(batch_size)]
+        archive.append(batch)
+        hands.extend(batch)
+    return hands
+
+
+def _segment_files(directory):
+    return sorted(path.name for path in directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+
+def test_append_and_get_hand(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=8, merge_factor=4)
+    hands = _append_batches(archive, 2)
+
+    assert archive.hand_count == 10
+    room_id, record = archive.get_hand(hands[3][0])
+    assert room_id == "room-b"
+    assert record["game_id"] == hands[3][0]
+    assert archive.get_hand(str(uuid.UUID(int=999))) is None
+
+
+def test_empty_batch_writes_no_segment(tmp_path):
+    archive = HandArchive(tmp_path)
+    assert archive.append([]) == 0
+    assert archive.segments == []
+    assert _segment_files(tmp_path) == []
+
+
+def test_same_tier_segments_are_merged(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=32, merge_factor=2)
+    hands = _append_batches(archive, 8)
+
+    # 8 个同样大小的段两两合并，最终只剩一个段
+    assert len(archive.segments) == 1
+    assert archive.hand_count == len(hands)
+    assert _segment_files(tmp_path) == [archive.segments[0].path.name]
+    for hand_id, room_id, _, _, _ in hands:
+        assert archive.get_hand(hand_id)[0] == room_id
+
+
+def test_segment_count_stays_bounded(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=3, merge_factor=4)
+    # 逐渐增大的批次使各段处于不同层，只能依靠段数上限合并
+    n = 0
+    for size in (1, 4, 16, 64, 5):
+        archive.append([_hand(n + i) for i in range(size)])
+        n += size
+        assert len(archive.segments) <= 3
+    assert archive.hand_count == n
+
+
+def test_room_hands_paginates_across_segments(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=32, merge_factor=4)
+    hands = _append_batches(archive, 3)
+    assert len(archive.segments) == 3
+
+    expected = [hand[0] for hand in reversed(hands) if hand[1] == "room-a"]
+    assert archive.count_room_hands("room-a") == len(expected)
+
+    pages = []
+    before = None
+    while True:
+        page = archive.room_hands("room-a", limit=3, before=before)
+        if not page:
+            break
+        assert len(page) <= 3
+        pages.extend(record["game_id"] for record in page)
+        before = (page[-1]["end_time"], page[-1]["game_id"])
+    assert pages == expected
+
+
+def test_room_hands_orders_ties_by_hand_id(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=32, merge_factor=4)
+    tied = []
+    for n in range(4):
+        hand = list(_hand(n))
+        hand[2] = BASE_TIME
+        tied.append(tuple(hand))
+    archive.append(tied[:2])
+    archive.append(tied[2:])
+
+    expected = sorted((hand[0] for hand in tied), reverse=True)
+    first = archive.room_hands("room-a", limit=2)
+    assert [record["game_id"] for record in first] == expected[:2]
+    second = archive.room_hands("room-a", limit=2, before=(BASE_TIME, expected[1]))
+    assert [record["game_id"] for record in second] == expected[2:]
+
+
+def test_player_hands_time_range(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=32, merge_factor=4)
+    archive.append([_hand(i) for i in range(5)])
+    archive.append([_hand(5 + i, players=("carol", "dave")) for i in range(5)])
+    archive.append([_hand(10 + i) for i in range(5)])
+
+    results = archive.player_hands("alice", limit=100)
+    assert [record["end_time"] for _, record in results] == \
+        [BASE_TIME + n for n in (14, 13, 12, 11, 10, 4, 3, 2, 1, 0)]
+
+    results = archive.player_hands("alice", start_time=BASE_TIME + 2, end_time=BASE_TIME + 12, limit=3)
+    assert [record["end_time"] for _, record in results] == [BASE_TIME + 11, BASE_TIME + 10, BASE_TIME + 4]
+    assert archive.player_hands("nobody") == []
+
+
+def test_reload_uses_manifest_and_ignores_stale_segments(tmp_path):
+    archive = HandArchive(tmp_path, max_segments=32, merge_factor=4)
+    hands = _append_batches(archive, 2)
+    live = _segment_files(tmp_path)
+
+    # 模拟合并后未能删除的旧段：内容与有效段重复，但不在清单中
+    stale = tmp_path / f"{0:020d}{SEGMENT_SUFFIX}"
+    stale.write_bytes(archive.segments[0].path.read_bytes())
+
+    reloaded = HandArchive(tmp_path, max_segments=32, merge_factor=4)
+    assert reloaded.hand_count == len(hands)
+    assert archive.count_room_hands("room-a") == reloaded.count_room_hands("room-a")
+    assert not stale.exists()
+    assert _segment_files(tmp_path) == live
@@ -0,0 +1,120 @@
+import io
+
+import pytest
+
+from src.utils.hand_codec import (
+    HandCodecError,
+    HandReader,
+    HandWriter,
+    _read_svarint,
+    _unzigzag,
+    _write_svarint,
+    _zigzag,
+    decode_hand,
+    encode_hand,
+    load_hand,
+)
+
+
+def _card(rank, suit):
+    return {'rank': rank, 'suit': suit, 'display': f"{rank}{suit}"}
+
+
+def _sample_record():
+    return {
+        "game_id": "0b5c3f0e-8a39-4a8e-9d7a-3f1c2b4d5e6f",
+        "start_time": 1700000000.125,
+        "end_time": 1700000042.5,
+        "small_blind": 0.5,
+        "big_blind": 1,
+        "pot": 12.75,
+        "community_cards": [_card('A', 's'), _card('10', 'h'), _card('2', 'd'), _card('K', 'c'), _card('7', 's')],
+        "players": [
+            {"name": "alice", "position": 0, "chips_start": 100, "chips_end": 112.75},
+            {"name": "bob", "position": 3, "chips_start": 50.0, "chips_end": 37.25, "hole_cards": ["As", "Kd"]},
+        ],
+        "winners": [{"name": "alice", "position": 0, "amount": 12.75, "hand_type": "Two Pair"}],
+        "actions": [
+            {"round": 0, "player_idx": 0, "player": "alice", "action": "small_blind", "amount": 0.5,
+             "timestamp": 1700000000.2},
+            {"round": 0, "player_idx": 3, "player": "bob", "action": "big_blind", "amount": 1,
+             "timestamp": 1700000000.3},
+            {"round": 0, "player_idx": 0, "player_name": "alice", "action": "discard", "discard_index": 2,
+             "timestamp": 1700000001.0},
+            {"round": 3, "player_idx": 3, "player": "bob", "action": "fold", "timestamp": 1700000040.0},
+            {"action": "time_limit_reached", "player_idx": -1, "timestamp": 1699999999.5},
+        ],
+    }
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 2, -2, 63, -64, 64, -65, 2 ** 31, -(2 ** 31), 2 ** 63, -(2 ** 63) - 1])
+def test_zigzag_round_trip(value):
+    assert _zigzag(value) >= 0
+    assert _unzigzag(_zigzag(value)) == value
+
+    out = bytearray()
+    _write_svarint(out, value)
+    decoded, pos = _read_svarint(out, 0)
+    assert decoded == value
+    assert pos == len(out)
+
+
+def test_zigzag_small_negatives_stay_small():
+    assert [_zigzag(v) for v in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+    out = bytearray()
+    _write_svarint(out, -64)
+    assert len(out) == 1
+
+
+def test_record_round_trip():
+    record = _sample_record()
+    assert decode_hand(encode_hand(record)) == record
+
+
+def test_negative_deltas_round_trip():
+    # 动作时间早于上一个时间、开始时间晚于结束时间时，差值为负数
+    record = _sample_record()
+    record["start_time"] = record["end_time"] + 3.25
+    record["pot"] = -4.5
+    record["actions"][1]["amount"] = -7
+    assert decode_hand(encode_hand(record)) == record
+
+
+def test_non_uuid_id_and_raw_values_round_trip():
+    record = _sample_record()
+    record["game_id"] = 42
+    record["start_time"] = None
+    record["community_cards"] = [_card('A', 's'), "joker"]
+    record["pot"] = 0.1 + 0.2
+    record["extra"] = {"nested": [1, 2, 3]}
+    assert decode_hand(encode_hand(record)) == record
+
+
+def test_load_hand_accepts_binary_and_legacy_json():
+    record = _sample_record()
+    assert load_hand(encode_hand(record)) == record
+    assert load_hand('{"game_id": "legacy", "actions": []}') == {"game_id": "legacy", "actions": []}
+
+
+def test_truncated_data_raises():
+    data = encode_hand(_sample_record())
+    with pytest.raises(HandCodecError):
+        decode_hand(data[:len(data) // 2])
+
+
+def test_writer_reader_stream():
+    records = [_sample_record() for _ in range(3)]
+    records[1]["game_id"] = "second"
+    buffer = io.BytesIO()
+    writer = HandWriter(buffer)
+    for record in records:
+        writer.write(record)
+    assert writer.count == 3
+
+    buffer.seek(0)
+    assert list(HandReader(buffer)) == records
+
+
+def test_reader_rejects_other_files():
+    with pytest.raises(HandCodecError):
+        HandReader(io.BytesIO(b"not a hand file"))
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from src.database import migrations
+from src.database.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+LATEST = MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """迁移之前的数据库：users 没有 email / avatar，game_records 已有数据"""
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password_hash TEXT NOT NULL, balance INTEGER DEFAULT 0)")
+    conn.execute('''
+    CREATE TABLE game_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id TEXT,
+        player TEXT,
+        buy_in INTEGER,
+        cash_out INTEGER,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.executemany("INSERT INTO game_records (room_id, player, buy_in, cash_out) VALUES (?, ?, ?, ?)", [
+        ("r1", "alice", 100, 150),
+        ("r1", "alice", 100, 100),
+        ("r1", "bob", 100, 20),
+        ("r2", "alice", 50, 0),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _indexes(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_migrations_upgrade_legacy_database(legacy_db):
+    assert run_migrations(legacy_db) == [version for version, _, _ in MIGRATIONS]
+    assert get_schema_version(legacy_db) == LATEST
+
+    columns = [row[1] for row in legacy_db.execute("PRAGMA table_info(users)")]
+    assert "email" in columns and "avatar" in columns
+    assert {"idx_game_records_player_ts", "idx_game_records_ts_id", "idx_hands_room_ended_id"} <= _indexes(legacy_db)
+    assert "idx_hands_room_ended" not in _indexes(legacy_db)
+
+    # player_stats 从已有的游戏记录回填
+    stats = {row[0]: row[1:] for row in legacy_db.execute(
+        "SELECT player, games, wins, losses, draws, total_buy_in, total_cash_out, profit FROM player_stats")}
+    assert stats == {
+        "alice": (3, 1, 1, 1, 250, 250, 0),
+        "bob": (1, 0, 1, 0, 100, 20, -80),
+    }
+
+
+def test_migrations_are_idempotent(legacy_db):
+    run_migrations(legacy_db)
+    assert run_migrations(legacy_db) == []
+    assert get_schema_version(legacy_db) == LATEST
+    assert legacy_db.execute("SELECT COUNT(*) FROM player_stats").fetchone()[0] == 2
+
+
+def test_failed_migration_rolls_back(legacy_db, monkeypatch):
+    run_migrations(legacy_db)
+
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        conn.execute("SELECT * FROM no_such_table")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(LATEST + 1, "broken", broken)])
+    with pytest.raises(sqlite3.Error):
+        run_migrations(legacy_db)
+
+    # 失败的迁移不留下部分修改，版本号保持不变，可以修复后重新运行
+    assert get_schema_version(legacy_db) == LATEST
+    assert legacy_db.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
@@ -0,0 +1,75 @@
+import time
+
+from src.utils.rate_limit import ConnectionRateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_rejects():
+    now = time.monotonic() + 1
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_refills_at_rate():
+    now = time.monotonic() + 1
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.take(now)
+
+    assert not bucket.take(now + 0.25)
+    assert bucket.take(now + 0.5)
+    assert not bucket.take(now + 0.5)
+    # 补充量不超过容量
+    assert [bucket.take(now + 100) for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_ignores_clock_going_backwards():
+    now = time.monotonic() + 10
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.take(now)
+    assert not bucket.take(now - 5)
+    assert bucket.take(now + 1)
+
+
+def test_limiter_uses_per_type_buckets():
+    limiter = ConnectionRateLimiter(limits={"chat": (1, 1), "other": (1, 2)}, max_violations=10)
+    now = time.monotonic() + 1
+    assert limiter.check("chat", now) == ConnectionRateLimiter.ALLOW
+    assert limiter.check("chat", now) == ConnectionRateLimiter.REJECT
+    # 未列出的类型共用 other 的预算
+    assert limiter.check("ping", now) == ConnectionRateLimiter.ALLOW
+    assert limiter.check("unknown", now) == ConnectionRateLimiter.ALLOW
+    assert limiter.check("ping", now) == ConnectionRateLimiter.REJECT
+
+
+def test_limiter_disconnects_after_violation_budget():
+    limiter = ConnectionRateLimiter(limits={"other": (1, 1)}, max_violations=3, violation_decay=1)
+    now = time.monotonic() + 1
+    assert limiter.check("chat", now) == ConnectionRateLimiter.ALLOW
+    results = [limiter.check("chat", now) for _ in range(4)]
+    assert results == [ConnectionRateLimiter.REJECT] * 3 + [ConnectionRateLimiter.DISCONNECT]
+
+
+def test_violations_decay_over_time():
+    limiter = ConnectionRateLimiter(limits={"other": (0.001, 1)}, max_violations=2, violation_decay=1)
+    now = time.monotonic() + 1
+    limiter.check("chat", now)
+    assert limiter.check("chat", now) == ConnectionRateLimiter.REJECT
+    assert limiter.check("chat", now) == ConnectionRateLimiter.REJECT
+    # 违规桶每秒恢复一条
+    assert limiter.check("chat", now + 1) == ConnectionRateLimiter.REJECT
+    assert limiter.check("chat", now + 1) == ConnectionRateLimiter.DISCONNECT
+
+
+def test_should_notify_once_per_throttled_period():
+    limiter = ConnectionRateLimiter(limits={"other": (1, 1)}, max_violations=10)
+    now = time.monotonic() + 1
+    limiter.check("chat", now)
+    assert limiter.check("chat", now) == ConnectionRateLimiter.REJECT
+    assert limiter.should_notify("chat")
+    assert limiter.check("chat", now) == ConnectionRateLimiter.REJECT
+    assert not limiter.should_notify("chat")
+
+    # 重新放行后，下一次超限再通知
+    assert limiter.check("chat", now + 1) == ConnectionRateLimiter.ALLOW
+    assert limiter.check("chat", now + 1) == ConnectionRateLimiter.REJECT
+    assert limiter.should_notify("chat")
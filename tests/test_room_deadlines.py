@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.managers import room_manager as room_manager_module
+from src.managers.room_manager import CLEANUP_INTERVAL, EXPIRING_NOTICE_SECONDS, RoomManager
+from src.models.room import Room
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    # 不经过单例的 __init__：不加载状态文件，也不启动保存和清理线程，由测试直接驱动截止时间队列
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(room_manager_module, "GLOBAL_ROOMS", {})
+    manager = object.__new__(RoomManager)
+    manager.listeners = []
+    manager.deadline_heap = []
+    manager.deadline_seq = itertools.count()
+    manager.room_deadlines = {}
+    manager.deadline_condition = threading.Condition()
+    manager.send_notifications = lambda notifications: None
+    return manager
+
+
+def _add_room(manager, idle_seconds=0, room_id="r1"):
+    room = Room(room_id, "table", small_blind=0.5, big_blind=1, buy_in_min=100, buy_in_max=1000)
+    room.last_activity_time = datetime.now() - timedelta(seconds=idle_seconds)
+    room_manager_module.GLOBAL_ROOMS[room_id] = room
+    manager.schedule_room_deadline(room)
+    return room
+
+
+def _pop_due(manager, now):
+    due = []
+    while manager.deadline_heap and manager.deadline_heap[0][0] <= now:
+        entry = heapq.heappop(manager.deadline_heap)
+        if manager.room_deadlines.get(entry[2]) == entry[4]:
+            due.append(entry)
+    return due
+
+
+def test_schedule_pushes_expiring_and_expired_entries(manager):
+    room = _add_room(manager)
+    deadline = room.last_activity_time.timestamp() + room.max_idle_time_hours * 3600
+
+    entries = sorted((fire_at, kind) for fire_at, _, _, kind, _ in manager.deadline_heap)
+    assert entries == [(deadline - EXPIRING_NOTICE_SECONDS, "expiring"), (deadline, "expired")]
+    assert manager.room_deadlines["r1"] == deadline
+
+
+def test_activity_supersedes_old_entries(manager):
+    room = _add_room(manager, idle_seconds=3600)
+    room.last_activity_time = datetime.now()
+    manager.schedule_room_deadline(room)
+
+    # 旧的截止时间已到，但出队时会被丢弃
+    assert _pop_due(manager, time.time()) == []
+
+
+def test_expired_room_is_removed(manager):
+    _add_room(manager, idle_seconds=3600)
+    manager.cleanup_expired_rooms(_pop_due(manager, time.time()))
+
+    assert "r1" not in room_manager_module.GLOBAL_ROOMS
+    assert "r1" not in manager.room_deadlines
+
+
+def test_due_room_not_yet_expired_is_rescheduled(manager, monkeypatch):
+    room = _add_room(manager, idle_seconds=3600)
+    # 截止时间已到但 is_expired() 仍为 False（例如恰好处于边界）
+    monkeypatch.setattr(Room, "is_expired", lambda self: False)
+    now = time.time()
+    manager.cleanup_expired_rooms(_pop_due(manager, now))
+
+    assert "r1" in room_manager_module.GLOBAL_ROOMS
+    entries = [entry for entry in manager.deadline_heap if manager.room_deadlines.get(entry[2]) == entry[4]]
+    assert len(entries) == 1
+    fire_at, _, room_id, kind, _ = entries[0]
+    assert (room_id, kind) == ("r1", "expired")
+    assert now < fire_at < now + CLEANUP_INTERVAL
+
+    # 再次到期时房间已过期，被删除
+    monkeypatch.undo()
+    manager.cleanup_expired_rooms(_pop_due(manager, fire_at))
+    assert "r1" not in room_manager_module.GLOBAL_ROOMS
+
+
+def test_room_with_game_is_rechecked_later(manager):
+    room = _add_room(manager, idle_seconds=3600)
+    room.game = object()
+    now = time.time()
+    manager.cleanup_expired_rooms(_pop_due(manager, now))
+
+    assert "r1" in room_manager_module.GLOBAL_ROOMS
+    fire_times = [entry[0] for entry in manager.deadline_heap if manager.room_deadlines.get(entry[2]) == entry[4]]
+    assert len(fire_times) == 1
+    assert fire_times[0] >= now + CLEANUP_INTERVAL - 1
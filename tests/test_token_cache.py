@@ -0,0 +1,135 @@
+import time
+
+import jwt
+import pytest
+
+from src.utils import token_cache as token_cache_module
+from src.utils.token_cache import TokenCache
+
+SECRET = "test-secret"
+ALGORITHM = "HS256"
+
+
+def _token(sub, iat=None, exp_in=3600, **extra):
+    now = time.time()
+    claims = {"sub": sub, "iat": now if iat is None else iat, "exp": now + exp_in}
+    claims.update(extra)
+    return jwt.encode(claims, SECRET, algorithm=ALGORITHM)
+
+
+@pytest.fixture
+def cache():
+    return TokenCache(SECRET, ALGORITHM)
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    calls = []
+    real_decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(token_cache_module.jwt, "decode", counting_decode)
+    return calls
+
+
+def test_verify_caches_claims(cache, decode_calls):
+    token = _token("alice")
+    assert cache.verify(token)["sub"] == "alice"
+    assert cache.verify(token)["sub"] == "alice"
+    assert len(decode_calls) == 1
+
+
+def test_invalid_signature_is_rejected(cache):
+    token = jwt.encode({"sub": "alice", "exp": time.time() + 60}, "other-secret", algorithm=ALGORITHM)
+    with pytest.raises(jwt.InvalidSignatureError):
+        cache.verify(token)
+
+
+def test_expired_token_is_rejected(cache):
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.verify(_token("alice", exp_in=-10))
+
+
+def test_cached_token_expires(cache, decode_calls, monkeypatch):
+    token = _token("alice", exp_in=60)
+    cache.verify(token)
+
+    # 超过 exp 后不再使用缓存，重新解码验证
+    real_time = time.time
+    monkeypatch.setattr(token_cache_module.time, "time", lambda: real_time() + 120)
+    cache.verify(token)
+    assert len(decode_calls) == 2
+
+
+def test_cache_size_is_bounded():
+    cache = TokenCache(SECRET, ALGORITHM, max_entries=2)
+    tokens = [_token(f"user{i}") for i in range(3)]
+    for token in tokens:
+        cache.verify(token)
+    assert len(cache.entries) == 2
+    assert TokenCache._digest(tokens[0]) not in cache.entries
+
+
+def test_revoke_token(cache):
+    token = _token("alice")
+    other = _token("alice", nonce=1)
+    cache.verify(token)
+
+    cache.revoke_token(token)
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(token)
+    # 同一用户的其他令牌不受影响
+    assert cache.verify(other)["sub"] == "alice"
+
+
+def test_revoke_invalid_token_is_ignored(cache):
+    cache.revoke_token("not-a-token")
+    assert len(cache.revoked_tokens) == 0
+
+
+def test_revoke_user_only_affects_older_tokens(cache):
+    now = time.time()
+    old = _token("alice", iat=now - 60)
+    bob = _token("bob", iat=now - 60)
+    cache.verify(old)
+
+    cache.revoke_user("alice", before=now - 30)
+    new = _token("alice", iat=now)
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(old)
+    assert cache.verify(new)["sub"] == "alice"
+    assert cache.verify(bob)["sub"] == "bob"
+
+
+def test_expired_revocations_are_purged(cache, monkeypatch):
+    short = _token("alice", exp_in=60)
+    cache.revoke_token(short)
+    assert len(cache.revoked_tokens) == 1
+
+    real_time = time.time
+    monkeypatch.setattr(token_cache_module.time, "time", lambda: real_time() + 120)
+    cache.revoke_token(_token("bob", iat=real_time(), exp_in=3600))
+    assert list(cache.revoked_tokens.values())[0][1] == "bob"
+    assert len(cache.revoked_tokens) == 1
+
+
+def test_revoked_set_is_bounded():
+    cache = TokenCache(SECRET, ALGORITHM, max_revoked=2)
+    now = time.time()
+    oldest = _token("alice", iat=now - 30)
+    older_sibling = _token("alice", iat=now - 40)
+    newer_sibling = _token("alice", iat=now - 10)
+    cache.revoke_token(oldest)
+    cache.revoke_token(_token("bob", iat=now - 20))
+    cache.revoke_token(_token("carol", iat=now - 20))
+
+    assert len(cache.revoked_tokens) == 2
+    # 最旧的撤销记录转为按用户撤销，仍然无效，之前签发的同用户令牌也一并失效
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(oldest)
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(older_sibling)
+    assert cache.verify(newer_sibling)["sub"] == "alice"
@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+import pytest
+
+from src import websocket_manager as websocket_manager_module
+from src.websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection lost")
+        self.sent.append(text)
+
+    async def send_json(self, data):
+        await self.send_text(str(data))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+@pytest.fixture
+def manager():
+    manager = ConnectionManager()
+    offline_calls = []
+
+    async def offline_handler(room_id, client_ids):
+        offline_calls.append((room_id, client_ids))
+
+    manager.offline_handler = offline_handler
+    manager.offline_calls = offline_calls
+    return manager
+
+
+def _run(manager, coro_func):
+    async def main():
+        manager.bind_loop(asyncio.get_running_loop())
+        result = await coro_func()
+        # 等待 mark_dead 提交的关闭任务
+        await asyncio.sleep(0)
+        return result
+    return asyncio.run(main())
+
+
+def test_idle_connections_are_not_reaped(manager):
+    # 存活由协议层 ping/pong 判断，长时间没有应用层消息的连接不会被清理
+    websocket = FakeWebSocket()
+
+    async def scenario():
+        await manager.connect(websocket, "alice", "r1")
+        await manager.flush_offline()
+
+    _run(manager, scenario)
+    assert manager.is_client_connected("alice")
+    assert manager.offline_calls == []
+
+
+def test_failed_send_marks_client_dead_and_batches_offline(manager):
+    good, bad, other = FakeWebSocket(), FakeWebSocket(fail=True), FakeWebSocket(fail=True)
+
+    async def scenario():
+        await manager.connect(good, "alice", "r1")
+        await manager.connect(bad, "bob", "r1")
+        await manager.connect(other, "carol", "r1")
+        for _ in range(3):
+            await manager.broadcast_to_room("r1", {"type": "chat"})
+        await asyncio.sleep(0)
+        await manager.flush_offline()
+
+    _run(manager, scenario)
+    assert len(good.sent) == 3
+    assert not manager.is_client_connected("bob")
+    assert manager.room_players["r1"] == ["alice"]
+    assert bad.closed is not None and other.closed is not None
+    # 同一房间的离线客户端一次处理
+    assert manager.offline_calls == [("r1", ["bob", "carol"])]
+
+
+def test_reconnect_before_flush_is_not_offline(manager):
+    async def scenario():
+        await manager.connect(FakeWebSocket(), "alice", "r1")
+        manager.mark_dead("alice")
+        await manager.reconnect(FakeWebSocket(), "alice", "r1")
+        await manager.flush_offline()
+
+    _run(manager, scenario)
+    assert manager.is_client_connected("alice")
+    assert manager.offline_calls == []
+
+
+def test_chat_is_coalesced_and_capped(manager, monkeypatch):
+    monkeypatch.setattr(websocket_manager_module, "CHAT_COALESCE_INTERVAL", 0)
+    websocket = FakeWebSocket()
+
+    async def scenario():
+        await manager.connect(websocket, "alice", "r1")
+        manager.queue_chat("r1", {"player": "alice", "message": "x" * 10000})
+        manager.queue_chat("r1", {"player": "alice", "message": "hi"})
+        await asyncio.sleep(0.01)
+
+    _run(manager, scenario)
+    assert len(websocket.sent) == 1
+    frame = json.loads(websocket.sent[0])
+    assert frame["type"] == "chat_batch"
+    assert [len(chat["message"]) for chat in frame["data"]["messages"]] == \
+        [websocket_manager_module.CHAT_MAX_LENGTH, 2]
+    assert "r1" not in manager.pending_chat
+
+
+def test_chat_without_loop_does_not_stay_pending(manager):
+    # 主循环不可用时消息被丢弃，但房间不能一直处于待广播状态
+    manager.queue_chat("r1", {"player": "alice", "message": "lost"})
+    assert "r1" not in manager.pending_chat
+
+    websocket = FakeWebSocket()
+
+    async def scenario():
+        await manager.connect(websocket, "alice", "r1")
+        manager.queue_chat("r1", {"player": "alice", "message": "hello"})
+        await asyncio.sleep(websocket_manager_module.CHAT_COALESCE_INTERVAL + 0.05)
+
+    _run(manager, scenario)
+    assert len(websocket.sent) == 1
+    messages = json.loads(websocket.sent[0])["data"]["messages"]
+    assert [chat["message"] for chat in messages] == ["hello"]
+
+
+class InterleavingWebSocket(FakeWebSocket):
+    """发送 resumed 标记时触发一条新的广播，模拟补发期间到达的实时消息"""
+
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+
+    async def send_text(self, text):
+        await super().send_text(text)
+        if json.loads(text)["type"] == "resumed":
+            await self.manager.broadcast_to_room("r1", {"type": "chat", "data": "during marker"})
+
+
+def test_resume_replays_then_marks_before_live_frames(manager):
+    websocket = InterleavingWebSocket(manager)
+
+    async def scenario():
+        await manager.connect(FakeWebSocket(), "alice", "r1")
+        await manager.connect(websocket, "bob", "r1")
+        for i in range(3):
+            await manager.broadcast_to_room("r1", {"type": "chat", "data": i})
+        websocket.sent.clear()
+
+        stream_id = manager.stream_position("r1")["stream_id"]
+        resumed = await manager.resume("r1", "bob", stream_id, 1)
+        await manager.broadcast_to_room("r1", {"type": "chat", "data": "live"})
+        return resumed
+
+    assert _run(manager, scenario)
+    frames = [json.loads(text) for text in websocket.sent]
+    assert [frame["type"] for frame in frames] == ["chat", "chat", "resumed", "chat", "chat"]
+    # 标记带最后补发的 seq，之后的帧都在标记之后、按顺序且不重复
+    assert frames[2]["data"]["seq"] == 3
+    assert [frame.get("seq") for frame in frames] == [2, 3, None, 4, 5]
+
+
+def test_resume_with_stale_stream_needs_full_state(manager):
+    websocket = FakeWebSocket()
+
+    async def scenario():
+        await manager.connect(websocket, "bob", "r1")
+        await manager.broadcast_to_room("r1", {"type": "chat"})
+        return await manager.resume("r1", "bob", "other-stream", 0)
+
+    assert not _run(manager, scenario)
+    assert "bob" not in manager.resuming
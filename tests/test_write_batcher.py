@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.database import write_batcher as write_batcher_module
+from src.database.db_manager import DBConnectionPool
+from src.database.write_batcher import WriteBatcher
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = DBConnectionPool(str(tmp_path / "batch.db"), max_connections=2, timeout=0.05)
+    conn = pool.get_connection()
+    conn.execute("CREATE TABLE records (player TEXT, amount INTEGER)")
+    conn.execute("CREATE TABLE hands (hand_id TEXT, payload TEXT)")
+    conn.commit()
+    pool.release_connection(conn)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def batcher(pool, monkeypatch):
+    monkeypatch.setattr(write_batcher_module, "BATCH_RETRY_DELAY", 0.05)
+    # 后台线程几乎不会自动写入，测试中手动 flush，使多种写入进入同一批
+    batcher = WriteBatcher(pool, flush_interval=60, max_rows=1000)
+    batcher.register_statement("record", "INSERT INTO records (player, amount) VALUES (?, ?)")
+    batcher.start()
+    yield batcher
+    batcher.stop()
+
+
+def _rows(pool, table):
+    conn = pool.get_connection()
+    try:
+        return conn.execute(f"SELECT * FROM {table}").fetchall()
+    finally:
+        pool.release_connection(conn)
+
+
+def test_rows_are_written_in_one_flush(batcher, pool):
+    flushed = []
+    batcher.add_flush_listener(flushed.append)
+    futures = [batcher.submit("record", (f"p{i}", i)) for i in range(3)]
+
+    assert batcher.flush() == 3
+    assert all(future.result(timeout=1) for future in futures)
+    assert len(_rows(pool, "records")) == 3
+    assert flushed == [["record"]]
+
+
+def test_failing_kind_does_not_roll_back_other_kinds(batcher, pool):
+    def bad_handler(conn, rows):
+        conn.executemany("INSERT INTO hands (hand_id, payload) VALUES (?, ?)", rows)
+        raise ValueError("bad hand")
+
+    batcher.register("hand", bad_handler)
+    record = batcher.submit("record", ("alice", 10))
+    hand = batcher.submit("hand", ("h1", "payload"))
+
+    assert batcher.flush() == 1
+    assert record.result(timeout=1) is True
+    with pytest.raises(ValueError):
+        hand.result(timeout=1)
+    assert _rows(pool, "records") == [("alice", 10)]
+    # 出错类型的部分写入已回滚
+    assert _rows(pool, "hands") == []
+
+
+def test_prepare_failure_only_drops_that_row(batcher, pool):
+    def prepare(row):
+        hand_id, record = row
+        if record is None:
+            raise ValueError("cannot encode")
+        return hand_id, str(record)
+
+    batcher.register_statement("hand", "INSERT INTO hands (hand_id, payload) VALUES (?, ?)", prepare=prepare)
+    good = batcher.submit("hand", ("h1", {"pot": 1}))
+    bad = batcher.submit("hand", ("h2", None))
+    record = batcher.submit("record", ("bob", 5))
+
+    assert batcher.flush() == 2
+    assert good.result(timeout=1) and record.result(timeout=1)
+    with pytest.raises(ValueError):
+        bad.result(timeout=1)
+    assert _rows(pool, "hands") == [("h1", "{'pot': 1}")]
+    assert _rows(pool, "records") == [("bob", 5)]
+
+
+def _lock_database(pool):
+    conn = pool.get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+
+def test_locked_database_is_retried(batcher, pool):
+    locker = _lock_database(pool)
+    future = batcher.submit("record", ("carol", 7))
+
+    def unlock():
+        locker.rollback()
+        pool.release_connection(locker)
+
+    timer = threading.Timer(0.08, unlock)
+    timer.start()
+    try:
+        assert batcher.flush() == 1
+    finally:
+        timer.join()
+    assert future.result(timeout=1) is True
+    assert _rows(pool, "records") == [("carol", 7)]
+
+
+def test_persistent_lock_fails_the_batch(batcher, pool):
+    locker = _lock_database(pool)
+    try:
+        future = batcher.submit("record", ("dave", 1))
+        assert batcher.flush() == 0
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=1)
+    finally:
+        locker.rollback()
+        pool.release_connection(locker)
+    assert _rows(pool, "records") == []
+
+
+def test_durable_submit_raises_write_errors(pool):
+    batcher = WriteBatcher(pool)
+
+    def bad_handler(conn, rows):
+        raise ValueError("broken")
+
+    batcher.register("bad", bad_handler)
+    # 后台线程未运行时同步写入
+    with pytest.raises(ValueError):
+        batcher.submit("bad", ("x",), durable=True)
@@ -1,6 +1,10 @@
+import argparse
 import sqlite3
-import hashlib
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.utils.passwords import hash_password, is_legacy_hash, wrap_legacy_hash
 
 # User credentials to update
 users = {
@@ -9,21 +13,24 @@ users = {
     "player2": "player2_password"
 }
 
+# 使用环境变量或默认为当前目录中的poker.db
+DB_PATH = os.getenv("DB_PATH", "poker.db")
+
+# 批量迁移时每批处理的用户数
+MIGRATE_BATCH_SIZE = 500
+
 def update_password(username, password):
     # Generate password hash
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    # 使用环境变量或默认为当前目录中的poker.db
-    db_path = os.getenv("DB_PATH", "poker.db")
-    
+    password_hash = hash_password(password)
+
     # Connect to database
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    
+
     # Check if user exists
     c.execute('SELECT username FROM users WHERE username = ?', (username,))
     user = c.fetchone()
-    
+
     if user:
         # Update password
         c.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username))
@@ -34,14 +41,60 @@ def update_password(username, password):
         c.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
         conn.commit()
         print(f"Created user {username}")
-    
+
     conn.close()
 
+def _wrap_user(row):
+    username, legacy_hash = row
+    return username, legacy_hash, wrap_legacy_hash(legacy_hash)
+
+def migrate_legacy_hashes(workers=None):
+    """把所有旧的无盐 sha256 哈希并行包装为 scrypt-sha256
+
+    不需要明文密码，用户下次登录时会再升级为普通的 scrypt 哈希。
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        rows = [row for row in conn.execute('SELECT username, password_hash FROM users')
+                if row[1] and is_legacy_hash(row[1])]
+        if not rows:
+            print("No legacy password hashes found.")
+            return 0
+
+        print(f"Migrating {len(rows)} legacy password hashes...")
+        start = time.time()
+        migrated = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(rows), MIGRATE_BATCH_SIZE):
+                batch = list(executor.map(_wrap_user, rows[i:i + MIGRATE_BATCH_SIZE], chunksize=16))
+                # 只在哈希未被修改时更新，服务器运行中也可以安全执行
+                cursor = conn.executemany(
+                    'UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?',
+                    [(new_hash, username, legacy_hash) for username, legacy_hash, new_hash in batch])
+                conn.commit()
+                migrated += cursor.rowcount
+                print(f"  {min(i + MIGRATE_BATCH_SIZE, len(rows))}/{len(rows)}")
+        print(f"Migrated {migrated} password hashes in {time.time() - start:.1f}s")
+        return migrated
+    finally:
+        conn.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="更新测试用户密码或迁移旧的密码哈希")
+    parser.add_argument("--migrate", action="store_true",
+                        help="把所有旧的 sha256 密码哈希迁移为 scrypt")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="迁移使用的进程数（默认: CPU 核数）")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_legacy_hashes(args.workers)
+        return
+
     print("Updating user passwords...")
     for username, password in users.items():
         update_password(username, password)
     print("Done!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()